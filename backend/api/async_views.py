@@ -0,0 +1,283 @@
+"""Асинхронные представления для самых нагруженных эндпоинтов чтения.
+
+Подключаются только при запуске через ASGI (settings.ASYNC_READ_VIEWS).
+Асинхронный путь обслуживает типичные GET-запросы без обращения к
+DRF; всё остальное (запись, поиск, сортировка, ошибки) передаётся в
+исходные синхронные представления, поэтому ответы совпадают.
+
+Загрузка изображений (рецепт, аватар) сюда не входит и остаётся в
+синхронных представлениях. Тело запроса ASGI-обработчик Django читает
+асинхронно ещё до вызова представления, так что медленный клиент поток
+не занимает. Декодирование base64 и проверка картинки — работа для
+процессора, и в цикле событий она задерживала бы остальные соединения.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import (
+    HttpResponse, HttpResponseNotModified, HttpResponseRedirect
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from foodgram_backend.constants import ID_MAX
+from foodgram_backend.ratelimit import rate_limiter
+from foodgram_backend.response_cache import aresponse_key
+from recipes.models import Ingredient, Recipe
+
+from .conditional import list_etag, not_modified, recipe_etag, with_etag
+from .renderers import ORJSONRenderer
+from .throttling import client_ident, list_cost
+from .representations import (
+    build_recipes, ingredient_rows, media_prefix, recipe_rows
+)
+from .views import (
+    IngredientViewSet, RecipeViewSet, UserPagination, short_url_redirect
+)
+
+RECIPE_LIST_PARAMS = {
+    'page', 'limit', 'author', 'is_favorited', 'is_in_shopping_cart'
+}
+# Значения, которые BooleanWidget django-filter понимает; с остальными
+# запрос уходит в синхронное представление.
+BOOLEAN_VALUES = {'1': True, '0': False, 'true': True, 'false': False}
+
+recipe_list_fallback = RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'}
+)
+recipe_detail_fallback = RecipeViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+    'delete': 'destroy'
+})
+ingredient_list_fallback = IngredientViewSet.as_view({'get': 'list'})
+
+
+class Fallback(Exception):
+    """Запрос должен обработать синхронный DRF-view."""
+
+
+def json_response(data):
+    """Рендерит ответ тем же рендерером, что и DRF-представления."""
+    return HttpResponse(
+        ORJSONRenderer().render(data), content_type='application/json'
+    )
+
+
+def entry_response(request, etag, data):
+    """Ответ по ETag и данным; 304 при совпадении If-None-Match."""
+    if etag is None:
+        return json_response(data)
+    if not_modified(request, etag):
+        return with_etag(HttpResponseNotModified(), etag)
+    return with_etag(json_response(data), etag)
+
+
+async def cache_lookup(request):
+    """Ключ кэша ответов и запись по нему; (None, None) для личных."""
+    key = await aresponse_key(request)
+    if key is None:
+        return None, None
+    return key, await cache.aget(key)
+
+
+async def cache_store(key, etag, data):
+    """Сохраняет данные общего ответа в кэш."""
+    if key is not None:
+        await cache.aset(key, (etag, data), settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def with_fallback(sync_view):
+    """Передаёт в sync_view всё, что асинхронный путь не обрабатывает."""
+    fallback = sync_to_async(sync_view)
+
+    def decorator(async_view):
+        async def view(request, *args, **kwargs):
+            if request.method == 'GET':
+                try:
+                    return await async_view(request, *args, **kwargs)
+                except Fallback:
+                    pass
+            return await fallback(request, *args, **kwargs)
+        view.csrf_exempt = True
+        # Пакетный эндпоинт вызывает синхронную версию напрямую.
+        view.sync_view = sync_view
+        return view
+    return decorator
+
+
+async def get_user(request):
+    """Аутентифицирует запрос по токену; None для анонима."""
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not header:
+        return None
+    keyword, _, key = header.partition(' ')
+    if keyword != 'Token' or not key:
+        raise Fallback
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        raise Fallback
+    if not token.user.is_active:
+        raise Fallback
+    return token.user
+
+
+async def fetch_recipes(request, rows):
+    """Асинхронно дочитывает ингредиенты к строкам и собирает ответ."""
+    ingredients = [
+        item async for item in ingredient_rows([row['id'] for row in rows])
+    ]
+    return build_recipes(media_prefix(request), rows, ingredients)
+
+
+def boolean_param(params, name):
+    """Значение флага фильтра; Fallback для непонятного значения."""
+    if name not in params:
+        return False
+    value = BOOLEAN_VALUES.get(params[name].lower())
+    if value is None:
+        raise Fallback
+    return value
+
+
+def throttle_list(request, user, page_size):
+    """Забирает токены списка; Fallback, чтобы DRF ответил 429.
+
+    Вызывается, только когда ответ точно даст асинхронный путь: иначе
+    синхронное представление взяло бы токены второй раз.
+    """
+    if rate_limiter.consume(
+        'list', client_ident(request, user),
+        list_cost(page_size, UserPagination.page_size)
+    ):
+        # Отказ токенов не забирает, и повторная проверка в DRF-
+        # представлении даст тот же ответ 429 с Retry-After.
+        raise Fallback
+
+
+def positive_int(value, default, maximum):
+    """Повторяет разбор limit в PageNumberPagination."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(value, maximum) if value > 0 else default
+
+
+@with_fallback(recipe_list_fallback)
+async def recipe_list(request):
+    """Список рецептов с фильтрами по автору, избранному и корзине."""
+    params = request.GET
+    if not set(params) <= RECIPE_LIST_PARAMS:
+        raise Fallback
+    user = await get_user(request)
+    queryset = Recipe.objects.order_by('-pub_date')
+    authors = [
+        part for value in params.getlist('author') for part in value.split(',')
+    ]
+    if authors and authors != ['']:
+        if not all(
+            part.isdigit() and 0 < int(part) <= ID_MAX for part in authors
+        ):
+            raise Fallback
+        queryset = queryset.filter(author_id__in=map(int, authors))
+    queryset = recipe_rows(queryset, user)
+    is_favorited = boolean_param(params, 'is_favorited')
+    is_in_shopping_cart = boolean_param(params, 'is_in_shopping_cart')
+    if user is not None:
+        if is_favorited:
+            queryset = queryset.filter(is_favorited=True)
+        if is_in_shopping_cart:
+            queryset = queryset.filter(is_in_shopping_cart=True)
+
+    page_size = positive_int(
+        params.get('limit'), UserPagination.page_size,
+        UserPagination.max_page_size
+    )
+    page_number = params.get('page', '1')
+    if not page_number.isdigit() or int(page_number) < 1:
+        raise Fallback
+    page_number = int(page_number)
+    key, entry = await cache_lookup(request)
+    if entry is not None:
+        throttle_list(request, user, page_size)
+        return entry_response(request, *entry)
+    count = await queryset.acount()
+    if page_number > 1 and (page_number - 1) * page_size >= count:
+        # 404 отдаст синхронное представление, оно же возьмёт токены.
+        raise Fallback
+    throttle_list(request, user, page_size)
+    offset = (page_number - 1) * page_size
+    rows = [row async for row in queryset[offset:offset + page_size]]
+    etag = list_etag('recipes', rows, count, recipe_etag)
+    if key is None and not_modified(request, etag):
+        return with_etag(HttpResponseNotModified(), etag)
+    results = await fetch_recipes(request, rows)
+
+    url = request.build_absolute_uri()
+    next_url = None
+    if offset + page_size < count:
+        next_url = replace_query_param(url, 'page', page_number + 1)
+    previous_url = None
+    if page_number == 2:
+        previous_url = remove_query_param(url, 'page')
+    elif page_number > 2:
+        previous_url = replace_query_param(url, 'page', page_number - 1)
+    data = {
+        'count': count,
+        'next': next_url,
+        'previous': previous_url,
+        'results': results,
+    }
+    await cache_store(key, etag, data)
+    return entry_response(request, etag, data)
+
+
+@with_fallback(recipe_detail_fallback)
+async def recipe_detail(request, pk):
+    """Один рецепт."""
+    if request.GET:
+        # fields и expand разбирает синхронное представление.
+        raise Fallback
+    user = await get_user(request)
+    key, entry = await cache_lookup(request)
+    if entry is not None:
+        return entry_response(request, *entry)
+    rows = [
+        row async for row in recipe_rows(Recipe.objects.filter(pk=pk), user)
+    ]
+    if not rows:
+        raise Fallback
+    etag = recipe_etag(rows[0])
+    if key is None and not_modified(request, etag):
+        return with_etag(HttpResponseNotModified(), etag)
+    data = (await fetch_recipes(request, rows))[0]
+    await cache_store(key, etag, data)
+    return entry_response(request, etag, data)
+
+
+@with_fallback(ingredient_list_fallback)
+async def ingredient_list(request):
+    """Поиск ингредиентов по началу названия."""
+    key, entry = await cache_lookup(request)
+    if entry is not None:
+        return entry_response(request, *entry)
+    queryset = Ingredient.objects.all()
+    name = request.GET.get('name')
+    if name:
+        queryset = queryset.filter(name__istartswith=name)
+    data = [
+        ingredient async for ingredient in queryset.values(
+            'id', 'name', 'measurement_unit'
+        )
+    ]
+    await cache_store(key, None, data)
+    return json_response(data)
+
+
+@with_fallback(short_url_redirect)
+async def short_link_redirect(request, recipe_pk):
+    """Редирект с короткой ссылки на страницу рецепта."""
+    if not await Recipe.objects.filter(pk=recipe_pk).aexists():
+        raise Fallback
+    return HttpResponseRedirect(f'/recipes/{recipe_pk}/')
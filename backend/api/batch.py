@@ -0,0 +1,173 @@
+"""Пакетное выполнение запросов к API за один HTTP-запрос.
+
+Клиент присылает список запросов к маршрутам api/urls.py, они выполняются
+по порядку теми же представлениями, а ответы возвращаются списком в том
+же порядке. Пакет аутентифицируется один раз: вложенные запросы получают
+уже найденного пользователя и токен и не ищут их в базе заново.
+Асинхронные представления заменяются своими синхронными версиями, ответы
+которых совпадают. Реплика или основная база выбирается для каждого
+вложенного запроса по его методу, а не по POST самого пакета.
+
+Пакет стоит столько токенов ограничения 'batch', сколько в нём вложенных
+запросов, а вложенные запросы к ограниченным маршрутам дополнительно
+платят по их собственным правилам, как отдельные запросы.
+"""
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.handlers.exception import convert_exception_to_response
+from django.http import HttpRequest, HttpResponse, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import serializers, status
+from rest_framework.decorators import (
+    api_view, permission_classes, throttle_classes
+)
+from rest_framework.permissions import AllowAny
+
+from foodgram_backend.constants import BATCH_REQUESTS_MAX
+from foodgram_backend.db_router import sub_request_routing
+from .renderers import ORJSONRenderer
+from .throttling import BatchThrottle
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Заголовки, которые можно передать вложенному запросу.
+REQUEST_HEADERS = {'if-none-match': 'HTTP_IF_NONE_MATCH',
+                   'if-match': 'HTTP_IF_MATCH'}
+# Заголовки вложенного ответа, которые попадают в пакет.
+RESPONSE_HEADERS = ('ETag', 'Location', 'Retry-After')
+# Заголовки пакета, которые не относятся к вложенным запросам.
+OUTER_HEADERS = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_ACCEPT',
+                 'HTTP_ACCEPT_ENCODING', *REQUEST_HEADERS.values())
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """Один запрос пакета."""
+
+    method = serializers.ChoiceField(choices=METHODS, default='GET')
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+    headers = serializers.DictField(
+        child=serializers.CharField(), required=False
+    )
+
+    def validate_path(self, value):
+        """Путь внутри API."""
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError(
+                'Путь должен начинаться с /api/.'
+            )
+        return value
+
+    def validate_headers(self, value):
+        """Только заголовки условных запросов."""
+        unknown = {name.lower() for name in value} - REQUEST_HEADERS.keys()
+        if unknown:
+            raise serializers.ValidationError(
+                f'Недопустимые заголовки: {", ".join(sorted(unknown))}.'
+            )
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Пакет запросов."""
+
+    requests = SubRequestSerializer(
+        many=True, allow_empty=False, max_length=BATCH_REQUESTS_MAX
+    )
+
+
+def sub_request(request, item):
+    """HttpRequest вложенного запроса с пользователем пакета."""
+    outer = request._request
+    parts = urlsplit(item['path'])
+    body = (
+        ORJSONRenderer().render(item['body']) if 'body' in item else b''
+    )
+    sub = HttpRequest()
+    sub.method = item['method']
+    sub.path = sub.path_info = parts.path
+    sub.META = {
+        key: value for key, value in outer.META.items()
+        if key not in OUTER_HEADERS
+    }
+    sub.META.update({
+        'REQUEST_METHOD': item['method'],
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'HTTP_ACCEPT': 'application/json',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+    })
+    for name, value in item.get('headers', {}).items():
+        sub.META[REQUEST_HEADERS[name.lower()]] = value
+    sub.GET = QueryDict(parts.query)
+    sub.COOKIES = outer.COOKIES
+    sub._stream = BytesIO(body)
+    sub._read_started = False
+    sub.user = request.user
+    if request.user.is_authenticated:
+        # DRF подставит ForcedAuthentication вместо повторного поиска
+        # токена. Анониму оставлены обычные аутентификаторы: без токена
+        # они не обращаются к базе, а 401 остаётся 401.
+        sub._force_auth_user = request.user
+        sub._force_auth_token = request.auth
+    return sub
+
+
+def dispatch(request, item):
+    """Выполняет вложенный запрос; (код, заголовки, тело в JSON)."""
+    renderer = ORJSONRenderer()
+    sub = sub_request(request, item)
+    try:
+        match = resolve(sub.path_info)
+    except Resolver404:
+        return status.HTTP_404_NOT_FOUND, {}, None
+    if match.func is batch:
+        return status.HTTP_400_BAD_REQUEST, {}, renderer.render(
+            {'errors': 'Пакеты нельзя вкладывать друг в друга.'}
+        )
+    sub.resolver_match = match
+    view = getattr(match.func, 'sync_view', match.func)
+    with sub_request_routing(sub.method):
+        response = convert_exception_to_response(
+            lambda sub: view(sub, *match.args, **match.kwargs)
+        )(sub)
+    if response.streaming:
+        response.close()
+        return status.HTTP_400_BAD_REQUEST, {}, renderer.render(
+            {'errors': 'Потоковые ответы не отдаются в пакете.'}
+        )
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    headers = {
+        name: response[name] for name in RESPONSE_HEADERS
+        if response.has_header(name)
+    }
+    if not response.content:
+        return response.status_code, headers, None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return response.status_code, headers, response.content
+    return response.status_code, headers, renderer.render(
+        response.content.decode(response.charset, 'replace')
+    )
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@throttle_classes([BatchThrottle])
+def batch(request):
+    """Выполняет запросы пакета по порядку и возвращает их ответы."""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    renderer = ORJSONRenderer()
+    parts = []
+    for item in serializer.validated_data['requests']:
+        code, headers, body = dispatch(request, item)
+        head = renderer.render({'status': code, 'headers': headers})
+        # Тело вложенного ответа уже в JSON и вставляется без повторного
+        # разбора.
+        parts.append(head[:-1] + b',"body":' + (body or b'null') + b'}')
+    return HttpResponse(
+        b'{"responses":[' + b','.join(parts) + b']}',
+        content_type='application/json'
+    )
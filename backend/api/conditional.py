@@ -0,0 +1,144 @@
+"""Условные запросы по версиям рецептов и пользователей.
+
+Сильный ETag объекта складывается из его версии, версии автора и флагов
+текущего пользователя (избранное, корзина, подписка), поэтому меняется
+вместе с любым полем ответа. ETag страницы списка слабый: он выводится из
+максимальной версии на странице, id и версий её строк и общего числа
+объектов. ETag выборки по списку id выводится из ETag её объектов.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from foodgram_backend.response_cache import response_key, response_keys
+from .representations import RECIPE_FLAGS
+
+
+def recipe_etag(row):
+    """Сильный ETag рецепта по строке recipe_rows.
+
+    В строке неполного набора полей может не быть автора и флагов.
+    """
+    flags = ''.join(
+        str(int(row[name])) for name in RECIPE_FLAGS if name in row
+    )
+    return (
+        f'"recipe-{row["id"]}-{row["version"]}-'
+        f'{row.get("author__version", "")}-{flags}"'
+    )
+
+
+def user_etag(row):
+    """Сильный ETag пользователя по строке user_rows."""
+    return (
+        f'"user-{row["id"]}-{row["version"]}-'
+        f'{int(row.get("is_subscribed", False))}"'
+    )
+
+
+def list_etag(kind, rows, count, row_etag):
+    """Слабый ETag страницы списка."""
+    rows = list(rows)
+    digest = hashlib.sha1(str(count).encode())
+    for row in rows:
+        digest.update(row_etag(row).encode())
+    max_version = max((row['version'] for row in rows), default=0)
+    return f'W/"{kind}-{max_version}-{digest.hexdigest()[:16]}"'
+
+
+def ids_etag(kind, etags, missing):
+    """Слабый ETag выборки по списку id: ETag объектов и отсутствующие id."""
+    digest = hashlib.sha1(','.join(map(str, missing)).encode())
+    for etag in etags:
+        digest.update(etag.encode())
+    return f'W/"{kind}-ids-{digest.hexdigest()[:16]}"'
+
+
+def etag_matches(header, etag, weak=True):
+    """Совпадает ли etag с одним из тегов заголовка If-(None-)Match.
+
+    Для If-None-Match используется слабое сравнение, для If-Match —
+    сильное: слабые теги в нём не совпадают ни с чем.
+    """
+    if not header:
+        return False
+    tags = parse_etags(header)
+    if '*' in tags:
+        return True
+    if weak:
+        target = etag.removeprefix('W/')
+        return any(tag.removeprefix('W/') == target for tag in tags)
+    return not etag.startswith('W/') and etag in tags
+
+
+def not_modified(request, etag):
+    """Можно ли ответить 304 на GET с If-None-Match."""
+    return request.method in ('GET', 'HEAD') and etag_matches(
+        request.META.get('HTTP_IF_NONE_MATCH'), etag
+    )
+
+
+def with_etag(response, etag):
+    """Добавляет ETag; ответ зависит от токена пользователя."""
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def conditional_response(request, etag, render):
+    """304 при совпадении If-None-Match, иначе ответ render(); с ETag."""
+    if etag is None:
+        return render()
+    if not_modified(request, etag):
+        return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return with_etag(render(), etag)
+
+
+def cached_response(request, compute):
+    """Ответ с ETag; данные, общие для анонимов, берутся из кэша.
+
+    compute() возвращает ETag (или None) и функцию, которая строит данные
+    ответа. Для личных запросов данные строятся, только если не нужен 304.
+    """
+    key = response_key(request)
+    entry = cache.get(key) if key is not None else None
+    if entry is None:
+        etag, build = compute()
+        if key is None:
+            return conditional_response(
+                request, etag, lambda: Response(build())
+            )
+        entry = (etag, build())
+        cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+    etag, data = entry
+    return conditional_response(request, etag, lambda: Response(data))
+
+
+def cached_entries(request, ids, compute, path=None):
+    """Записи (ETag, данные) объектов по id: {id: запись}.
+
+    compute(ids) строит записи недостающих объектов за один проход. С path
+    записи общих запросов читаются из кэша и пополняют его под ключами
+    отдельных GET по path(id), так что выборка и карточки объектов делят
+    один кэш.
+    """
+    keys = response_keys(request, map(path, ids)) if path else None
+    if keys is None:
+        return compute(ids)
+    keys = dict(zip(ids, keys))
+    cached = cache.get_many(keys.values())
+    entries = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in ids if pk not in entries]
+    if missing:
+        fresh = compute(missing)
+        cache.set_many(
+            {keys[pk]: entry for pk, entry in fresh.items()},
+            settings.RESPONSE_CACHE_TIMEOUT
+        )
+        entries.update(fresh)
+    return entries
@@ -1,12 +1,73 @@
 """Фильтры для рецептов."""
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe
+from django_filters.widgets import BaseCSVWidget
+from rest_framework.exceptions import ValidationError
+
+from foodgram_backend.constants import FILTER_INGREDIENTS_MAX, ID_MAX
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart
+)
+
+
+class NumberListWidget(BaseCSVWidget, forms.TextInput):
+    """Список через запятую или повтором параметра: ?a=1,2 и ?a=1&a=2."""
+
+    def value_from_datadict(self, data, files, name):
+        """Склеивает все значения параметра."""
+        if hasattr(data, 'getlist') and len(data.getlist(name)) > 1:
+            return [
+                part for value in data.getlist(name)
+                for part in value.split(',')
+            ]
+        return super().value_from_datadict(data, files, name)
+
+
+class NumberListFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Фильтр по списку id.
+
+    Значения разбираются как целые: ?ingredients=1.5 — ошибка 400, а не
+    ингредиент 1. id вне диапазона BigAutoField — тоже ошибка 400.
+    """
+
+    field_class = forms.IntegerField
+
+    def __init__(self, *args, **kwargs):
+        """Список разбирается NumberListWidget."""
+        kwargs.setdefault('widget', NumberListWidget)
+        kwargs.setdefault('min_value', 1)
+        kwargs.setdefault('max_value', ID_MAX)
+        super().__init__(*args, **kwargs)
+
+
+def contains_ingredient(ingredient_id):
+    """EXISTS: в рецепте есть ингредиент."""
+    return Exists(RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk'), ingredient_id=ingredient_id
+    ))
 
 
 class RecipeFilter(FilterSet):
-    """Фильтры для рецептов."""
+    """Фильтры для рецептов.
+
+    Все фильтры по связанным таблицам — коррелированные EXISTS: строки
+    рецептов не размножаются, distinct не нужен, и каждое условие
+    проверяется по составному индексу, пока рецепты читаются по индексу
+    сортировки.
+    """
 
-    author = filters.NumberFilter(field_name='author__id')
+    author = NumberListFilter(field_name='author_id', lookup_expr='in')
+    cooking_time_min = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='gte'
+    )
+    cooking_time_max = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='lte'
+    )
+    ingredients = NumberListFilter(method='filter_ingredients')
+    exclude_ingredients = NumberListFilter(
+        method='filter_exclude_ingredients'
+    )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
@@ -16,7 +77,10 @@ class RecipeFilter(FilterSet):
         """Мета-класс для фильтрации рецептов."""
 
         model = Recipe
-        fields = ('author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'cooking_time_min', 'cooking_time_max', 'ingredients',
+            'exclude_ingredients', 'is_favorited', 'is_in_shopping_cart'
+        )
 
     def get_authenticated_user(self):
         """Возвращает аутентифицированного пользователя, если он есть."""
@@ -29,18 +93,45 @@ class RecipeFilter(FilterSet):
             )
         return None
 
+    @staticmethod
+    def ingredient_ids(value):
+        """Уникальные id ингредиентов с ограничением на их число."""
+        ids = set(value)
+        if len(ids) > FILTER_INGREDIENTS_MAX:
+            raise ValidationError({
+                'errors': f'Можно указать не более '
+                          f'{FILTER_INGREDIENTS_MAX} ингредиентов.'
+            })
+        return sorted(ids)
+
+    def filter_ingredients(self, queryset, name, value):
+        """Рецепты, в которых есть все указанные ингредиенты."""
+        for ingredient_id in self.ingredient_ids(value):
+            queryset = queryset.filter(contains_ingredient(ingredient_id))
+        return queryset
+
+    def filter_exclude_ingredients(self, queryset, name, value):
+        """Рецепты без указанных ингредиентов."""
+        return queryset.exclude(Exists(RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk'), ingredient_id__in=self.ingredient_ids(value)
+        )))
+
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрует рецепты по наличию в избранном."""
         user = self.get_authenticated_user()
         if value and user:
-            return queryset.filter(favorites__user=user).distinct()
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """Фильтрует рецепты по наличию в корзине покупок."""
         user = self.get_authenticated_user()
         if value and user:
-            return queryset.filter(shopping_carts__user=user).distinct()
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )))
         return queryset
 
 
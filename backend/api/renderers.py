@@ -0,0 +1,44 @@
+"""Рендереры API."""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+from foodgram_backend.metrics import measure
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же выводом, что и у DRF.
+
+    Без orjson или при запросе отступов работает как обычный JSONRenderer.
+    Даты и значения, которые orjson не знает, кодируются энкодером DRF.
+    """
+
+    options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Рендерит данные в JSON."""
+        if orjson is None or data is None:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        with measure('render'):
+            ret = orjson.dumps(
+                data, default=encoders.JSONEncoder().default,
+                option=self.options
+            )
+        # Как и JSONRenderer, экранируем U+2028 и U+2029 для JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
@@ -0,0 +1,385 @@
+"""Быстрое формирование ответов для чтения без сериализаторов DRF.
+
+Данные берутся строками из .values(), URL файлов собираются из заранее
+вычисленного префикса MEDIA_URL. Результат совпадает с выводом
+RecipeSerializer и UserSerializer.
+
+Параметры fields и expand (Fieldset) сужают не только вывод, но и сам
+запрос: пропущенные поля не выбираются, JOIN с автором, подзапросы
+флагов и запрос ингредиентов выполняются, только если их поля нужны.
+"""
+import hashlib
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Exists, OuterRef, Value
+from django.utils.encoding import filepath_to_uri
+from rest_framework.exceptions import ValidationError
+
+from foodgram_backend.db_router import keep_routing
+from foodgram_backend.metrics import measure
+from recipes.models import Favorite, RecipeIngredient, ShoppingCart
+from users.models import Subscription
+from .renderers import ORJSONRenderer
+
+USER_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name',
+               'avatar', 'version')
+RECIPE_FIELDS = (
+    'id', 'name', 'image', 'text', 'cooking_time', 'version', 'author_id',
+    'author__email', 'author__username', 'author__first_name',
+    'author__last_name', 'author__avatar', 'author__version',
+)
+RECIPE_FLAGS = ('is_favorited', 'is_in_shopping_cart', 'is_subscribed')
+AUTHOR_FIELDS = (
+    'author__email', 'author__username', 'author__first_name',
+    'author__last_name', 'author__avatar', 'author__version',
+)
+RECIPE_COLUMNS = ('name', 'image', 'text', 'cooking_time')
+RECIPE_OUTPUT = (
+    'id', 'author', 'name', 'image', 'text', 'ingredients', 'cooking_time',
+    'is_favorited', 'is_in_shopping_cart',
+)
+RECIPE_EXPANDABLE = ('author', 'ingredients')
+USER_OUTPUT = (
+    'email', 'id', 'username', 'first_name', 'last_name', 'is_subscribed',
+    'avatar',
+)
+
+
+def split_param(value):
+    """'a,b' -> ['a', 'b']."""
+    return [part for part in value.split(',') if part]
+
+
+class Fieldset:
+    """Поля ответа по параметрам fields и expand.
+
+    Без fields отдаются все поля с вложенными объектами, как раньше. С
+    fields — только перечисленные и id; вложенные объекты (автор,
+    ингредиенты) без expand сворачиваются до id.
+    """
+
+    def __init__(self, output, expandable=(), fields=None, expand=()):
+        """Поля в порядке вывода."""
+        self.full = fields is None
+        self.fields = output if fields is None else tuple(
+            name for name in output if name == 'id' or name in fields
+        )
+        self.expanded = set(expandable) if fields is None else set(expand)
+
+    @classmethod
+    def from_request(cls, request, output, expandable=()):
+        """Поля из параметров запроса; неизвестные — ошибка 400."""
+        params = request.GET
+        fields = (
+            split_param(params['fields']) if 'fields' in params else None
+        )
+        expand = split_param(params.get('expand', ''))
+        unknown = (
+            set(fields or ()) - set(output) | set(expand) - set(expandable)
+        )
+        if unknown:
+            raise ValidationError({
+                'errors': f'Неизвестные поля: {", ".join(sorted(unknown))}.'
+            })
+        return cls(output, expandable, fields, expand)
+
+    def __contains__(self, name):
+        """Нужно ли поле в ответе."""
+        return name in self.fields
+
+    def expands(self, name):
+        """Нужен ли вложенный объект целиком."""
+        return name in self.fields and name in self.expanded
+
+    def tag(self, etag):
+        """ETag с отпечатком набора полей; для полного ответа — без него."""
+        if self.full:
+            return etag
+        spec = ','.join(self.fields) + ';' + ','.join(
+            sorted(self.expanded & set(self.fields))
+        )
+        digest = hashlib.sha1(spec.encode()).hexdigest()[:8]
+        return f'{etag[:-1]}-{digest}"'
+
+
+FULL_RECIPE = Fieldset(RECIPE_OUTPUT, RECIPE_EXPANDABLE)
+FULL_USER = Fieldset(USER_OUTPUT)
+
+
+def recipe_fields(request):
+    """Поля рецепта по параметрам запроса."""
+    return Fieldset.from_request(request, RECIPE_OUTPUT, RECIPE_EXPANDABLE)
+
+
+def user_fields(request):
+    """Поля пользователя по параметрам запроса."""
+    return Fieldset.from_request(request, USER_OUTPUT)
+
+
+def media_prefix(request):
+    """Абсолютный URL каталога медиафайлов для текущего запроса."""
+    if request is None:
+        return settings.MEDIA_URL
+    return request.build_absolute_uri(settings.MEDIA_URL)
+
+
+def media_url(prefix, name):
+    """URL файла по его имени в хранилище или None."""
+    if not name:
+        return None
+    return prefix + filepath_to_uri(name)
+
+
+def viewer(request):
+    """Аутентифицированный пользователь запроса или None."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    return None
+
+
+def recipe_flags(user, names):
+    """Аннотации флагов текущего пользователя."""
+    if user is None:
+        return {name: Value(False) for name in names}
+    flags = {
+        'is_favorited': Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        'is_in_shopping_cart': Exists(
+            ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        'is_subscribed': Exists(Subscription.objects.filter(
+            user=user, author=OuterRef('author')
+        )),
+    }
+    return {name: flags[name] for name in names}
+
+
+def recipe_rows(queryset, user, fields=FULL_RECIPE):
+    """Строки рецептов с автором и флагами для пользователя."""
+    if fields.full:
+        return queryset.values(
+            *RECIPE_FIELDS, **recipe_flags(user, RECIPE_FLAGS)
+        )
+    columns = ['id', 'version']
+    columns.extend(name for name in RECIPE_COLUMNS if name in fields)
+    flags = [
+        name for name in ('is_favorited', 'is_in_shopping_cart')
+        if name in fields
+    ]
+    if 'author' in fields:
+        columns.append('author_id')
+        if fields.expands('author'):
+            columns.extend(AUTHOR_FIELDS)
+            flags.append('is_subscribed')
+    return queryset.values(*columns, **recipe_flags(user, flags))
+
+
+def ingredient_rows(recipe_ids, expanded=True):
+    """Строки ингредиентов для рецептов в порядке RecipeSerializer.
+
+    Без expanded — только id и количество в порядке id, без JOIN со
+    справочником и с рецептами: Meta.ordering модели раскрылся бы в
+    сортировку по полям связанных таблиц.
+    """
+    queryset = RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+    if not expanded:
+        return queryset.order_by('recipe_id', 'ingredient_id').values(
+            'recipe_id', 'ingredient_id', 'amount'
+        )
+    return queryset.order_by('recipe_id', 'ingredient__name').values(
+        'recipe_id', 'ingredient_id', 'amount', 'ingredient__name',
+        'ingredient__measurement_unit'
+    )
+
+
+def build_user(prefix, row, is_subscribed):
+    """Словарь пользователя как в UserSerializer."""
+    return {
+        'email': row['email'],
+        'id': row['id'],
+        'username': row['username'],
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'is_subscribed': is_subscribed,
+        'avatar': media_url(prefix, row['avatar']),
+    }
+
+
+def build_author(prefix, row):
+    """Автор рецепта как в UserSerializer."""
+    return {
+        'email': row['author__email'],
+        'id': row['author_id'],
+        'username': row['author__username'],
+        'first_name': row['author__first_name'],
+        'last_name': row['author__last_name'],
+        'is_subscribed': row['is_subscribed'],
+        'avatar': media_url(prefix, row['author__avatar']),
+    }
+
+
+def group_ingredients(ingredients):
+    """Ингредиенты по id рецепта."""
+    ingredients_by_recipe = {}
+    for item in ingredients:
+        if 'ingredient__name' in item:
+            entry = {
+                'id': item['ingredient_id'],
+                'name': item['ingredient__name'],
+                'measurement_unit': item['ingredient__measurement_unit'],
+                'amount': item['amount'],
+            }
+        else:
+            entry = {'id': item['ingredient_id'], 'amount': item['amount']}
+        ingredients_by_recipe.setdefault(item['recipe_id'], []).append(entry)
+    return ingredients_by_recipe
+
+
+def build_recipe(prefix, row, ingredients, fields):
+    """Рецепт только с полями из fields."""
+    data = {}
+    for name in fields.fields:
+        if name == 'author':
+            data[name] = (
+                build_author(prefix, row) if fields.expands(name)
+                else row['author_id']
+            )
+        elif name == 'image':
+            data[name] = media_url(prefix, row['image']) or ''
+        elif name == 'ingredients':
+            data[name] = ingredients.get(row['id'], [])
+        else:
+            data[name] = row[name]
+    return data
+
+
+def build_recipes(prefix, rows, ingredients, fields=FULL_RECIPE):
+    """Список словарей рецептов как в RecipeSerializer."""
+    ingredients_by_recipe = group_ingredients(ingredients)
+    if not fields.full:
+        return [
+            build_recipe(prefix, row, ingredients_by_recipe, fields)
+            for row in rows
+        ]
+    return [
+        {
+            'id': row['id'],
+            'author': build_author(prefix, row),
+            'name': row['name'],
+            'image': media_url(prefix, row['image']) or '',
+            'text': row['text'],
+            'ingredients': ingredients_by_recipe.get(row['id'], []),
+            'cooking_time': row['cooking_time'],
+            'is_favorited': row['is_favorited'],
+            'is_in_shopping_cart': row['is_in_shopping_cart'],
+        }
+        for row in rows
+    ]
+
+
+def fetch_ingredients(rows, fields):
+    """Ингредиенты строк, если они нужны в ответе."""
+    if 'ingredients' not in fields:
+        return []
+    return ingredient_rows(
+        [row['id'] for row in rows], fields.expands('ingredients')
+    )
+
+
+def represent_recipes(request, rows, fields=FULL_RECIPE):
+    """Рецепты по уже полученным строкам recipe_rows."""
+    rows = list(rows)
+    ingredients = list(fetch_ingredients(rows, fields))
+    with measure('serialize'):
+        return build_recipes(media_prefix(request), rows, ingredients, fields)
+
+
+def stream_recipes(request, rows, chunk_size, fields=FULL_RECIPE):
+    """JSON-массив рецептов по частям для StreamingHttpResponse.
+
+    Строки читаются серверным курсором, ингредиенты дочитываются и
+    рендерятся отдельно для каждой части: в памяти не больше chunk_size
+    рецептов.
+    """
+    prefix = media_prefix(request)
+    renderer = ORJSONRenderer()
+    rows = rows.iterator(chunk_size=chunk_size)
+    separator = b'['
+    while chunk := list(islice(rows, chunk_size)):
+        body = renderer.render(build_recipes(
+            prefix, chunk, fetch_ingredients(chunk, fields), fields
+        ))
+        # Части склеиваются в один массив без своих скобок.
+        yield separator + body[1:-1]
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
+
+
+async def pull_chunks(chunks):
+    """Асинхронный итератор: части синхронного читаются в потоке.
+
+    Все шаги идут через один поток sync_to_async запроса, поэтому
+    серверный курсор остаётся на своём соединении.
+    """
+    pull = sync_to_async(next)
+    try:
+        while (chunk := await pull(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+def streaming_content(request, chunks):
+    """Тело StreamingHttpResponse с маршрутизацией запроса.
+
+    Под ASGI Django собирает синхронный итератор в список целиком, поэтому
+    там отдаётся асинхронный итератор, который тянет части по одной.
+    """
+    chunks = keep_routing(chunks)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return pull_chunks(chunks)
+    return chunks
+
+
+def user_rows(queryset, user, fields=FULL_USER):
+    """Строки пользователей с флагом подписки."""
+    if fields.full:
+        columns = USER_FIELDS
+    else:
+        columns = ('id', 'version') + tuple(
+            name for name in USER_FIELDS
+            if name in fields and name not in ('id', 'version')
+        )
+    if 'is_subscribed' not in fields:
+        return queryset.values(*columns)
+    if user is None:
+        return queryset.values(*columns, is_subscribed=Value(False))
+    return queryset.values(*columns, is_subscribed=Exists(
+        Subscription.objects.filter(user=user, author=OuterRef('pk'))
+    ))
+
+
+def represent_users(request, rows, fields=FULL_USER):
+    """Пользователи по уже полученным строкам user_rows."""
+    rows = list(rows)
+    with measure('serialize'):
+        prefix = media_prefix(request)
+        if fields.full:
+            return [
+                build_user(prefix, row, row['is_subscribed']) for row in rows
+            ]
+        return [
+            {
+                name: (
+                    media_url(prefix, row[name]) if name == 'avatar'
+                    else row[name]
+                )
+                for name in fields.fields
+            }
+            for row in rows
+        ]
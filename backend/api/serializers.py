@@ -1,8 +1,10 @@
 """Сериализаторы для приложения users."""
 import base64
+import hashlib
 import uuid
 
 from django.core.files.base import ContentFile
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
@@ -10,7 +12,10 @@ from rest_framework import serializers
 from users.models import User, Subscription
 from foodgram_backend import constants
 
+from recipes.changes import record_changes
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (
+    Change,
     Ingredient,
     Recipe,
     RecipeIngredient,
@@ -49,6 +54,29 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+def file_digest(file):
+    """SHA-256 содержимого файла; позиция чтения возвращается в начало."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def same_image(current, uploaded):
+    """Совпадает ли загруженная картинка с уже сохранённой."""
+    if not current:
+        return False
+    try:
+        if current.storage.size(current.name) != uploaded.size:
+            return False
+        with current.storage.open(current.name) as stored:
+            return file_digest(stored) == file_digest(uploaded)
+    except OSError:
+        return False
+
+
 class UserSerializer(DjoserUserSerializer):
     """Сериализатор для модели User."""
 
@@ -257,10 +285,53 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class IngredientPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """Ингредиент по id из заранее загруженного списком словаря."""
+
+    def to_internal_value(self, data):
+        """Ищет ингредиент в словаре списка, иначе запросом к базе."""
+        catalog = getattr(self.parent.parent, 'catalog', None)
+        if catalog is None:
+            return super().to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            ingredient = catalog.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if ingredient is None:
+            self.fail('does_not_exist', pk_value=data)
+        return ingredient
+
+
+class RecipeIngredientListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта, проверяемый одним запросом."""
+
+    def to_internal_value(self, data):
+        """Загружает все ингредиенты списка одним IN-запросом."""
+        ids = set()
+        if isinstance(data, list):
+            for item in data:
+                value = item.get('id') if isinstance(item, dict) else None
+                if isinstance(value, bool):
+                    continue
+                try:
+                    pk = int(value)
+                except (TypeError, ValueError):
+                    continue
+                if 0 < pk <= constants.ID_MAX:
+                    ids.add(pk)
+        self.catalog = Ingredient.objects.in_bulk(ids)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.catalog = None
+
+
 class RecipeCreateIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для создания ингредиентов в рецепте."""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = IngredientPrimaryKeyField(
         queryset=Ingredient.objects.all(), source='ingredient')
     amount = serializers.IntegerField(
         min_value=constants.AMOUNT_INGREDIENTS_MIN,
@@ -272,6 +343,7 @@ class RecipeCreateIngredientSerializer(serializers.ModelSerializer):
 
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = RecipeIngredientListSerializer
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
@@ -369,13 +441,17 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
     def create_ingredients(self, recipe, ingredients_data):
         """Создание ингредиентов в рецепте."""
-        RecipeIngredient.objects.bulk_create([
+        record_changes(RecipeIngredient.objects.bulk_create([
             RecipeIngredient(
                 recipe=recipe,
                 ingredient=item['ingredient'],
                 amount=item['amount']
             ) for item in ingredients_data
-        ])
+        ]), Change.CREATE)
+        ingredient_ids = [item['ingredient'].id for item in ingredients_data]
+        transaction.on_commit(
+            lambda: ingredient_index.set_recipe(recipe.id, ingredient_ids)
+        )
 
     def create(self, validated_data):
         """Создание рецепта."""
@@ -400,16 +476,82 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             })
 
         ingredients_data = validated_data.pop('ingredients', None)
+        image = validated_data.pop('image', None)
+
+        with transaction.atomic():
+            changed = [
+                attr for attr, value in validated_data.items()
+                if getattr(instance, attr) != value
+            ]
+            for attr in changed:
+                setattr(instance, attr, validated_data[attr])
+            if image is not None and not same_image(instance.image, image):
+                self.replace_image(instance, image)
+                changed.append('image')
+            ingredients_changed = (
+                ingredients_data is not None
+                and self.sync_ingredients(instance, ingredients_data)
+            )
+            if changed or ingredients_changed:
+                # Сохранение увеличивает версию рецепта и для ингредиентов.
+                instance.save(update_fields=changed)
+        return instance
 
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
+    def replace_image(self, instance, image):
+        """Сохраняет новую картинку и удаляет старую после коммита."""
+        old_name = instance.image.name
+        storage = instance.image.storage
+        instance.image.save(image.name, image, save=False)
 
-        if ingredients_data is not None:
-            instance.recipeingredients.all().delete()
-            self.create_ingredients(instance, ingredients_data)
+        def delete_old():
+            # Файл мог достаться другим рецептам при импорте.
+            if old_name and not Recipe.objects.filter(image=old_name).exists():
+                storage.delete(old_name)
 
-        instance.save()
-        return instance
+        transaction.on_commit(delete_old)
+
+    def sync_ingredients(self, recipe, ingredients_data):
+        """Приводит ингредиенты рецепта к новым данным по разнице.
+
+        Возвращает True, если ингредиенты изменились.
+        """
+        existing = {
+            item.ingredient_id: item for item in recipe.recipeingredients.all()
+        }
+        amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients_data
+        }
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            recipe.recipeingredients.filter(
+                ingredient_id__in=removed
+            ).delete()
+        updated = []
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                item.amount = amount
+                updated.append(item)
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, ['amount'])
+            record_changes(updated, Change.UPDATE)
+        added = [
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+        if added:
+            record_changes(
+                RecipeIngredient.objects.bulk_create(added), Change.CREATE
+            )
+        if existing.keys() != amounts.keys():
+            ingredient_ids = list(amounts)
+            transaction.on_commit(
+                lambda: ingredient_index.set_recipe(recipe.id, ingredient_ids)
+            )
+        return bool(removed or updated or added)
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -0,0 +1,782 @@
+"""Тесты совпадения быстрого пути чтения с сериализаторами DRF.
+
+Рецепты и пользователи рендерятся двумя путями: через RecipeSerializer и
+UserSerializer и через строки .values() (api.representations), — и
+сравниваются побайтно после ORJSONRenderer. Наборы данных покрывают
+анонима и авторизованного пользователя, файлы с пробелами и кириллицей
+в имени и их отсутствие, рецепт без ингредиентов и все флаги текущего
+пользователя.
+
+Отдельно проверяются совпадение асинхронных представлений с
+синхронными, условные запросы и версии объектов, разбор списков id в
+фильтрах рецептов, порядок журнала изменений, ограничение частоты
+запросов, размер страниц, выгрузка рецептов частями и сжатие ответов.
+"""
+import gzip
+import json
+import tempfile
+from unittest import mock
+
+import brotli
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.changes import sequence_changes
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (
+    Change, Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart
+)
+from users.models import Subscription, User
+
+from foodgram_backend.compression import CompressionMiddleware
+from foodgram_backend.constants import PAGE_SIZE_MAX
+from foodgram_backend.ratelimit import rate_limiter
+
+from . import async_views
+from .renderers import ORJSONRenderer
+from .representations import (
+    ingredient_rows, recipe_rows, represent_recipes, represent_users,
+    user_rows, viewer
+)
+from .serializers import RecipeSerializer, UserSerializer
+
+# Картинка 1x1 в формате, который принимает Base64ImageField.
+PIXEL = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+LOCAL_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+
+def render(data):
+    """JSON так же, как в ответах API."""
+    return ORJSONRenderer().render(data)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class RepresentationTestCase(TestCase):
+    """Данные, на которых сравниваются оба пути."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Авторы, читатель, рецепты с флагами и без ингредиентов."""
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Анна', last_name='Автор', password='pass12345',
+            avatar='users/avatars/аватар 1.png'
+        )
+        cls.other = User.objects.create_user(
+            email='other@example.com', username='other',
+            first_name='Bob', last_name='Other', password='pass12345'
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Reader', last_name='R', password='pass12345'
+        )
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        apple = Ingredient.objects.create(
+            name='яблоко', measurement_unit='шт.'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name='Пирог', text='Испечь "пирог"',
+                image='recipes/images/пирог 1.png', cooking_time=40
+            ),
+            Recipe.objects.create(
+                author=cls.other, name='Без картинки', text='Текст',
+                image='', cooking_time=5
+            ),
+            Recipe.objects.create(
+                author=cls.author, name='Пустой', text='Без ингредиентов',
+                image='recipes/images/empty.png', cooking_time=1
+            ),
+        ]
+        pie, plain, _ = cls.recipes
+        # Ингредиенты добавляются не в алфавитном порядке: сериализатор
+        # сортирует их по названию.
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=pie, ingredient=salt, amount=1),
+            RecipeIngredient(recipe=pie, ingredient=apple, amount=3),
+            RecipeIngredient(recipe=pie, ingredient=flour, amount=200),
+            RecipeIngredient(recipe=plain, ingredient=salt, amount=2),
+        ])
+        Favorite.objects.create(user=cls.reader, recipe=pie)
+        ShoppingCart.objects.create(user=cls.reader, recipe=pie)
+        ShoppingCart.objects.create(user=cls.reader, recipe=plain)
+        Subscription.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        """Пустой кэш ответов для каждого теста."""
+        cache.clear()
+
+    def request(self, user=None, path='/api/recipes/'):
+        """Запрос от имени пользователя или анонима."""
+        request = APIRequestFactory().get(path)
+        request.user = user or AnonymousUser()
+        return request
+
+    def viewers(self):
+        """Аноним, подписчик с флагами и пользователь без флагов."""
+        return (None, self.reader, self.other)
+
+    def client_for(self, user):
+        """Клиент API от имени пользователя или анонима."""
+        client = APIClient()
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+
+class RecipeRepresentationTests(RepresentationTestCase):
+    """represent_recipes совпадает с RecipeSerializer."""
+
+    def serialized(self, request, queryset):
+        """Рецепты через RecipeSerializer."""
+        return render(RecipeSerializer(
+            queryset, many=True, context={'request': request}
+        ).data)
+
+    def represented(self, request, queryset):
+        """Рецепты через строки .values()."""
+        return render(represent_recipes(
+            request, recipe_rows(queryset, viewer(request))
+        ))
+
+    def test_recipes_match_serializer(self):
+        """Все рецепты для каждого зрителя."""
+        queryset = Recipe.objects.order_by('id')
+        for user in self.viewers():
+            with self.subTest(user=user):
+                request = self.request(user)
+                self.assertEqual(
+                    self.represented(request, queryset),
+                    self.serialized(request, queryset)
+                )
+
+    def test_single_recipes_match_serializer(self):
+        """Каждый рецепт отдельно, в том числе без ингредиентов."""
+        for user in self.viewers():
+            for recipe in self.recipes:
+                with self.subTest(user=user, recipe=recipe.name):
+                    request = self.request(user)
+                    queryset = Recipe.objects.filter(pk=recipe.pk)
+                    self.assertEqual(
+                        self.represented(request, queryset),
+                        self.serialized(request, queryset)
+                    )
+
+    def test_flags_are_set_for_reader(self):
+        """Проверка не сводится к сравнению одних False."""
+        data = represent_recipes(
+            self.request(self.reader),
+            recipe_rows(
+                Recipe.objects.filter(pk=self.recipes[0].pk), self.reader
+            )
+        )[0]
+        self.assertTrue(data['is_favorited'])
+        self.assertTrue(data['is_in_shopping_cart'])
+        self.assertTrue(data['author']['is_subscribed'])
+        self.assertEqual(
+            [item['name'] for item in data['ingredients']],
+            ['мука', 'соль', 'яблоко']
+        )
+
+    def test_unexpanded_ingredients_skip_joins(self):
+        """Ингредиенты без expand читаются из одной таблицы."""
+        recipe_ids = [recipe.pk for recipe in self.recipes]
+        self.assertNotIn(
+            'JOIN', str(ingredient_rows(recipe_ids, expanded=False).query)
+        )
+        self.assertEqual(
+            [
+                row['ingredient_id']
+                for row in ingredient_rows([self.recipes[0].pk])
+            ],
+            list(Ingredient.objects.filter(
+                recipeingredients__recipe=self.recipes[0]
+            ).order_by('name').values_list('pk', flat=True))
+        )
+
+
+class UserRepresentationTests(RepresentationTestCase):
+    """represent_users совпадает с UserSerializer."""
+
+    def test_users_match_serializer(self):
+        """Пользователи с аватаром и без, с подпиской и без."""
+        queryset = User.objects.order_by('id')
+        for user in self.viewers():
+            with self.subTest(user=user):
+                request = self.request(user, '/api/users/')
+                self.assertEqual(
+                    render(represent_users(
+                        request, user_rows(queryset, viewer(request))
+                    )),
+                    render(UserSerializer(
+                        queryset, many=True, context={'request': request}
+                    ).data)
+                )
+
+
+class EndpointTests(RepresentationTestCase):
+    """Ответы эндпоинтов совпадают с выводом сериализаторов."""
+
+    def page(self, results):
+        """Первая и единственная страница списка."""
+        return {
+            'count': len(results),
+            'next': None,
+            'previous': None,
+            'results': results,
+        }
+
+    def test_recipe_endpoints(self):
+        """Список, карточка, выборка по id и выгрузка рецептов."""
+        queryset = Recipe.objects.order_by('-pub_date')
+        ids = ','.join(str(recipe.pk) for recipe in queryset)
+        for user in self.viewers():
+            with self.subTest(user=user):
+                client = self.client_for(user)
+                request = self.request(user)
+                recipes = RecipeSerializer(
+                    queryset, many=True, context={'request': request}
+                ).data
+                self.assertEqual(
+                    client.get('/api/recipes/').content,
+                    render(self.page(recipes))
+                )
+                self.assertEqual(
+                    client.get(f'/api/recipes/?ids={ids}').content,
+                    render({'results': recipes, 'missing': []})
+                )
+                for recipe in recipes:
+                    self.assertEqual(
+                        client.get(f'/api/recipes/{recipe["id"]}/').content,
+                        render(recipe)
+                    )
+                if user is not None:
+                    response = client.get('/api/recipes/stream/')
+                    self.assertEqual(
+                        b''.join(response.streaming_content),
+                        render(RecipeSerializer(
+                            queryset.order_by('pk'), many=True,
+                            context={'request': request}
+                        ).data)
+                    )
+
+    def test_user_endpoints(self):
+        """Список и карточка пользователя."""
+        queryset = User.objects.order_by('username')
+        for user in self.viewers():
+            with self.subTest(user=user):
+                client = self.client_for(user)
+                users = UserSerializer(
+                    queryset, many=True,
+                    context={'request': self.request(user, '/api/users/')}
+                ).data
+                self.assertEqual(
+                    client.get('/api/users/').content,
+                    render(self.page(users))
+                )
+                for data in users:
+                    self.assertEqual(
+                        client.get(f'/api/users/{data["id"]}/').content,
+                        render(data)
+                    )
+
+
+class AsyncViewTests(RepresentationTestCase):
+    """Асинхронные представления отвечают так же, как синхронные."""
+
+    def call(self, view, user, path, *args):
+        """Ответ асинхронного представления на GET от пользователя."""
+        headers = {}
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            headers['Authorization'] = f'Token {token.key}'
+        request = AsyncRequestFactory().get(path, headers=headers)
+        response = async_to_sync(view)(request, *args)
+        # Ответ синхронного представления рендерит обработчик запросов.
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def assertSameResponse(self, view, user, path, *args):
+        """Код и тело ответа совпадают на обоих путях."""
+        # Кэш ответов общий для путей: каждый читает базу сам.
+        cache.clear()
+        expected = self.client_for(user).get(path)
+        cache.clear()
+        response = self.call(view, user, path, *args)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+
+    def test_recipe_list(self):
+        """Страницы и фильтры, включая непонятные значения флагов."""
+        queries = (
+            '', '?limit=1&page=2', '?page=9', f'?author={self.author.pk}',
+            '?is_favorited=1', '?is_favorited=TRUE', '?is_favorited=yes',
+            '?is_in_shopping_cart=true&is_favorited=0',
+            '?is_in_shopping_cart=on', '?author=0',
+            f'?author={1 << 63}',
+        )
+        for user in self.viewers():
+            for query in queries:
+                with self.subTest(user=user, query=query):
+                    self.assertSameResponse(
+                        async_views.recipe_list, user,
+                        f'/api/recipes/{query}'
+                    )
+
+    def test_recipe_detail_and_ingredients(self):
+        """Карточка рецепта и поиск ингредиентов."""
+        for user in self.viewers():
+            for recipe in self.recipes:
+                with self.subTest(user=user, recipe=recipe.pk):
+                    self.assertSameResponse(
+                        async_views.recipe_detail, user,
+                        f'/api/recipes/{recipe.pk}/', recipe.pk
+                    )
+        for query in ('', '?name=М'):
+            with self.subTest(query=query):
+                self.assertSameResponse(
+                    async_views.ingredient_list, None,
+                    f'/api/ingredients/{query}'
+                )
+
+    @override_settings(
+        RATE_LIMIT_BACKEND='local', RATE_LIMITS={'list': '2/min'}
+    )
+    def test_fallback_is_charged_once(self):
+        """Страница за концом списка берёт токены один раз."""
+        rate_limiter.store = None
+        rate_limiter.rates.clear()
+        self.addCleanup(rate_limiter.rates.clear)
+        self.addCleanup(setattr, rate_limiter, 'store', None)
+        statuses = [
+            self.call(async_views.recipe_list, None, path).status_code
+            for path in (
+                '/api/recipes/?page=9', '/api/recipes/', '/api/recipes/'
+            )
+        ]
+        self.assertEqual(statuses, [404, 200, 429])
+
+
+class PantryTests(RepresentationTestCase):
+    """Подбор рецептов по ингредиентам."""
+
+    def setUp(self):
+        """Индекс строится по данным теста."""
+        super().setUp()
+        ingredient_index.invalidate()
+        self.salt = Ingredient.objects.get(name='соль')
+
+    def ranked(self):
+        """id, matched и missing рецептов, найденных по соли."""
+        response = self.client_for(None).get(
+            f'/api/recipes/pantry/?ingredients={self.salt.pk}'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (data['id'], data['matched'], data['missing'])
+            for data in response.json()['results']
+        ]
+
+    def test_ranked_with_counts(self):
+        """Полностью покрытый рецепт выше, у пирога не хватает двух."""
+        pie, plain, _ = self.recipes
+        self.assertEqual(self.ranked(), [(plain.pk, 1, 0), (pie.pk, 1, 2)])
+
+    def test_deleted_recipe_leaves_index(self):
+        """Удалённый через API рецепт пропадает из подбора."""
+        pie, plain, _ = self.recipes
+        self.ranked()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.other).delete(
+                f'/api/recipes/{plain.pk}/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.ranked(), [(pie.pk, 1, 2)])
+
+
+class ConditionalRequestTests(RepresentationTestCase):
+    """ETag, If-None-Match, If-Match и версии объектов."""
+
+    def test_matching_if_none_match_returns_304(self):
+        """Повтор запроса с полученным ETag — 304 без тела."""
+        pie = self.recipes[0]
+        paths = (
+            '/api/recipes/', f'/api/recipes/{pie.pk}/', '/api/users/',
+            f'/api/users/{self.author.pk}/',
+        )
+        for user in (None, self.reader):
+            client = self.client_for(user)
+            for path in paths:
+                with self.subTest(user=user, path=path):
+                    etag = client.get(path)['ETag']
+                    response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 304)
+                    self.assertEqual(response.content, b'')
+                    self.assertEqual(response['ETag'], etag)
+
+    def test_changed_object_returns_200(self):
+        """После изменения автора старый ETag рецепта не совпадает."""
+        client = self.client_for(self.reader)
+        path = f'/api/recipes/{self.recipes[0].pk}/'
+        etag = client.get(path)['ETag']
+        self.author.first_name = 'Анна-Мария'
+        self.author.save(update_fields=['first_name'])
+        cache.clear()
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_stale_if_match_returns_412(self):
+        """Запись с устаревшим If-Match отклоняется, с текущим — проходит."""
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        pie = self.recipes[0]
+        client = self.client_for(self.author)
+        path = f'/api/recipes/{pie.pk}/'
+        stale = client.get(path)['ETag']
+        Recipe.objects.get(pk=pie.pk).save()
+        data = {
+            'name': 'Пирог', 'text': 'Испечь', 'cooking_time': 45,
+            'image': PIXEL, 'ingredients': [
+                {'id': Ingredient.objects.get(name='мука').pk, 'amount': 1}
+            ],
+        }
+        response = client.patch(
+            path, data, format='json', HTTP_IF_MATCH=stale
+        )
+        self.assertEqual(response.status_code, 412)
+        self.assertIn('errors', response.json())
+        self.assertEqual(Recipe.objects.get(pk=pie.pk).cooking_time, 40)
+        with override_settings(MEDIA_ROOT=media.name):
+            response = client.patch(
+                path, data, format='json', HTTP_IF_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cooking_time'], 45)
+        self.assertNotEqual(response['ETag'], stale)
+
+    def test_save_bumps_version(self):
+        """Сохранение рецепта и профиля увеличивает версию."""
+        pie = Recipe.objects.get(pk=self.recipes[0].pk)
+        pie.save()
+        pie.save(update_fields=['name'])
+        pie.refresh_from_db()
+        self.assertEqual(pie.version, 3)
+        user = User.objects.get(pk=self.other.pk)
+        user.save(update_fields=['last_login'])
+        user.refresh_from_db()
+        self.assertEqual(user.version, 1)
+        user.save(update_fields=['first_name'])
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(user.version, 3)
+
+
+class BatchTests(RepresentationTestCase):
+    """Пакетные запросы: ответы и ограничение частоты."""
+
+    def setUp(self):
+        """Новое хранилище лимитов для каждого теста."""
+        super().setUp()
+        rate_limiter.store = None
+        rate_limiter.rates.clear()
+        self.addCleanup(rate_limiter.rates.clear)
+        self.addCleanup(setattr, rate_limiter, 'store', None)
+
+    def batch(self, paths):
+        """POST /api/batch/ с GET-запросами к paths от читателя."""
+        return self.client_for(self.reader).post('/api/batch/', {
+            'requests': [{'path': path} for path in paths]
+        }, format='json')
+
+    def test_sub_responses_match_endpoints(self):
+        """Тела вложенных ответов совпадают с отдельными запросами."""
+        client = self.client_for(self.reader)
+        paths = [
+            f'/api/recipes/{self.recipes[0].pk}/',
+            f'/api/users/{self.author.pk}/', '/api/recipes/0/',
+        ]
+        responses = self.batch(paths).json()['responses']
+        for path, sub in zip(paths, responses):
+            with self.subTest(path=path):
+                response = client.get(path)
+                self.assertEqual(sub['status'], response.status_code)
+                if response.status_code == 200:
+                    self.assertEqual(sub['body'], response.json())
+                    self.assertEqual(sub['headers']['ETag'], response['ETag'])
+
+    @override_settings(RATE_LIMITS={'batch': '5/min', 'list': '100/min'})
+    def test_batch_is_charged_per_sub_request(self):
+        """Пакет стоит столько токенов, сколько в нём запросов."""
+        paths = [f'/api/recipes/{self.recipes[0].pk}/'] * 3
+        self.assertEqual(self.batch(paths).status_code, 200)
+        response = self.batch(paths)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.batch(paths[:2]).status_code, 200)
+
+    @override_settings(RATE_LIMITS={'batch': '100/min', 'list': '2/min'})
+    def test_sub_requests_pay_their_own_scope(self):
+        """Вложенные запросы к спискам расходуют ограничение списков."""
+        response = self.batch(['/api/recipes/'] * 4)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [sub['status'] for sub in response.json()['responses']],
+            [200, 200, 429, 429]
+        )
+
+
+class RecipeFilterTests(RepresentationTestCase):
+    """Списки id в фильтрах рецептов."""
+
+    def test_fractional_ids_are_rejected(self):
+        """Дробный id — ошибка 400, а не усечённое целое."""
+        client = APIClient()
+        for query in (
+            'ingredients=1.5', 'exclude_ingredients=1,2.5', 'author=1.5'
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    client.get(f'/api/recipes/?{query}').status_code, 400
+                )
+
+    def test_ids_out_of_range_are_rejected(self):
+        """id вне диапазона BigAutoField — ошибка 400, а не 500."""
+        client = APIClient()
+        for query in (
+            f'ids={1 << 63}', 'ids=0', f'author={1 << 63}',
+            f'ingredients=1,{1 << 63}', f'exclude_ingredients=-{1 << 63}',
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    client.get(f'/api/recipes/?{query}').status_code, 400
+                )
+        response = client.get(f'/api/recipes/?ids={(1 << 63) - 1}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['missing'], [(1 << 63) - 1])
+
+    def test_ingredients_filter(self):
+        """Рецепты со всеми указанными ингредиентами."""
+        pie, plain, _ = self.recipes
+        salt = Ingredient.objects.get(name='соль')
+        flour = Ingredient.objects.get(name='мука')
+        client = APIClient()
+        for ids, expected in (
+            ([salt.pk], {pie.pk, plain.pk}),
+            ([salt.pk, flour.pk], {pie.pk}),
+        ):
+            with self.subTest(ids=ids):
+                response = client.get(
+                    '/api/recipes/',
+                    {'ingredients': ','.join(map(str, ids))}
+                )
+                self.assertEqual(
+                    {recipe['id'] for recipe in response.json()['results']},
+                    expected
+                )
+
+
+class ChangeFeedTests(RepresentationTestCase):
+    """Курсор журнала изменений идёт в порядке фиксации транзакций."""
+
+    def feed(self, since):
+        """Страница журнала после курсора от имени читателя."""
+        return self.client_for(self.reader).get(
+            '/api/changes/', {'since': since}
+        ).json()
+
+    def test_changes_are_numbered_on_commit(self):
+        """Запись появляется в журнале после фиксации транзакции."""
+        sequence_changes()
+        cursor = self.feed(0)['cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.reader, recipe=self.recipes[1])
+        page = self.feed(cursor)
+        self.assertEqual(
+            [(item['model'], item['action']) for item in page['results']],
+            [('favorite', 'create')]
+        )
+        self.assertGreater(page['cursor'], cursor)
+
+    def test_late_commit_is_not_behind_cursor(self):
+        """Транзакция с меньшим id, зафиксированная позже, не теряется."""
+        sequence_changes()
+        late = Change.objects.order_by('pk').first()
+        late_id = late.pk
+        late.delete()
+        cursor = self.feed(0)['cursor']
+        # Запись с меньшим id стала видна после того, как клиент получил
+        # курсор.
+        Change.objects.create(
+            pk=late_id, model='recipe', action=Change.UPDATE,
+            object_id=self.recipes[0].pk
+        )
+        sequence_changes()
+        page = self.feed(cursor)
+        self.assertEqual([item['id'] for item in page['results']], [late_id])
+        self.assertGreater(page['cursor'], cursor)
+
+
+@override_settings(RATE_LIMIT_BACKEND='local', RATE_LIMITS={'list': '2/min'})
+class ThrottleTests(RepresentationTestCase):
+    """Token bucket на эндпоинтах списков."""
+
+    def setUp(self):
+        """Новое хранилище и лимиты из настроек теста."""
+        super().setUp()
+        rate_limiter.store = None
+        rate_limiter.rates.clear()
+        self.addCleanup(rate_limiter.rates.clear)
+        self.addCleanup(setattr, rate_limiter, 'store', None)
+
+    def get(self, forwarded_for, remote_addr='172.18.0.2'):
+        """Анонимный запрос списка рецептов через прокси."""
+        return APIClient().get(
+            '/api/recipes/', HTTP_X_FORWARDED_FOR=forwarded_for,
+            REMOTE_ADDR=remote_addr
+        )
+
+    def test_limit_returns_429_with_retry_after(self):
+        """Сверх лимита — 429 и Retry-After."""
+        for _ in range(2):
+            self.assertEqual(self.get('1.2.3.4').status_code, 200)
+        response = self.get('1.2.3.4')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_spoofed_forwarded_for_does_not_pick_bucket(self):
+        """Адрес, присланный клиентом, не меняет его ведро."""
+        for spoofed in ('6.6.6.6', '7.7.7.7'):
+            self.assertEqual(
+                self.get(f'{spoofed}, 1.2.3.4').status_code, 200
+            )
+        self.assertEqual(self.get('8.8.8.8, 1.2.3.4').status_code, 429)
+        self.assertEqual(self.get('5.6.7.8').status_code, 200)
+
+
+class CompressionTests(RepresentationTestCase):
+    """Сжатие ответов по Accept-Encoding."""
+
+    decompress = {'br': brotli.decompress, 'gzip': gzip.decompress}
+
+    def assertCompressed(self, response, encoding):
+        """Ответ сжат нужной кодировкой и зависит от Accept-Encoding."""
+        self.assertEqual(response['Content-Encoding'], encoding)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_list_is_compressed(self):
+        """Страница рецептов сжимается и распаковывается в исходную."""
+        plain = APIClient().get('/api/recipes/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        for encoding in self.decompress:
+            with self.subTest(encoding=encoding):
+                response = APIClient().get(
+                    '/api/recipes/', HTTP_ACCEPT_ENCODING=encoding
+                )
+                self.assertCompressed(response, encoding)
+                self.assertEqual(
+                    self.decompress[encoding](response.content),
+                    plain.content
+                )
+
+    def test_stream_is_compressed(self):
+        """Выгрузка рецептов сжимается по частям."""
+        client = self.client_for(self.reader)
+        plain = b''.join(
+            client.get('/api/recipes/stream/').streaming_content
+        )
+        for encoding in self.decompress:
+            with self.subTest(encoding=encoding):
+                response = client.get(
+                    '/api/recipes/stream/', HTTP_ACCEPT_ENCODING=encoding
+                )
+                self.assertTrue(response.streaming)
+                self.assertCompressed(response, encoding)
+                self.assertEqual(
+                    self.decompress[encoding](
+                        b''.join(response.streaming_content)
+                    ),
+                    plain
+                )
+
+    def test_async_stream_is_compressed(self):
+        """Асинхронный поток (ASGI) сжимается так же."""
+        async def chunks():
+            for chunk in (b'[1', b',2', b']'):
+                yield chunk
+
+        async def body(response):
+            return b''.join([
+                chunk async for chunk in response.streaming_content
+            ])
+
+        request = AsyncRequestFactory().get(
+            '/api/recipes/stream/', headers={'Accept-Encoding': 'gzip'}
+        )
+        response = CompressionMiddleware(
+            lambda request: StreamingHttpResponse(
+                chunks(), content_type='application/json'
+            )
+        )(request)
+        self.assertTrue(response.is_async)
+        self.assertCompressed(response, 'gzip')
+        self.assertEqual(
+            gzip.decompress(async_to_sync(body)(response)), b'[1,2]'
+        )
+
+
+class PageSizeTests(RepresentationTestCase):
+    """Предел размера страницы и выгрузка всех рецептов частями."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Рецептов больше, чем помещается на одну страницу."""
+        super().setUpTestData()
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.other, name=f'Рецепт {number}', text='t',
+                image='', cooking_time=1
+            )
+            for number in range(PAGE_SIZE_MAX)
+        )
+
+    def test_limit_is_capped(self):
+        """limit больше PAGE_SIZE_MAX урезается до него."""
+        response = APIClient().get(
+            '/api/recipes/', {'limit': PAGE_SIZE_MAX * 10}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), PAGE_SIZE_MAX)
+        self.assertEqual(response.json()['count'], Recipe.objects.count())
+
+    def test_stream_returns_everything_in_chunks(self):
+        """Выгрузка отдаёт все рецепты частями по размеру части."""
+        chunk_size = 40
+        with mock.patch('api.views.RECIPES_STREAM_CHUNK_SIZE', chunk_size):
+            response = self.client_for(self.reader).get(
+                '/api/recipes/stream/'
+            )
+            chunks = list(response.streaming_content)
+        total = Recipe.objects.count()
+        # Части с рецептами и закрывающая скобка.
+        self.assertEqual(len(chunks), -(-total // chunk_size) + 1)
+        self.assertEqual(
+            [recipe['id'] for recipe in json.loads(b''.join(chunks))],
+            list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+        )
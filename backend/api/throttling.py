@@ -0,0 +1,106 @@
+"""Ограничение частоты запросов к дорогим эндпоинтам."""
+from rest_framework.throttling import BaseThrottle
+
+from foodgram_backend.constants import (
+    BATCH_REQUESTS_MAX, LIST_THROTTLE_ITEMS_PER_TOKEN
+)
+from foodgram_backend.ratelimit import rate_limiter
+
+
+def client_ident(request, user):
+    """Ключ клиента: id пользователя или IP для анонима.
+
+    IP берётся из X-Forwarded-For с учётом NUM_PROXIES: доверяются только
+    адреса, добавленные своими прокси, а не присланные клиентом.
+    """
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{BaseThrottle().get_ident(request)}'
+
+
+def list_cost(limit, default, maximum=None):
+    """Стоимость страницы списка в токенах: растёт с параметром limit."""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        limit = default
+    if limit <= 0:
+        limit = default
+    if maximum is not None:
+        limit = min(limit, maximum)
+    return 1 + limit // LIST_THROTTLE_ITEMS_PER_TOKEN
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle на token bucket; scope — класс маршрута из RATE_LIMITS."""
+
+    scope = None
+
+    def get_cost(self, request, view):
+        """Сколько токенов стоит запрос."""
+        return 1
+
+    def allow_request(self, request, view):
+        """Пропускает запрос, если в ведре хватает токенов."""
+        self.wait_seconds = rate_limiter.consume(
+            self.scope, client_ident(request, request.user),
+            self.get_cost(request, view)
+        )
+        return not self.wait_seconds
+
+    def wait(self):
+        """Через сколько секунд повторить запрос."""
+        return self.wait_seconds
+
+
+class ShoppingListThrottle(TokenBucketThrottle):
+    """Скачивание списка покупок."""
+
+    scope = 'shopping_list'
+
+
+class RecipeWriteThrottle(TokenBucketThrottle):
+    """Создание и изменение рецептов с картинками в base64."""
+
+    scope = 'recipe_write'
+
+
+class ListThrottle(TokenBucketThrottle):
+    """Страницы списков; большой limit стоит больше токенов."""
+
+    scope = 'list'
+
+    def get_cost(self, request, view):
+        """Стоимость по limit пагинатора или по числу id в ?ids=."""
+        paginator = view.pagination_class
+        limit = request.query_params.get(paginator.page_size_query_param)
+        ids = request.query_params.getlist('ids')
+        if ids:
+            # Выборка по id стоит как страница того же размера.
+            limit = sum(value.count(',') + 1 for value in ids)
+        return list_cost(limit, paginator.page_size, paginator.max_page_size)
+
+
+class RecipeStreamThrottle(TokenBucketThrottle):
+    """Выгрузка всех рецептов потоком."""
+
+    scope = 'recipe_stream'
+
+
+class BatchThrottle(TokenBucketThrottle):
+    """Пакет запросов: каждый вложенный запрос стоит токен.
+
+    Иначе вложенные запросы к маршрутам без своего ограничения (карточки,
+    избранное, подписки) шли бы в BATCH_REQUESTS_MAX раз чаще.
+    """
+
+    scope = 'batch'
+
+    def get_cost(self, request, view):
+        """Число вложенных запросов, не больше BATCH_REQUESTS_MAX."""
+        data = request.data
+        requests = data.get('requests') if hasattr(data, 'get') else None
+        if not isinstance(requests, list):
+            # Такой пакет не пройдёт проверку сериализатора.
+            return 1
+        return min(max(len(requests), 1), BATCH_REQUESTS_MAX)
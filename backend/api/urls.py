@@ -1,9 +1,12 @@
 """URLs для приложения api."""
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
+from .batch import batch
 from .views import (
-    IngredientViewSet, RecipeViewSet, CustomUserViewSet,
+    ChangeListView, IngredientViewSet, RecipeViewSet, CustomUserViewSet,
     SubscriptionsListView, SubscribeView
 )
 
@@ -28,7 +31,20 @@ custom_user_paths = [
     ),
 ]
 
+async_read_paths = [
+    path('recipes/', async_views.recipe_list, name='recipe-list'),
+    path(
+        'recipes/<int:pk>/', async_views.recipe_detail, name='recipe-detail'
+    ),
+    path(
+        'ingredients/', async_views.ingredient_list, name='ingredient-list'
+    ),
+] if settings.ASYNC_READ_VIEWS else []
+
 urlpatterns = [
+    path('batch/', batch, name='batch'),
+    path('changes/', ChangeListView.as_view(), name='change-list'),
+    path('', include(async_read_paths)),
     path('', include(custom_user_paths)),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
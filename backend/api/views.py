@@ -1,16 +1,37 @@
 """Представления для приложения recipes."""
-from django.http import HttpResponse, HttpResponseRedirect
+
+from django.http import (
+    HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Q, Sum
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters, permissions, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 
+from .conditional import (
+    cached_entries, cached_response, conditional_response, etag_matches,
+    ids_etag, list_etag, recipe_etag, user_etag, with_etag
+)
 from .filters import RecipeFilter, IngredientFilter
+from .representations import (
+    recipe_fields, recipe_rows, represent_recipes, represent_users,
+    stream_recipes, streaming_content, user_fields, user_rows, viewer
+)
+from .throttling import (
+    ListThrottle, RecipeStreamThrottle, RecipeWriteThrottle,
+    ShoppingListThrottle
+)
+from foodgram_backend.constants import (
+    CHANGES_PAGE_SIZE, CHANGES_PAGE_SIZE_MAX, ID_MAX, PAGE_SIZE_MAX,
+    PANTRY_INGREDIENTS_MAX, RECIPE_IDS_MAX, RECIPES_STREAM_CHUNK_SIZE
+)
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (
-    Ingredient, Recipe, Favorite, ShoppingCart, RecipeIngredient
+    Change, Ingredient, Recipe, Favorite, ShoppingCart, RecipeIngredient
 )
 from .serializers import (
     IngredientSerializer, RecipeSerializer, RecipeCreateUpdateSerializer,
@@ -18,7 +39,9 @@ from .serializers import (
 )
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.generics import get_object_or_404 as get_row_or_404
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from djoser import views as djoser_views
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
@@ -32,12 +55,65 @@ from .serializers import (
     SubscribeResponseSerializer
 )
 
+CHANGE_FIELDS = ('id', 'model', 'action', 'object_id', 'data')
+
 
 class UserPagination(PageNumberPagination):
     """Пагинация для пользователей."""
 
     page_size_query_param = 'limit'
     page_size = 6
+    max_page_size = PAGE_SIZE_MAX
+
+
+class ChangePagination(BasePagination):
+    """Страницы журнала изменений после курсора since.
+
+    Курсор — номер (sequence) последней полученной записи; ответ содержит
+    курсор для следующего запроса и признак has_more.
+    """
+
+    cursor_query_param = 'since'
+    page_size_query_param = 'limit'
+    page_size = CHANGES_PAGE_SIZE
+    max_page_size = CHANGES_PAGE_SIZE_MAX
+
+    def get_page_size(self, request):
+        """Размер страницы по параметру limit с ограничением сверху."""
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Записи после курсора в порядке номеров."""
+        since = request.query_params.get(self.cursor_query_param, '0')
+        if not since.isdigit():
+            raise ValidationError({
+                'errors': 'since должен быть неотрицательным целым числом.'
+            })
+        size = self.get_page_size(request)
+        rows = list(queryset.filter(
+            sequence__gt=int(since)
+        ).order_by('sequence')[:size + 1])
+        self.has_more = len(rows) > size
+        page = rows[:size]
+        self.cursor = page[-1]['sequence'] if page else int(since)
+        self.page = [
+            {name: row[name] for name in CHANGE_FIELDS} for row in page
+        ]
+        return self.page
+
+    def get_paginated_response(self, data):
+        """Ответ с курсором для следующего запроса."""
+        return Response({
+            'cursor': self.cursor,
+            'has_more': self.has_more,
+            'results': data,
+        })
 
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
@@ -59,6 +135,17 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        """Каталог ингредиентов; для анонимов — из кэша ответов."""
+        return cached_response(
+            request, lambda: (None, lambda: self.catalog(request))
+        )
+
+    def catalog(self, request):
+        """Данные каталога с фильтром по названию."""
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.get_serializer(queryset, many=True).data
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Представление для рецептов."""
@@ -72,7 +159,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     ]
     filterset_class = RecipeFilter
     search_fields = ['name', 'author__username']
-    ordering_fields = ['pub_date', 'name']
+    ordering_fields = ['pub_date', 'name', 'popularity']
 
     def get_serializer_class(self):
         """Возвращает соответствующий сериализатор."""
@@ -80,40 +167,170 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeCreateUpdateSerializer
         return RecipeSerializer
 
+    def get_throttles(self):
+        """Ограничения частоты для записи и списков рецептов."""
+        if self.action in ['create', 'update', 'partial_update']:
+            return [RecipeWriteThrottle()]
+        if self.action in ['list', 'trending', 'pantry']:
+            return [ListThrottle()]
+        return super().get_throttles()
+
+    def list(self, request):
+        """Список рецептов без сериализатора DRF; с ?ids= — выборка по id."""
+        if 'ids' in request.query_params:
+            return self.multi_get(request)
+        return cached_response(request, lambda: self.page_entry(request))
+
+    def requested_ids(self, request):
+        """Уникальные id из ?ids= в порядке запроса."""
+        raw_ids = []
+        for value in request.query_params.getlist('ids'):
+            raw_ids.extend(part for part in value.split(',') if part)
+        try:
+            ids = list(dict.fromkeys(int(value) for value in raw_ids))
+        except ValueError:
+            ids = None
+        if ids is None or any(
+            not 1 <= pk <= ID_MAX for pk in ids
+        ):
+            raise ValidationError({'errors': 'ids должен быть списком id.'})
+        if not ids:
+            raise ValidationError(
+                {'errors': 'Нужно указать хотя бы один id.'}
+            )
+        if len(ids) > RECIPE_IDS_MAX:
+            raise ValidationError(
+                {'errors': f'Можно указать не более {RECIPE_IDS_MAX} id.'}
+            )
+        return ids
+
+    def multi_get(self, request):
+        """Рецепты по списку id в порядке запроса и id, которых нет.
+
+        Рецепты читаются теми же двумя запросами, что и страница списка.
+        Без других параметров запрос совпадает с карточками рецептов, и
+        анонимы получают их записи из кэша ответов.
+        """
+        ids = self.requested_ids(request)
+        fields = recipe_fields(request)
+
+        def compute(missing):
+            rows = list(recipe_rows(
+                self.filter_queryset(self.get_queryset()).filter(
+                    pk__in=missing
+                ), viewer(request), fields
+            ))
+            return {
+                row['id']: (fields.tag(recipe_etag(row)), data)
+                for row, data in zip(
+                    rows, represent_recipes(request, rows, fields)
+                )
+            }
+
+        def path(pk):
+            return reverse('api:recipe-detail', args=[pk])
+
+        shared = request.query_params.keys() == {'ids'}
+        entries = cached_entries(
+            request, ids, compute, path if shared else None
+        )
+        missing = [pk for pk in ids if pk not in entries]
+        etag = ids_etag(
+            'recipes', [entries[pk][0] for pk in ids if pk in entries],
+            missing
+        )
+        return conditional_response(request, etag, lambda: Response({
+            'results': [entries[pk][1] for pk in ids if pk in entries],
+            'missing': missing,
+        }))
+
+    def page_entry(self, request):
+        """ETag страницы рецептов и функция, строящая её данные."""
+        fields = recipe_fields(request)
+        rows = recipe_rows(
+            self.filter_queryset(self.get_queryset()), viewer(request),
+            fields
+        )
+        page = self.paginate_queryset(rows)
+        etag = list_etag(
+            'recipes', page, self.paginator.page.paginator.count,
+            recipe_etag
+        )
+        return fields.tag(etag), lambda: self.get_paginated_response(
+            represent_recipes(request, page, fields)
+        ).data
+
+    def retrieve(self, request, pk=None):
+        """Рецепт без сериализатора DRF."""
+        return cached_response(request, lambda: self.recipe_entry(request, pk))
+
+    def recipe_entry(self, request, pk):
+        """ETag рецепта и функция, строящая его данные."""
+        fields = recipe_fields(request)
+        rows = recipe_rows(
+            self.filter_queryset(self.get_queryset()), viewer(request),
+            fields
+        )
+        row = get_row_or_404(rows, pk=pk)
+        return fields.tag(recipe_etag(row)), lambda: represent_recipes(
+            request, [row], fields
+        )[0]
+
     def perform_create(self, serializer):
         """Сохраняет автора рецепта."""
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
     def create(self, request):
         """Создает рецепт."""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
-        response_serializer = RecipeSerializer(
-            serializer.instance, context=self.get_serializer_context())
-        headers = self.get_success_headers(response_serializer.data)
-        return Response(response_serializer.data,
-                        status=status.HTTP_201_CREATED, headers=headers)
+        return self.recipe_response(
+            serializer.instance, status.HTTP_201_CREATED
+        )
 
+    @transaction.atomic
     def update(self, request, **kwargs):
-        """Обновляет рецепт."""
+        """Обновляет рецепт; с If-Match — только его текущую версию."""
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
+        if_match = request.META.get('HTTP_IF_MATCH')
+        if if_match:
+            row = recipe_rows(
+                Recipe.objects.select_for_update(of=('self',)).filter(
+                    pk=instance.pk
+                ),
+                viewer(request)
+            ).get()
+            etag = recipe_etag(row)
+            if not etag_matches(if_match, etag, weak=False):
+                return with_etag(Response(
+                    {'errors': 'Рецепт был изменён, получите его заново.'},
+                    status=status.HTTP_412_PRECONDITION_FAILED
+                ), etag)
         serializer = self.get_serializer(instance,
                                          data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
-
-        if getattr(instance, '_prefetched_objects_cache', None):
-            instance = self.get_object()
-        response_serializer = RecipeSerializer(
-            instance, context=self.get_serializer_context())
-        return Response(response_serializer.data)
+        return self.recipe_response(instance)
+
+    def recipe_response(self, recipe, status_code=status.HTTP_200_OK):
+        """Рецепт после записи с ETag; запросов не больше, чем при чтении."""
+        row = recipe_rows(
+            Recipe.objects.filter(pk=recipe.pk), viewer(self.request)
+        ).get()
+        return with_etag(
+            Response(represent_recipes(self.request, [row])[0],
+                     status=status_code),
+            recipe_etag(row)
+        )
 
     @action(
         detail=True, methods=['post', 'delete'],
         permission_classes=[permissions.IsAuthenticated]
     )
+    @transaction.atomic
     def favorite(self, request, pk=None):
         """Добавляет или удаляет рецепт из избранного."""
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -144,6 +361,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=True, methods=['post', 'delete'],
         permission_classes=[permissions.IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
         """Удаляет рецепт из списка покупок."""
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -172,7 +390,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(
         detail=False, methods=['get'],
-        permission_classes=[permissions.IsAuthenticated]
+        permission_classes=[permissions.IsAuthenticated],
+        throttle_classes=[ShoppingListThrottle]
     )
     def download_shopping_cart(self, request):
         """Скачивает список покупок."""
@@ -205,6 +424,88 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return response
 
+    @action(
+        detail=False, methods=['get'],
+        permission_classes=[permissions.IsAuthenticated],
+        throttle_classes=[RecipeStreamThrottle]
+    )
+    def stream(self, request):
+        """Все рецепты с фильтрами списка одним JSON-массивом.
+
+        Рецепты читаются курсором по порядку id и отдаются частями по
+        RECIPES_STREAM_CHUNK_SIZE, поэтому память не растёт с числом
+        рецептов. Под ASGI части читаются по одной из асинхронного
+        итератора, а чтения идут на ту же базу, что выбрал запрос.
+        """
+        fields = recipe_fields(request)
+        queryset = self.filter_queryset(self.get_queryset()).order_by('pk')
+        return StreamingHttpResponse(
+            streaming_content(request, stream_recipes(
+                request, recipe_rows(queryset, viewer(request), fields),
+                RECIPES_STREAM_CHUNK_SIZE, fields
+            )),
+            content_type='application/json'
+        )
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """Возвращает рецепты, отсортированные по популярности."""
+        fields = recipe_fields(request)
+        queryset = self.filter_queryset(self.get_queryset()).order_by(
+            '-popularity', '-pub_date'
+        )
+        page = self.paginate_queryset(
+            recipe_rows(queryset, viewer(request), fields)
+        )
+        return self.get_paginated_response(
+            represent_recipes(request, page, fields)
+        )
+
+    @action(detail=False, methods=['get'])
+    def pantry(self, request):
+        """Подбирает рецепты по ингредиентам, которые есть у пользователя."""
+        raw_ids = []
+        for value in request.query_params.getlist('ingredients'):
+            raw_ids.extend(part for part in value.split(',') if part)
+        try:
+            ingredient_ids = {int(value) for value in raw_ids}
+        except ValueError:
+            return Response(
+                {'errors': 'Ингредиенты должны быть списком id.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not ingredient_ids:
+            return Response(
+                {'errors': 'Нужно указать хотя бы один ингредиент.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ingredient_ids) > PANTRY_INGREDIENTS_MAX:
+            return Response(
+                {'errors': f'Можно указать не более '
+                           f'{PANTRY_INGREDIENTS_MAX} ингредиентов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fields = recipe_fields(request)
+        page_ranks = self.paginate_queryset(
+            ingredient_index.rank(ingredient_ids)
+        )
+        rows = {
+            row['id']: row for row in recipe_rows(
+                Recipe.objects.filter(
+                    pk__in=[recipe_id for recipe_id, _, _ in page_ranks]
+                ), viewer(request), fields
+            )
+        }
+        ranked = [item for item in page_ranks if item[0] in rows]
+        results = represent_recipes(
+            request, [rows[recipe_id] for recipe_id, _, _ in ranked], fields
+        )
+        for data, (_, matched, missing) in zip(results, ranked):
+            data['matched'] = matched
+            data['missing'] = missing
+        return self.get_paginated_response(results)
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
         """Возвращает короткую ссылку на рецепт."""
@@ -233,6 +534,52 @@ class CustomUserViewSet(djoser_views.UserViewSet):
             return [IsAuthenticated()]
         return super().get_permissions()
 
+    def get_throttles(self):
+        """Ограничение частоты для списка пользователей."""
+        if self.action == 'list':
+            return [ListThrottle()]
+        return super().get_throttles()
+
+    def list(self, request):
+        """Список пользователей без сериализатора DRF."""
+        fields = user_fields(request)
+        rows = user_rows(
+            self.filter_queryset(self.get_queryset()), viewer(request),
+            fields
+        )
+        page = self.paginate_queryset(rows)
+        etag = list_etag(
+            'users', page, self.paginator.page.paginator.count, user_etag
+        )
+        return conditional_response(
+            request, fields.tag(etag),
+            lambda: self.get_paginated_response(
+                represent_users(request, page, fields)
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Пользователь (в том числе /me/) без сериализатора DRF."""
+        return cached_response(
+            request, lambda: self.user_entry(request, kwargs)
+        )
+
+    def user_entry(self, request, kwargs):
+        """ETag пользователя и функция, строящая его данные."""
+        if self.action == 'me':
+            queryset = User.objects.all()
+            lookup = {'pk': request.user.pk}
+        else:
+            queryset = self.filter_queryset(self.get_queryset())
+            lookup = {self.lookup_field: kwargs[self.lookup_field]}
+        fields = user_fields(request)
+        row = get_row_or_404(
+            user_rows(queryset, viewer(request), fields), **lookup
+        )
+        return fields.tag(user_etag(row)), lambda: represent_users(
+            request, [row], fields
+        )[0]
+
     def create(self, request):
         """Создание пользователя."""
         serializer = self.get_serializer(data=request.data)
@@ -282,6 +629,7 @@ class SubscriptionsListView(ListAPIView):
     serializer_class = SubscriptionListSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = UserPagination
+    throttle_classes = [ListThrottle]
 
     def get_queryset(self):
         """Получение списка подписок."""
@@ -298,6 +646,7 @@ class SubscribeView(APIView):
 
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def post(self, request, id):
         """Подписка на пользователя."""
         author = get_object_or_404(User, id=id)
@@ -317,6 +666,7 @@ class SubscribeView(APIView):
         return Response(response_serializer.data,
                         status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, request, id):
         """Отписка от пользователя."""
         try:
@@ -341,6 +691,35 @@ class SubscribeView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ChangeListView(ListAPIView):
+    """Изменения видимых пользователю данных после курсора.
+
+    Изменения рецептов видны всем, избранное, список покупок и подписки —
+    только своему пользователю. Отдаются только пронумерованные записи:
+    номера выдаются в порядке фиксации транзакций, поэтому запись не
+    может появиться позади уже выданного курсора.
+    """
+
+    permission_classes = [AllowAny]
+    pagination_class = ChangePagination
+    throttle_classes = [ListThrottle]
+
+    def get_queryset(self):
+        """Записи журнала, видимые пользователю."""
+        visible = Q(user__isnull=True)
+        if self.request.user.is_authenticated:
+            visible |= Q(user=self.request.user)
+        return Change.objects.filter(visible).values(
+            *CHANGE_FIELDS, 'sequence'
+        )
+
+    def list(self, request):
+        """Страница журнала без сериализатора."""
+        return self.get_paginated_response(
+            self.paginate_queryset(self.get_queryset())
+        )
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def short_url_redirect(request, recipe_pk):
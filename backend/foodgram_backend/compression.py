@@ -0,0 +1,255 @@
+"""Сжатие ответов API: brotli или gzip по Accept-Encoding.
+
+Сжимаются JSON и текстовые ответы (список покупок) не меньше
+COMPRESSION_MIN_SIZE байт. Ответы, одинаковые для всех пользователей
+(анонимные GET-запросы: каталог ингредиентов, страницы рецептов),
+сжимаются один раз с высокой степенью и берутся из кэша по хэшу тела.
+
+Потоковые ответы (выгрузка рецептов) сжимаются по частям: каждая часть
+сразу сбрасывается клиенту, и тело целиком в памяти не собирается.
+
+К ETag сжатого ответа добавляется суффикс кодировки (-br, -gzip), как
+требует HTTP для разных представлений. Из условных заголовков запроса
+суффикс снимается, поэтому представления сравнивают свои ETag как есть.
+"""
+import gzip
+import hashlib
+import re
+import zlib
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+from foodgram_backend.constants import (
+    COMPRESSION_CACHE_MAX_SIZE, COMPRESSION_CACHE_TIMEOUT,
+    COMPRESSION_MIN_SIZE
+)
+from foodgram_backend.metrics import measure
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain')
+ETAG_SUFFIX_RE = re.compile(r'-(br|gzip)"')
+CONDITIONAL_HEADERS = ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH')
+
+
+def compress(body, encoding, cached):
+    """Сжимает тело; для кэшируемых ответов — с большей степенью."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=9 if cached else 4)
+    return gzip.compress(body, compresslevel=9 if cached else 6, mtime=0)
+
+
+class StreamCompressor:
+    """Сжатие потока по частям с выдачей каждой части сразу."""
+
+    def __init__(self, encoding):
+        """Компрессор для выбранной кодировки."""
+        self.encoding = encoding
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=4)
+        else:
+            # 16 + MAX_WBITS — заголовок и контрольная сумма gzip.
+            self.compressor = zlib.compressobj(
+                6, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+
+    def compress(self, chunk):
+        """Сжатая часть, которую клиент может сразу распаковать."""
+        with measure('compress'):
+            if self.encoding == 'br':
+                return (
+                    self.compressor.process(chunk) + self.compressor.flush()
+                )
+            return (
+                self.compressor.compress(chunk)
+                + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            )
+
+    def finish(self):
+        """Завершающие байты потока."""
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+    def chunks(self, content):
+        """Сжатие синхронного итератора."""
+        for chunk in content:
+            yield self.compress(chunk)
+        yield self.finish()
+
+    async def achunks(self, content):
+        """Сжатие асинхронного итератора; сжимается в потоке."""
+        compress = sync_to_async(self.compress, thread_sensitive=False)
+        async for chunk in content:
+            yield await compress(chunk)
+        yield self.finish()
+
+
+def accepted_encoding(header):
+    """Лучшая поддерживаемая кодировка из Accept-Encoding или None."""
+    weights = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        weights[name.strip().lower()] = quality
+    candidates = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best = max(
+        candidates, key=lambda name: weights.get(name, weights.get('*', 0))
+    )
+    if weights.get(best, weights.get('*', 0)) <= 0:
+        return None
+    return best
+
+
+def suffix_etag(etag, encoding):
+    """ETag сжатого представления."""
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+class CompressionMiddleware:
+    """Сжимает ответы и кэширует сжатые тела общих ответов.
+
+    В асинхронной цепочке middleware само сжатие выполняется в потоке,
+    чтобы не занимать цикл событий.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Инициализация middleware."""
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        """Снимает суффиксы с условных заголовков и сжимает ответ."""
+        if self.async_mode:
+            return self.__acall__(request)
+        cached_encoding = self.strip_conditional(request)
+        response = self.get_response(request)
+        return self.process(request, response, cached_encoding)
+
+    async def __acall__(self, request):
+        """Асинхронный вариант __call__."""
+        cached_encoding = self.strip_conditional(request)
+        response = await self.get_response(request)
+        if self.compressible(response) and not response.streaming:
+            return await sync_to_async(
+                self.process, thread_sensitive=False
+            )(request, response, cached_encoding)
+        return self.process(request, response, cached_encoding)
+
+    @staticmethod
+    def strip_conditional(request):
+        """Снимает суффиксы кодировки с условных заголовков.
+
+        Возвращает кодировку из If-None-Match, если она там была.
+        """
+        cached_encoding = None
+        for header in CONDITIONAL_HEADERS:
+            if header in request.META:
+                match = ETAG_SUFFIX_RE.search(request.META[header])
+                if match and header == 'HTTP_IF_NONE_MATCH':
+                    cached_encoding = match.group(1)
+                request.META[header] = ETAG_SUFFIX_RE.sub(
+                    '"', request.META[header]
+                )
+        return cached_encoding
+
+    def process(self, request, response, cached_encoding):
+        """Сжимает ответ или восстанавливает суффикс ETag у 304."""
+        if self.compressible(response):
+            patch_vary_headers(response, ('Accept-Encoding',))
+            encoding = accepted_encoding(
+                request.META.get('HTTP_ACCEPT_ENCODING', '')
+            )
+            if encoding is not None and response.streaming:
+                self.compress_stream(response, encoding)
+            elif encoding is not None:
+                self.compress_response(request, response, encoding)
+        elif (
+            response.status_code == 304 and cached_encoding
+            and response.has_header('ETag')
+        ):
+            # 304 подтверждает то представление, которое есть у клиента.
+            response['ETag'] = suffix_etag(response['ETag'], cached_encoding)
+        return response
+
+    @staticmethod
+    def compressible(response):
+        """Можно ли сжимать ответ."""
+        if response.has_header('Content-Encoding'):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if content_type not in COMPRESSIBLE_TYPES:
+            return False
+        # Размер потока заранее неизвестен, его сжимают всегда.
+        return (
+            response.streaming
+            or len(response.content) >= COMPRESSION_MIN_SIZE
+        )
+
+    @staticmethod
+    def compress_stream(response, encoding):
+        """Заменяет тело потокового ответа сжимаемым по частям."""
+        compressor = StreamCompressor(encoding)
+        if response.is_async:
+            response.streaming_content = compressor.achunks(
+                response.streaming_content
+            )
+        else:
+            response.streaming_content = compressor.chunks(
+                response.streaming_content
+            )
+        if response.has_header('Content-Length'):
+            del response['Content-Length']
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag'):
+            response['ETag'] = suffix_etag(response['ETag'], encoding)
+
+    def compress_response(self, request, response, encoding):
+        """Заменяет тело ответа сжатым."""
+        body = response.content
+        shared = (
+            request.method == 'GET'
+            and response.status_code == 200
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and not response.cookies
+            and len(body) <= COMPRESSION_CACHE_MAX_SIZE
+        )
+        with measure('compress'):
+            if shared:
+                key = (
+                    f'compressed:{encoding}:'
+                    f'{hashlib.sha1(body).hexdigest()}'
+                )
+                compressed = cache.get(key)
+                if compressed is None:
+                    compressed = compress(body, encoding, cached=True)
+                    cache.set(key, compressed, COMPRESSION_CACHE_TIMEOUT)
+            else:
+                compressed = compress(body, encoding, cached=False)
+        if len(compressed) >= len(body):
+            return
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag'):
+            response['ETag'] = suffix_etag(response['ETag'], encoding)
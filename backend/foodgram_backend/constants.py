@@ -5,3 +5,47 @@ COOKING_TIME_MAX = 32000
 
 AMOUNT_INGREDIENTS_MIN = 1
 AMOUNT_INGREDIENTS_MAX = 32000
+
+
+INGREDIENT_INDEX_TTL = 300
+PANTRY_INGREDIENTS_MAX = 100
+
+
+POPULARITY_HALF_LIFE_HOURS = 72
+POPULARITY_FAVORITE_WEIGHT = 1.0
+POPULARITY_SHOPPING_CART_WEIGHT = 0.5
+
+
+RECIPES_BATCH_SIZE = 1000
+RECIPES_STREAM_CHUNK_SIZE = 500
+
+
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_CACHE_MAX_SIZE = 1024 * 1024
+COMPRESSION_CACHE_TIMEOUT = 300
+
+
+PAGE_SIZE_MAX = 100
+RECIPE_IDS_MAX = 100
+# Верхняя граница BigAutoField: большие id SQLite не принимает вовсе.
+ID_MAX = (1 << 63) - 1
+LIST_THROTTLE_ITEMS_PER_TOKEN = 50
+
+
+WARM_CACHE_PAGES = 5
+WARM_CACHE_LIMITS = (6,)
+WARM_CACHE_TOP_RECIPES = 50
+WARM_CACHE_TOP_AUTHORS = 20
+WARM_CACHE_BUDGET = 30
+WARM_CACHE_WORKERS = 4
+
+
+FILTER_INGREDIENTS_MAX = 10
+
+
+CHANGES_PAGE_SIZE = 100
+CHANGES_PAGE_SIZE_MAX = 1000
+CHANGES_COMPACT_AFTER_DAYS = 7
+
+
+BATCH_REQUESTS_MAX = 20
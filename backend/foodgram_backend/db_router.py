@@ -0,0 +1,203 @@
+"""Маршрутизация запросов к основной базе и репликам."""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PRIMARY_DB = 'default'
+STICKY_COOKIE = 'db_primary'
+STICKY_COOKIE_SALT = 'foodgram_backend.db_router'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_routing = ContextVar('db_routing', default=None)
+_END = object()
+
+
+class RoutingState:
+    """Состояние маршрутизации в рамках одного HTTP-запроса.
+
+    Реплика выбирается один раз на запрос, чтобы все его чтения видели
+    данные с одной и той же задержкой.
+    """
+
+    __slots__ = ('use_primary', 'sticky', 'wrote', 'replica')
+
+    def __init__(self, use_primary, sticky=False):
+        """Инициализация состояния; sticky — клиент закреплён за primary."""
+        self.use_primary = use_primary
+        self.sticky = sticky
+        self.wrote = False
+        self.replica = None
+
+
+def keep_routing(iterator):
+    """Итератор с маршрутизацией запроса, в котором он создан.
+
+    Тело StreamingHttpResponse читается после выхода из middleware, когда
+    состояние уже сброшено, и без обёртки его чтения шли бы на основную
+    базу. Состояние ставится только на время каждого шага итератора.
+    """
+    return _routed(iter(iterator), _routing.get())
+
+
+def _routed(iterator, state):
+    """Шаги iterator с состоянием state; генератор для keep_routing.
+
+    Состояние передаётся аргументом: тело генератора начинает работать
+    только при первом чтении, когда запрос уже завершён.
+    """
+    try:
+        while True:
+            token = _routing.set(state)
+            try:
+                item = next(iterator, _END)
+            finally:
+                _routing.reset(token)
+            if item is _END:
+                return
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            iterator.close()
+
+
+@contextmanager
+def sub_request_routing(method):
+    """Маршрутизация вложенного запроса пакета по его собственному методу.
+
+    Безопасный вложенный запрос читает с реплики, если клиент не закреплён
+    и предыдущие запросы пакета ничего не записали. Закрепление после
+    пакета вызывает только небезопасный вложенный запрос, который записал
+    в базу.
+    """
+    outer = _routing.get()
+    if outer is None:
+        yield
+        return
+    state = RoutingState(
+        method not in SAFE_METHODS or outer.sticky or outer.wrote,
+        outer.sticky
+    )
+    state.replica = outer.replica
+    token = _routing.set(state)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+        outer.replica = state.replica
+        if state.wrote and method not in SAFE_METHODS:
+            outer.wrote = True
+
+
+class PrimaryReplicaRouter:
+    """Отправляет чтение безопасных запросов на реплики, запись — на primary.
+
+    Вне HTTP-запроса (команды, фоновые задачи) и после первой записи в
+    рамках запроса все чтения идут на основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        """Выбирает базу для чтения."""
+        state = _routing.get()
+        replicas = settings.DATABASE_REPLICAS
+        if state is None or state.use_primary or not replicas:
+            return PRIMARY_DB
+        if state.replica is None:
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        """Запись всегда идёт на основную базу."""
+        state = _routing.get()
+        if state is not None:
+            state.use_primary = True
+            state.wrote = True
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Все базы содержат одни и те же данные."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Миграции применяются только к основной базе."""
+        return db == PRIMARY_DB
+
+
+class ReplicaStickinessMiddleware:
+    """Закрепляет клиента за основной базой после его записи.
+
+    После запроса, который записал в базу, клиент получает подписанную
+    куку со временем записи. Пока ей не больше REPLICA_STICKY_SECONDS, его
+    чтения идут на основную базу, и он видит свои изменения. Отметка живёт
+    у клиента, а не в кэше, поэтому действует на любом воркере и хосте за
+    балансировщиком. Подпись не даёт подделать или продлить отметку.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Инициализация middleware."""
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        """Выполняет запрос с выбранной маршрутизацией."""
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        state = self.routing_state(request)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        """Асинхронный вариант __call__.
+
+        Состояние лежит в ContextVar задачи запроса, и sync_to_async
+        переносит его в поток, где выполняются запросы к базе.
+        """
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        state = self.routing_state(request)
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(request, response, state)
+
+    @staticmethod
+    def routing_state(request):
+        """Состояние запроса: закреплён ли клиент и безопасен ли метод."""
+        sticky = is_pinned(request)
+        return RoutingState(
+            request.method not in SAFE_METHODS or sticky, sticky
+        )
+
+    @staticmethod
+    def pin(request, response, state):
+        """Ставит отметку о записи клиенту, который записал в базу."""
+        if state.wrote:
+            response.set_signed_cookie(
+                STICKY_COOKIE, '1', salt=STICKY_COOKIE_SALT,
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(), httponly=True, samesite='Lax'
+            )
+        return response
+
+
+def is_pinned(request):
+    """Записывал ли клиент в базу последние REPLICA_STICKY_SECONDS."""
+    return request.get_signed_cookie(
+        STICKY_COOKIE, None, salt=STICKY_COOKIE_SALT,
+        max_age=settings.REPLICA_STICKY_SECONDS
+    ) is not None
@@ -0,0 +1,486 @@
+"""Метрики запросов: заголовок Server-Timing и эндпоинт для Prometheus.
+
+Каждый процесс копит гистограммы по маршрутам в памяти, а фоновый поток
+раз в METRICS_FLUSH_INTERVAL секунд сбрасывает их в METRICS_DIR/<pid>.json:
+запрос (и цикл событий под ASGI) файл не пишет.
+Эндпоинт складывает файлы всех процессов, поэтому метрики собираются со
+всех воркеров gunicorn без внешнего коллектора. Файл завершившегося
+процесса переносится в общий итог aggregate.json (хук child_exit
+gunicorn или следующий сбор метрик), поэтому файлы не копятся при
+перезапуске воркеров, а счётчики не убывают, когда PID занимает новый
+процесс.
+"""
+import atexit
+import fcntl
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+SPANS = ('db', 'serialize', 'render', 'compress')
+AGGREGATE_FILE = 'aggregate.json'
+LOCK_FILE = '.lock'
+
+_current = ContextVar('request_metrics', default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics:
+    """Метрики одного запроса."""
+
+    __slots__ = ('queries', 'spans')
+
+    def __init__(self):
+        """Инициализация счётчиков."""
+        self.queries = 0
+        self.spans = dict.fromkeys(SPANS, 0.0)
+
+    def add(self, span, duration):
+        """Добавляет длительность к участку запроса."""
+        self.spans[span] += duration
+
+
+@contextmanager
+def measure(span):
+    """Засчитывает время блока в участок span текущего запроса."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(span, time.perf_counter() - started)
+
+
+def _histogram(buckets):
+    """Пустая гистограмма: счётчики корзин, сумма и количество."""
+    return {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+
+
+def _empty_route():
+    """Пустые агрегаты маршрута."""
+    return {
+        'latency': _histogram(LATENCY_BUCKETS),
+        'queries': _histogram(QUERY_BUCKETS),
+        'spans': dict.fromkeys(SPANS, 0.0),
+        'statuses': {},
+    }
+
+
+def _observe(histogram, buckets, value):
+    """Добавляет наблюдение в гистограмму."""
+    index = 0
+    while index < len(buckets) and value > buckets[index]:
+        index += 1
+    histogram['buckets'][index] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+
+class Registry:
+    """Агрегаты метрик текущего процесса."""
+
+    def __init__(self):
+        """Инициализация пустого реестра."""
+        self.routes = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.flusher_pid = None
+
+    def route(self, name):
+        """Агрегаты маршрута; вызывается под блокировкой."""
+        route = self.routes.get(name)
+        if route is None:
+            route = self.routes[name] = _empty_route()
+        return route
+
+    def record(self, name, status, total, metrics):
+        """Учитывает завершённый запрос."""
+        with self.lock:
+            route = self.route(name)
+            _observe(route['latency'], LATENCY_BUCKETS, total)
+            _observe(route['queries'], QUERY_BUCKETS, metrics.queries)
+            for span, duration in metrics.spans.items():
+                route['spans'][span] += duration
+            status = str(status)
+            route['statuses'][status] = route['statuses'].get(status, 0) + 1
+            self.dirty = True
+        if self.flusher_pid != os.getpid():
+            self.start_flusher()
+
+    def start_flusher(self):
+        """Запускает поток сброса агрегатов, один на процесс.
+
+        PID запоминается, потому что после fork потоков родителя в
+        воркере нет и поток нужно запустить заново.
+        """
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+        threading.Thread(
+            target=self.flush_periodically, name='metrics-flush', daemon=True
+        ).start()
+
+    def flush_periodically(self):
+        """Сбрасывает изменившиеся агрегаты раз в интервал."""
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            if not self.dirty:
+                continue
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('Не удалось сохранить метрики.')
+
+    def snapshot(self):
+        """Копия агрегатов процесса."""
+        with self.lock:
+            return json.loads(json.dumps(self.routes))
+
+    def flush(self):
+        """Сохраняет агрегаты процесса в файл."""
+        with self.lock:
+            self.dirty = False
+        directory = settings.METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as target:
+            json.dump(self.snapshot(), target)
+        os.replace(temporary, path)
+
+
+registry = Registry()
+
+
+def _flush_at_exit():
+    """Сохраняет последние метрики при завершении процесса."""
+    if registry.routes:
+        try:
+            registry.flush()
+        except OSError:
+            pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def watch_queries(wrapper):
+    """Подключает обёртку запросов ко всем соединениям с базой.
+
+    Обёртка остаётся на соединении и сама берёт состояние текущего
+    HTTP-запроса из ContextVar. Под ASGI запросы к базе выполняются в
+    потоке sync_to_async с его собственными соединениями: обёртку,
+    подключённую на время запроса в цикле событий, они бы не увидели, а
+    контекст задачи sync_to_async копирует в поток.
+    """
+    def attach(connection):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    def on_connection_created(sender, connection, **kwargs):
+        attach(connection)
+
+    connection_created.connect(
+        on_connection_created, weak=False,
+        dispatch_uid=f'{wrapper.__module__}.{wrapper.__qualname__}'
+    )
+    for connection in connections.all():
+        attach(connection)
+
+
+def count_query(execute, sql, params, many, context):
+    """Обёртка запроса к базе: считает количество и время."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.add('db', time.perf_counter() - started)
+
+
+def route_name(request):
+    """Имя маршрута: имя URL DRF (recipe-list) или путь к view."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.view_name
+
+
+class MetricsMiddleware:
+    """Считает запросы к базе и время участков каждого запроса.
+
+    Работает и в синхронной, и в асинхронной цепочке middleware: под ASGI
+    запрос не уходит в пул потоков ради метрик. Счётчики запроса лежат в
+    ContextVar, поэтому у каждой задачи цикла событий они свои.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Инициализация middleware."""
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        watch_queries(count_query)
+
+    def __call__(self, request):
+        """Выполняет запрос и записывает его метрики."""
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with self.tracking() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        """Асинхронный вариант __call__."""
+        started = time.perf_counter()
+        with self.tracking() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics, started)
+
+    @contextmanager
+    def tracking(self):
+        """Счётчики текущего запроса; count_query пишет в них."""
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            yield metrics
+        finally:
+            _current.reset(token)
+
+    def finish(self, request, response, metrics, started):
+        """Добавляет Server-Timing и учитывает запрос в реестре."""
+        total = time.perf_counter() - started
+        response['Server-Timing'] = ', '.join(
+            [
+                f'{span};dur={duration * 1000:.2f}'
+                for span, duration in metrics.spans.items()
+            ]
+            + [
+                f'queries;desc="{metrics.queries}"',
+                f'total;dur={total * 1000:.2f}',
+            ]
+        )
+        registry.record(
+            route_name(request), response.status_code, total, metrics
+        )
+        return response
+
+
+@contextmanager
+def _directory_lock(directory):
+    """Блокировка каталога метрик между процессами."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read(path):
+    """Агрегаты из файла или None, если файла нет или он повреждён."""
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(routes, source):
+    """Добавляет агрегаты source к routes."""
+    for name, data in source.items():
+        route = routes.setdefault(name, _empty_route())
+        for key in ('latency', 'queries'):
+            route[key]['buckets'] = [
+                left + right for left, right in zip(
+                    route[key]['buckets'], data[key]['buckets']
+                )
+            ]
+            route[key]['sum'] += data[key]['sum']
+            route[key]['count'] += data[key]['count']
+        for span, duration in data['spans'].items():
+            route['spans'][span] = route['spans'].get(span, 0) + duration
+        for status, count in data['statuses'].items():
+            route['statuses'][status] = (
+                route['statuses'].get(status, 0) + count
+            )
+    return routes
+
+
+def _alive(pid):
+    """Существует ли процесс."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _fold(directory, pid):
+    """Переносит файл процесса в общий итог; под блокировкой каталога."""
+    path = os.path.join(directory, f'{pid}.json')
+    data = _read(path)
+    if data is not None:
+        aggregate_path = os.path.join(directory, AGGREGATE_FILE)
+        aggregate = _merge(_read(aggregate_path) or {}, data)
+        temporary = f'{aggregate_path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as target:
+            json.dump(aggregate, target)
+        os.replace(temporary, aggregate_path)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def fold_worker(pid, directory=None):
+    """Переносит метрики завершившегося процесса в общий итог.
+
+    Вызывается из хука child_exit gunicorn, до того как PID достанется
+    новому воркеру.
+    """
+    directory = directory or settings.METRICS_DIR
+    with _directory_lock(directory):
+        _fold(directory, pid)
+
+
+def _worker_pids(directory):
+    """PID процессов, у которых есть файл метрик."""
+    pids = []
+    for name in os.listdir(directory):
+        stem, extension = os.path.splitext(name)
+        if extension == '.json' and stem.isdigit():
+            pids.append(int(stem))
+    return pids
+
+
+def collect():
+    """Складывает агрегаты всех процессов."""
+    sources = []
+    directory = settings.METRICS_DIR
+    if os.path.isdir(directory):
+        own = os.getpid()
+        with _directory_lock(directory):
+            live = []
+            for pid in _worker_pids(directory):
+                if pid == own:
+                    continue
+                if _alive(pid):
+                    live.append(pid)
+                else:
+                    # Процесс завершился без хука child_exit (runserver,
+                    # остановка мастера): его файл тоже уходит в итог.
+                    _fold(directory, pid)
+            for name in [AGGREGATE_FILE, *(f'{pid}.json' for pid in live)]:
+                source = _read(os.path.join(directory, name))
+                if source is not None:
+                    sources.append(source)
+    sources.append(registry.snapshot())
+    routes = {}
+    for source in sources:
+        _merge(routes, source)
+    return routes
+
+
+def metrics_allowed(request):
+    """Можно ли отдать метрики клиенту.
+
+    С METRICS_TOKEN нужен заголовок Authorization: Bearer <токен>, без
+    него — адрес клиента из METRICS_ALLOWED_NETWORKS.
+    """
+    if settings.METRICS_TOKEN:
+        return hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', '').encode(),
+            f'Bearer {settings.METRICS_TOKEN}'.encode()
+        )
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    )
+
+
+def _histogram_lines(metric, route, histogram, buckets):
+    """Строки гистограммы в текстовом формате Prometheus."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets + ('+Inf',), histogram['buckets']):
+        cumulative += count
+        lines.append(
+            f'{metric}_bucket{{route="{route}",le="{bound}"}} {cumulative}'
+        )
+    lines.append(f'{metric}_sum{{route="{route}"}} {histogram["sum"]}')
+    lines.append(f'{metric}_count{{route="{route}"}} {histogram["count"]}')
+    return lines
+
+
+def metrics_view(request):
+    """Отдаёт метрики всех процессов в текстовом формате Prometheus."""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    routes = collect()
+    lines = [
+        '# TYPE foodgram_request_duration_seconds histogram',
+    ]
+    for name, route in sorted(routes.items()):
+        lines.extend(_histogram_lines(
+            'foodgram_request_duration_seconds', name, route['latency'],
+            LATENCY_BUCKETS
+        ))
+    lines.append('# TYPE foodgram_request_queries histogram')
+    for name, route in sorted(routes.items()):
+        lines.extend(_histogram_lines(
+            'foodgram_request_queries', name, route['queries'],
+            QUERY_BUCKETS
+        ))
+    lines.append('# TYPE foodgram_request_span_seconds_total counter')
+    for name, route in sorted(routes.items()):
+        for span, duration in sorted(route['spans'].items()):
+            lines.append(
+                f'foodgram_request_span_seconds_total'
+                f'{{route="{name}",span="{span}"}} {duration}'
+            )
+    lines.append('# TYPE foodgram_requests_total counter')
+    for name, route in sorted(routes.items()):
+        for status, count in sorted(route['statuses'].items()):
+            lines.append(
+                f'foodgram_requests_total'
+                f'{{route="{name}",status="{status}"}} {count}'
+            )
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,169 @@
+"""Поиск N+1 и медленных запросов в режиме разработки и в тестах.
+
+Middleware группирует SQL-запросы одного HTTP-запроса по форме (без
+значений параметров). Если форма повторилась не меньше
+QUERY_INSPECTOR['REPEAT_THRESHOLD'] раз, в лог пишется предупреждение со
+стеком и полем сериализатора, из которого пришёл запрос. Запросы дольше
+QUERY_INSPECTOR['SLOW_QUERY_MS'] логируются отдельно. В строгом режиме
+повторы приводят к исключению RepeatedQueriesError.
+"""
+import logging
+import re
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from foodgram_backend.metrics import watch_queries
+
+logger = logging.getLogger('foodgram.queries')
+
+_current = ContextVar('query_inspection', default=None)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+STACK_DEPTH = 8
+PACKAGE_DIR = str(Path(__file__).resolve().parent)
+
+
+class RepeatedQueriesError(Exception):
+    """Запрос повторяет одинаковые SQL-запросы (N+1)."""
+
+
+def normalize(sql):
+    """Форма запроса: без значений и с IN-списками любой длины."""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return LITERAL_RE.sub('?', sql)
+
+
+def serializer_field():
+    """Поле сериализатора DRF, выполняющее запрос, если оно есть в стеке."""
+    from rest_framework.fields import Field
+
+    frame = sys._getframe(1)
+    while frame is not None:
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, Field) and owner.field_name:
+            parent = type(owner.parent).__name__
+            return f'{parent}.{owner.field_name}'
+        frame = frame.f_back
+    return None
+
+
+def project_stack():
+    """Кадры стека из кода приложений, без middleware и сторонних пакетов."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir)
+        and not frame.filename.startswith(PACKAGE_DIR)
+        and 'site-packages' not in frame.filename
+    ]
+    return ''.join(traceback.format_list(frames[-STACK_DEPTH:]))
+
+
+class Inspection:
+    """Запросы одного HTTP-запроса, сгруппированные по форме."""
+
+    def __init__(self):
+        """Инициализация счётчиков."""
+        self.counts = {}
+        self.origins = {}
+
+    def record(self, sql):
+        """Учитывает запрос; на пороге повтора запоминает его источник."""
+        shape = normalize(sql)
+        count = self.counts.get(shape, 0) + 1
+        self.counts[shape] = count
+        if count == settings.QUERY_INSPECTOR['REPEAT_THRESHOLD']:
+            self.origins[shape] = (serializer_field(), project_stack())
+
+    def repeated(self):
+        """Формы, превысившие порог, с числом повторов и источником."""
+        return [
+            (shape, self.counts[shape], *origin)
+            for shape, origin in self.origins.items()
+        ]
+
+
+def inspect_query(execute, sql, params, many, context):
+    """Обёртка запроса: учитывает форму и время выполнения."""
+    inspection = _current.get()
+    if inspection is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - started) * 1000
+        inspection.record(sql)
+        if duration >= settings.QUERY_INSPECTOR['SLOW_QUERY_MS']:
+            logger.warning('Медленный запрос (%.1f мс): %s', duration, sql)
+
+
+class QueryInspectorMiddleware:
+    """Ищет N+1 и медленные запросы; работает при DEBUG и в тестах."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Отключается, если инспектор выключен в настройках."""
+        if not settings.QUERY_INSPECTOR['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        watch_queries(inspect_query)
+
+    def __call__(self, request):
+        """Выполняет запрос и проверяет выполненные SQL-запросы."""
+        if self.async_mode:
+            return self.__acall__(request)
+        with self.inspecting() as inspection:
+            response = self.get_response(request)
+        self.report(request, inspection)
+        return response
+
+    async def __acall__(self, request):
+        """Асинхронный вариант __call__."""
+        with self.inspecting() as inspection:
+            response = await self.get_response(request)
+        self.report(request, inspection)
+        return response
+
+    @contextmanager
+    def inspecting(self):
+        """Группировка SQL-запросов текущего HTTP-запроса."""
+        inspection = Inspection()
+        token = _current.set(inspection)
+        try:
+            yield inspection
+        finally:
+            _current.reset(token)
+
+    def report(self, request, inspection):
+        """Логирует повторяющиеся запросы; в строгом режиме падает."""
+        repeated = inspection.repeated()
+        if not repeated:
+            return
+        messages = []
+        for shape, count, field, stack in repeated:
+            source = f' из поля {field}' if field else ''
+            messages.append(
+                f'{count} одинаковых запросов{source}: {shape}\n{stack}'
+            )
+        message = (
+            f'{request.method} {request.path}: повторяющиеся запросы\n'
+            + '\n'.join(messages)
+        )
+        if settings.QUERY_INSPECTOR['STRICT']:
+            raise RepeatedQueriesError(message)
+        logger.warning(message)
@@ -0,0 +1,195 @@
+"""Token bucket для ограничения частоты запросов.
+
+Ведро на пару (класс маршрута, пользователь или IP) вмещает N токенов и
+пополняется со скоростью N за период. Запрос забирает cost токенов; если
+их не хватает, возвращается время ожидания для Retry-After.
+
+Хранилища:
+- local — словарь в памяти процесса без блокировок. Гонка двух потоков
+  может подарить лишний токен, но не заблокирует запрос зря.
+- shared — таблица вёдер в файле, отображённом в память (mmap), общая
+  для всех воркеров gunicorn на машине. Таблица разбита на наборы по
+  SHARED_WAYS ячеек, как кэш процессора: ключ живёт в одной из ячеек
+  своего набора, набор блокируется fcntl на время обновления. Внешние
+  сервисы не нужны.
+
+Новый ключ занимает пустую ячейку или ячейку, ведро которой уже
+пополнилось до конца: такое ведро ничем не отличается от нового, и
+полную ёмкость новый владелец получает честно. Если таких ячеек в наборе
+нет, вытесняется дольше всех не обновлявшееся ведро, и новый ключ
+наследует его заполненность, а не полное ведро: иначе два активных
+клиента, вытесняя друг друга, никогда не упирались бы в лимит.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LOCAL_MAX_KEYS = 100_000
+# Владелец (хэш ключа), токены, время обновления, ёмкость, скорость.
+SHARED_SLOT = struct.Struct('<Qdddd')
+SHARED_SETS = 1 << 13
+SHARED_WAYS = 8
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60): ёмкость ведра и период пополнения."""
+    number, _, period = rate.partition('/')
+    return int(number), PERIODS[period[0]]
+
+
+def refill(tokens, updated, now, capacity, per_second):
+    """Число токенов в ведре к моменту now."""
+    if updated > now:
+        return capacity
+    return min(capacity, tokens + (now - updated) * per_second)
+
+
+class LocalStore:
+    """Вёдра в словаре процесса."""
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self):
+        """Пустое хранилище."""
+        self.buckets = {}
+
+    def consume(self, key, cost, capacity, per_second):
+        """Забирает cost токенов; возвращает 0 или сколько секунд ждать."""
+        now = self.clock()
+        state = self.buckets.get(key)
+        if state is None:
+            if len(self.buckets) >= LOCAL_MAX_KEYS:
+                self.buckets.clear()
+            tokens = capacity
+        else:
+            tokens = refill(state[0], state[1], now, capacity, per_second)
+        if tokens < cost:
+            return (cost - tokens) / per_second
+        self.buckets[key] = (tokens - cost, now)
+        return 0
+
+
+class SharedStore:
+    """Вёдра в общем для процессов файле, отображённом в память."""
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, path, sets=SHARED_SETS, ways=SHARED_WAYS):
+        """Файл открывается при первом обращении в каждом процессе.
+
+        Разметка входит в имя файла: процессы с другой разметкой не читают
+        чужие ячейки.
+        """
+        self.sets = sets
+        self.ways = ways
+        self.set_size = SHARED_SLOT.size * ways
+        self.path = f'{path}-{SHARED_SLOT.size}-{sets}x{ways}'
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        """Открывает или создаёт файл вёдер."""
+        size = self.set_size * self.sets
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+        self.pid = os.getpid()
+
+    def find(self, base, digest, now):
+        """Ячейка ключа и токены в его ведре к моменту now.
+
+        Для нового ключа выбирает ячейку по правилам из описания модуля;
+        токены тогда — доля ёмкости, которую он получает (1.0 — полное
+        ведро).
+        """
+        victim = None
+        for way in range(self.ways):
+            offset = base + way * SHARED_SLOT.size
+            owner, tokens, updated, capacity, per_second = (
+                SHARED_SLOT.unpack_from(self.map, offset)
+            )
+            if owner == digest:
+                return offset, tokens, updated, False
+            if owner == 0 or capacity <= 0:
+                return offset, 1.0, now, True
+            level = refill(tokens, updated, now, capacity, per_second)
+            if level >= capacity:
+                return offset, 1.0, now, True
+            if victim is None or updated < victim[2]:
+                victim = (offset, level / capacity, updated)
+        return victim[0], victim[1], now, True
+
+    def consume(self, key, cost, capacity, per_second):
+        """Забирает cost токенов; возвращает 0 или сколько секунд ждать."""
+        digest = int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little'
+        ) or 1
+        base = digest % self.sets * self.set_size
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open()
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.set_size, base)
+            try:
+                now = self.clock()
+                offset, tokens, updated, new = self.find(base, digest, now)
+                if new:
+                    tokens *= capacity
+                else:
+                    tokens = refill(
+                        tokens, updated, now, capacity, per_second
+                    )
+                if tokens < cost:
+                    if new:
+                        # Ячейка занята под ключ и с неполным ведром.
+                        SHARED_SLOT.pack_into(
+                            self.map, offset, digest, tokens, now,
+                            capacity, per_second
+                        )
+                    return (cost - tokens) / per_second
+                SHARED_SLOT.pack_into(
+                    self.map, offset, digest, tokens - cost, now, capacity,
+                    per_second
+                )
+                return 0
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.set_size, base)
+
+
+class RateLimiter:
+    """Ограничитель частоты по классам маршрутов из settings.RATE_LIMITS."""
+
+    def __init__(self):
+        """Хранилище выбирается при первом обращении."""
+        self.store = None
+        self.rates = {}
+
+    def rate(self, scope):
+        """Ёмкость ведра и скорость пополнения для класса маршрута."""
+        rate = self.rates.get(scope)
+        if rate is None:
+            capacity, period = parse_rate(settings.RATE_LIMITS[scope])
+            rate = self.rates[scope] = (capacity, capacity / period)
+        return rate
+
+    def consume(self, scope, ident, cost=1):
+        """Забирает cost токенов; возвращает 0 или сколько секунд ждать."""
+        if self.store is None:
+            if settings.RATE_LIMIT_BACKEND == 'shared':
+                self.store = SharedStore(settings.RATE_LIMIT_FILE)
+            else:
+                self.store = LocalStore()
+        capacity, per_second = self.rate(scope)
+        return self.store.consume(
+            f'{scope}:{ident}', min(cost, capacity), capacity, per_second
+        )
+
+
+rate_limiter = RateLimiter()
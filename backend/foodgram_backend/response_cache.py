@@ -0,0 +1,81 @@
+"""Кэш данных ответов, одинаковых для всех анонимных клиентов.
+
+GET-запрос без заголовка Authorization видит те же данные, что и любой
+другой аноним, поэтому готовые данные ответа вместе с ETag кладутся в кэш
+по умолчанию. Ключ — полный URL запроса (схема и хост входят в ссылки
+ответа) и поколение данных. После коммита любого изменения рецептов,
+ингредиентов или профилей поколение увеличивается, и прежние записи больше
+не читаются.
+
+Поколение хранится в том же кэше. С локальным кэшем (LocMem) у каждого
+процесса оно своё, поэтому изменение, сделанное через один воркер, другие
+увидят не позже чем через RESPONSE_CACHE_TIMEOUT секунд.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+GENERATION_KEY = 'response:generation'
+
+
+def shared_request(request):
+    """Одинаков ли ответ на запрос для всех анонимных клиентов."""
+    return (
+        request.method in ('GET', 'HEAD')
+        and 'HTTP_AUTHORIZATION' not in request.META
+    )
+
+
+def entry_key(request, generation, path=None):
+    """Ключ записи кэша для URL запроса или другого пути на том же хосте."""
+    url = request.build_absolute_uri(path).encode()
+    return f'response:{generation}:{hashlib.sha1(url).hexdigest()}'
+
+
+def current_generation():
+    """Текущее поколение данных."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Отсчёт от текущего времени: если ключ вытеснят из кэша, поколение
+        # не вернётся к значению, под которым ещё лежат старые записи.
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def response_key(request):
+    """Ключ записи для общего запроса или None для личного."""
+    if not shared_request(request):
+        return None
+    return entry_key(request, current_generation())
+
+
+def response_keys(request, paths):
+    """Ключи записей для GET по путям paths или None для личного запроса.
+
+    Так составной ответ читает и пополняет записи отдельных объектов.
+    """
+    if not shared_request(request):
+        return None
+    generation = current_generation()
+    return [entry_key(request, generation, path) for path in paths]
+
+
+async def aresponse_key(request):
+    """Асинхронный вариант response_key."""
+    if not shared_request(request):
+        return None
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), None)
+        generation = await cache.aget(GENERATION_KEY)
+    return entry_key(request, generation)
+
+
+def bump_generation():
+    """Делает недействительными все закэшированные ответы."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -28,6 +30,8 @@ SECRET_KEY = os.getenv(
 
 DEBUG = os.environ.get('DJANGO_DEBUG', 'True').lower() != 'false'
 
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 if DEBUG:
     ALLOWED_HOSTS = [
         '192.168.99.100',
@@ -65,7 +69,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "foodgram_backend.metrics.MetricsMiddleware",
+    "foodgram_backend.query_inspector.QueryInspectorMiddleware",
+    "foodgram_backend.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "foodgram_backend.db_router.ReplicaStickinessMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -93,6 +101,91 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "foodgram_backend.wsgi.application"
 
+# Per-request metrics (foodgram_backend.metrics). A background thread in
+# every worker flushes its aggregates to METRICS_DIR each
+# METRICS_FLUSH_INTERVAL seconds, the /metrics/ endpoint merges them.
+METRICS_DIR = os.getenv(
+    'DJANGO_METRICS_DIR',
+    os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+)
+METRICS_FLUSH_INTERVAL = 1
+# /metrics/ is served with "Authorization: Bearer $DJANGO_METRICS_TOKEN"
+# when the token is set, otherwise only to clients from
+# DJANGO_METRICS_ALLOWED_NETWORKS (loopback and private networks, i.e. a
+# scraper next to the backend; nginx does not proxy /metrics/).
+METRICS_TOKEN = os.getenv('DJANGO_METRICS_TOKEN', '')
+METRICS_ALLOWED_NETWORKS = [
+    network.strip() for network in os.getenv(
+        'DJANGO_METRICS_ALLOWED_NETWORKS',
+        '127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16'
+    ).split(',') if network.strip()
+]
+
+# N+1 and slow query detection (foodgram_backend.query_inspector). Enabled
+# in DEBUG and in test runs; in tests repeated queries raise an error.
+QUERY_INSPECTOR = {
+    'ENABLED': DEBUG or TESTING,
+    'STRICT': TESTING or os.getenv(
+        'DJANGO_QUERY_INSPECTOR_STRICT', 'False'
+    ).lower() == 'true',
+    'REPEAT_THRESHOLD': int(os.getenv('DJANGO_QUERY_REPEAT_THRESHOLD', 5)),
+    'SLOW_QUERY_MS': int(os.getenv('DJANGO_SLOW_QUERY_MS', 100)),
+}
+
+# Token bucket rate limits per route class (foodgram_backend.ratelimit).
+# 'local' keeps buckets per process; 'shared' keeps them in an mmap file
+# shared by all workers on the host.
+RATE_LIMIT_BACKEND = os.getenv('DJANGO_RATE_LIMIT_BACKEND', 'local')
+RATE_LIMIT_FILE = os.getenv(
+    'DJANGO_RATE_LIMIT_FILE',
+    os.path.join(tempfile.gettempdir(), 'foodgram-ratelimit')
+)
+RATE_LIMITS = {
+    'shopping_list': os.getenv('DJANGO_RATE_SHOPPING_LIST', '10/min'),
+    'recipe_write': os.getenv('DJANGO_RATE_RECIPE_WRITE', '30/min'),
+    'list': os.getenv('DJANGO_RATE_LIST', '600/min'),
+    'recipe_stream': os.getenv('DJANGO_RATE_RECIPE_STREAM', '6/hour'),
+    # Counted per sub-request of /api/batch/; sub-requests to lists, writes
+    # and the shopping list also pay their own route class.
+    'batch': os.getenv('DJANGO_RATE_BATCH', '600/min'),
+}
+
+# Cache of responses shared by all anonymous clients
+# (foodgram_backend.response_cache). The default 'shared' backend
+# (foodgram_backend.shared_cache) keeps one copy per host in an mmap file
+# used by every worker; 'local' falls back to a per-process LocMemCache.
+# The warm_cache command fills it, and with DJANGO_WARM_CACHE_URL set
+# gunicorn also runs the warm-up in the master before forking workers.
+# The file name includes a fingerprint of the deployed code, so a new
+# release never serves entries rendered by the old one; set
+# DJANGO_CACHE_FINGERPRINT (e.g. to the image tag) to skip hashing sources.
+CACHE_BACKEND = os.getenv('DJANGO_CACHE_BACKEND', 'shared')
+CACHES = {
+    'default': {
+        'BACKEND': (
+            'foodgram_backend.shared_cache.SharedMemoryCache'
+            if CACHE_BACKEND == 'shared'
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv(
+            'DJANGO_CACHE_FILE',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cache')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('DJANGO_CACHE_MAX_ENTRIES', 10000)),
+            'SIZE': int(os.getenv('DJANGO_CACHE_SIZE_MB', 64)) * 1024 * 1024,
+            'FINGERPRINT': os.getenv('DJANGO_CACHE_FINGERPRINT', ''),
+        },
+    },
+}
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('DJANGO_RESPONSE_CACHE_TIMEOUT', 60))
+WARM_CACHE_URL = os.getenv('DJANGO_WARM_CACHE_URL', '')
+
+# Async implementations of hot read endpoints (api.async_views). Enabled by
+# foodgram_backend.asgi; under WSGI every async view would need its own
+# event loop, so the plain DRF views are used instead.
+ASYNC_READ_VIEWS = os.getenv('DJANGO_ASYNC_VIEWS', 'False').lower() == 'true'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -116,6 +209,39 @@ else:
         }
     }
 
+# Read replicas. Safe requests read from a random replica, writes and
+# reads after a client's write go to "default" for REPLICA_STICKY_SECONDS.
+# The pin is a signed cookie on the client, so it holds on every worker and
+# every host behind the load balancer.
+# Locally DJANGO_SQLITE_REPLICA=True adds a "replica" alias pointing to the
+# same SQLite file, so routing can be exercised with two aliases.
+
+DATABASE_REPLICAS = []
+
+if DEBUG:
+    if os.getenv('DJANGO_SQLITE_REPLICA', 'False').lower() == 'true':
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_REPLICAS.append('replica')
+else:
+    _replica_hosts_env = os.getenv('POSTGRES_REPLICA_HOSTS', '')
+    for _index, _host in enumerate(
+        host.strip() for host in _replica_hosts_env.split(',')
+        if host.strip()
+    ):
+        DATABASES[f'replica_{_index}'] = {
+            **DATABASES['default'],
+            'HOST': _host,
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_REPLICAS.append(f'replica_{_index}')
+
+DATABASE_ROUTERS = ['foodgram_backend.db_router.PrimaryReplicaRouter']
+
+REPLICA_STICKY_SECONDS = int(os.getenv('DJANGO_REPLICA_STICKY_SECONDS', 15))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -168,6 +294,13 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
 
+# Anonymous throttling keys on the client address. Only the last
+# DJANGO_NUM_PROXIES entries of X-Forwarded-For are trusted: nginx
+# (infra/nginx.conf) appends $remote_addr, so with one proxy in front the
+# address cannot be spoofed by a client-sent header. Set to 0 when the
+# backend is exposed directly.
+NUM_PROXIES = int(os.getenv('DJANGO_NUM_PROXIES', 1))
+
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS":
         "rest_framework.pagination.PageNumberPagination",
@@ -175,9 +308,14 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.TokenAuthentication",
     ],
+    "NUM_PROXIES": NUM_PROXIES,
 }
 
 DJOSER = {
@@ -0,0 +1,380 @@
+"""Кэш Django в файле, отображённом в память и общем для воркеров.
+
+Все процессы на машине работают с одним экземпляром кэша: кэш ответов,
+сжатые тела и поколение данных хранятся в одной копии на хост, без
+отдельного сервиса.
+
+Файл делится на полосы одинакового размера. Полоса выбирается по хэшу
+ключа и блокируется отдельно (fcntl между процессами, threading.Lock между
+потоками), поэтому запросы к разным полосам не ждут друг друга. В полосе
+лежат каталог записей и область данных. Каталог разбит на наборы по WAYS
+ячеек, как кэш процессора: ключ может занять только ячейку своего набора,
+при нехватке заменяется пустая, просроченная или дольше всех не читавшаяся
+запись. Данные дописываются подряд; когда место кончается, полоса
+уплотняется: просроченные записи выбрасываются, самые давно читавшиеся
+вытесняются, остальные сдвигаются к началу.
+
+Значения bytes хранятся без pickle и при чтении копируются из полосы
+один раз: после снятия блокировки уплотнение может сдвинуть данные, так
+что отдавать память файла наружу нельзя. Остальные значения pickle
+распаковывает прямо из отображённой памяти, без промежуточной копии.
+
+Нулевой файл — пустой кэш, поэтому отдельная разметка не нужна. Параметры
+разметки и отпечаток кода входят в имя файла: процессы с разными
+настройками не делят один файл, а после выкладки новой версии кэш
+начинается заново. Каждый процесс держит на своём файле разделяемый flock
+и при подключении удаляет файлы других версий, которые никто не держит:
+во время постепенной выкладки файлы работающих версий остаются на месте.
+"""
+import fcntl
+import glob
+import hashlib
+import math
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+DEFAULT_SIZE = 64 * 1024 * 1024
+DEFAULT_STRIPES = 32
+WAYS = 8
+# Занятая часть области данных полосы.
+STRIPE_HEADER = struct.Struct('<Q')
+# Хэш ключа, смещение, длина ключа, длина значения, формат, срок, чтение.
+ENTRY = struct.Struct('<QIIIIdd')
+TIME = struct.Struct('<d')
+EXPIRES_OFFSET = struct.calcsize('<QIIII')
+ACCESSED_OFFSET = EXPIRES_OFFSET + TIME.size
+RAW, PICKLED = 1, 2
+NEVER = 0.0
+FINGERPRINT_LENGTH = 12
+
+
+@lru_cache(maxsize=None)
+def code_fingerprint(root):
+    """Хэш исходников проекта: меняется с каждой выкладкой нового кода."""
+    digest = hashlib.blake2b(digest_size=FINGERPRINT_LENGTH // 2)
+    for path in sorted(glob.glob(
+        os.path.join(glob.escape(root), '**', '*.py'), recursive=True
+    )):
+        digest.update(os.path.relpath(path, root).encode())
+        with open(path, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+class SharedMemoryCache(BaseCache):
+    """Кэш в общем для процессов файле с полосами блокировок и LRU."""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        """Разметка по OPTIONS: SIZE, STRIPES, MAX_ENTRIES и FINGERPRINT.
+
+        FINGERPRINT — версия выкладки; по умолчанию хэш кода в BASE_DIR.
+        """
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.size = int(options.get('SIZE', DEFAULT_SIZE))
+        self.stripes = int(options.get('STRIPES', DEFAULT_STRIPES))
+        self.sets = max(math.ceil(self._max_entries / self.stripes / WAYS), 1)
+        self.entries = self.sets * WAYS
+        self.stripe_size = self.size // self.stripes
+        self.capacity = (
+            self.stripe_size - STRIPE_HEADER.size - self.entries * ENTRY.size
+        )
+        if self.capacity <= 0:
+            raise ImproperlyConfigured(
+                'SIZE слишком мал для STRIPES и MAX_ENTRIES кэша.'
+            )
+        fingerprint = options.get('FINGERPRINT') or code_fingerprint(
+            str(settings.BASE_DIR)
+        )
+        self.location = location
+        self.path = (
+            f'{location}-{self.size}-{self.stripes}-{self.entries}-'
+            f'{fingerprint}'
+        )
+        self.pid = None
+        self.attach_lock = threading.Lock()
+
+    def attach(self):
+        """Отображает файл в память текущего процесса."""
+        with self.attach_lock:
+            if self.pid == os.getpid():
+                return
+            while True:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                if os.fstat(fd).st_nlink:
+                    break
+                # Файл удалили между open и flock: он больше не общий.
+                os.close(fd)
+            self.remove_stale()
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self.fd = fd
+            self.map = mmap.mmap(fd, self.size)
+            self.view = memoryview(self.map)
+            self.locks = [threading.Lock() for _ in range(self.stripes)]
+            self.pid = os.getpid()
+
+    def remove_stale(self):
+        """Удаляет файлы других версий и настроек, которые никто не держит.
+
+        Файл, на котором есть разделяемый flock живого процесса, остаётся:
+        старые воркеры во время выкладки продолжают делить свой кэш.
+        """
+        for path in glob.glob(f'{glob.escape(self.location)}-*'):
+            if path == self.path:
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                pass
+            else:
+                # Под блокировкой: новый процесс, открывший файл раньше
+                # удаления, увидит st_nlink == 0 и переоткроет свой.
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            finally:
+                os.close(fd)
+
+    @contextmanager
+    def stripe(self, index):
+        """Блокирует полосу; отдаёт смещение её начала."""
+        if self.pid != os.getpid():
+            self.attach()
+        base = index * self.stripe_size
+        with self.locks[index]:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, base)
+            try:
+                yield base
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, base)
+
+    def locate(self, key, version):
+        """Ключ в байтах, его хэш, номер полосы и первая ячейка набора."""
+        key = self.make_and_validate_key(key, version=version).encode()
+        digest = int.from_bytes(
+            hashlib.blake2b(key, digest_size=8).digest(), 'little'
+        ) or 1
+        index = digest % self.stripes
+        first = digest // self.stripes % self.sets * WAYS
+        return key, digest, index, first
+
+    def entry_offset(self, base, slot):
+        """Смещение ячейки каталога."""
+        return base + STRIPE_HEADER.size + slot * ENTRY.size
+
+    def data_offset(self, base):
+        """Смещение области данных полосы."""
+        return base + STRIPE_HEADER.size + self.entries * ENTRY.size
+
+    def find(self, base, key, digest, first, now):
+        """Ячейка с живой записью ключа и её поля или (None, None)."""
+        data = self.data_offset(base)
+        for slot in range(first, first + WAYS):
+            entry = ENTRY.unpack_from(self.map, self.entry_offset(base, slot))
+            if entry[0] != digest:
+                continue
+            start = data + entry[1]
+            if self.view[start:start + entry[2]] != key:
+                continue
+            if entry[5] != NEVER and entry[5] <= now:
+                self.free(base, slot)
+                return None, None
+            return slot, entry
+        return None, None
+
+    def free(self, base, slot):
+        """Освобождает ячейку; место в данных вернёт уплотнение."""
+        ENTRY.pack_into(
+            self.map, self.entry_offset(base, slot), 0, 0, 0, 0, 0, 0, 0
+        )
+
+    def read(self, base, entry):
+        """Значение записи; bytes — копия, память файла наружу не уходит."""
+        start = self.data_offset(base) + entry[1] + entry[2]
+        value = self.view[start:start + entry[3]]
+        if entry[4] == RAW:
+            return bytes(value)
+        return pickle.loads(value)
+
+    def victim(self, base, first, now):
+        """Ячейка набора под новую запись: пустая, просроченная или LRU."""
+        candidates = []
+        for slot in range(first, first + WAYS):
+            entry = ENTRY.unpack_from(self.map, self.entry_offset(base, slot))
+            if entry[0] == 0 or entry[5] != NEVER and entry[5] <= now:
+                return slot
+            candidates.append((entry[6], slot))
+        return min(candidates)[1]
+
+    def compact(self, base, need, now):
+        """Освобождает need байт в области данных; возвращает занятое."""
+        live = []
+        for slot in range(self.entries):
+            entry = ENTRY.unpack_from(self.map, self.entry_offset(base, slot))
+            if entry[0] == 0:
+                continue
+            if entry[5] != NEVER and entry[5] <= now:
+                self.free(base, slot)
+                continue
+            live.append((entry[6], slot, entry))
+        live.sort(reverse=True)
+        kept = []
+        budget = self.capacity - need
+        for _, slot, entry in live:
+            size = entry[2] + entry[3]
+            if size > budget:
+                # Эта и все более давние записи вытесняются.
+                budget = 0
+                self.free(base, slot)
+                continue
+            kept.append((entry[1], slot, entry))
+            budget -= size
+        # Записи сдвигаются только к началу, поэтому move их не затирает.
+        kept.sort()
+        data = self.data_offset(base)
+        used = 0
+        for offset, slot, entry in kept:
+            size = entry[2] + entry[3]
+            if offset != used:
+                self.map.move(data + used, data + offset, size)
+                ENTRY.pack_into(
+                    self.map, self.entry_offset(base, slot),
+                    entry[0], used, *entry[2:]
+                )
+            used += size
+        return used
+
+    def store(self, base, key, digest, first, value, expires, now):
+        """Записывает значение в полосу; False, если оно не помещается."""
+        if isinstance(value, bytes):
+            flags, payload = RAW, value
+        else:
+            flags, payload = PICKLED, pickle.dumps(
+                value, self.pickle_protocol
+            )
+        need = len(key) + len(payload)
+        slot, _ = self.find(base, key, digest, first, now)
+        if slot is None:
+            slot = self.victim(base, first, now)
+        self.free(base, slot)
+        if need > self.capacity:
+            return False
+        used = STRIPE_HEADER.unpack_from(self.map, base)[0]
+        if used + need > self.capacity:
+            used = self.compact(base, need, now)
+        start = self.data_offset(base) + used
+        self.map[start:start + len(key)] = key
+        self.map[start + len(key):start + need] = payload
+        ENTRY.pack_into(
+            self.map, self.entry_offset(base, slot), digest, used, len(key),
+            len(payload), flags, expires, now
+        )
+        STRIPE_HEADER.pack_into(self.map, base, used + need)
+        return True
+
+    def expiry(self, timeout):
+        """Абсолютный срок записи; NEVER — бессрочно."""
+        expires = self.get_backend_timeout(timeout)
+        return NEVER if expires is None else expires
+
+    def get(self, key, default=None, version=None):
+        """Значение ключа или default."""
+        key, digest, index, first = self.locate(key, version)
+        with self.stripe(index) as base:
+            now = time.time()
+            slot, entry = self.find(base, key, digest, first, now)
+            if slot is None:
+                return default
+            TIME.pack_into(
+                self.map, self.entry_offset(base, slot) + ACCESSED_OFFSET, now
+            )
+            return self.read(base, entry)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Сохраняет значение."""
+        key, digest, index, first = self.locate(key, version)
+        with self.stripe(index) as base:
+            self.store(
+                base, key, digest, first, value, self.expiry(timeout),
+                time.time()
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Сохраняет значение, если ключа ещё нет."""
+        key, digest, index, first = self.locate(key, version)
+        with self.stripe(index) as base:
+            now = time.time()
+            if self.find(base, key, digest, first, now)[0] is not None:
+                return False
+            return self.store(
+                base, key, digest, first, value, self.expiry(timeout), now
+            )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        """Продлевает срок записи."""
+        key, digest, index, first = self.locate(key, version)
+        with self.stripe(index) as base:
+            slot, _ = self.find(base, key, digest, first, time.time())
+            if slot is None:
+                return False
+            TIME.pack_into(
+                self.map, self.entry_offset(base, slot) + EXPIRES_OFFSET,
+                self.expiry(timeout)
+            )
+            return True
+
+    def delete(self, key, version=None):
+        """Удаляет запись."""
+        key, digest, index, first = self.locate(key, version)
+        with self.stripe(index) as base:
+            slot, _ = self.find(base, key, digest, first, time.time())
+            if slot is None:
+                return False
+            self.free(base, slot)
+            return True
+
+    def has_key(self, key, version=None):
+        """Есть ли живая запись ключа."""
+        key, digest, index, first = self.locate(key, version)
+        with self.stripe(index) as base:
+            return self.find(
+                base, key, digest, first, time.time()
+            )[0] is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно увеличивает число в записи."""
+        key_bytes, digest, index, first = self.locate(key, version)
+        with self.stripe(index) as base:
+            now = time.time()
+            slot, entry = self.find(base, key_bytes, digest, first, now)
+            if slot is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self.read(base, entry) + delta
+            self.store(base, key_bytes, digest, first, value, entry[5], now)
+            return value
+
+    def clear(self):
+        """Удаляет все записи."""
+        empty = bytes(STRIPE_HEADER.size + self.entries * ENTRY.size)
+        for index in range(self.stripes):
+            with self.stripe(index) as base:
+                self.map[base:base + len(empty)] = empty
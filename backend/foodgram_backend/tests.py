@@ -0,0 +1,377 @@
+"""Тесты инфраструктуры: маршрутизация баз, лимиты, кэш и метрики."""
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+from unittest import mock
+
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .db_router import (
+    PRIMARY_DB, STICKY_COOKIE, ReplicaStickinessMiddleware,
+    sub_request_routing
+)
+from .metrics import (
+    AGGREGATE_FILE, Registry, RequestMetrics, fold_worker, metrics_view
+)
+from .ratelimit import SharedStore
+from .shared_cache import SharedMemoryCache
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=15)
+class ReplicaStickinessTests(SimpleTestCase):
+    """Чтения после записи клиента идут на основную базу."""
+
+    def setUp(self):
+        """Middleware, которое записывает базу чтения каждого запроса."""
+        self.factory = RequestFactory()
+        self.read_from = []
+
+        def view(request):
+            if request.method not in ('GET', 'HEAD'):
+                router.db_for_write(None)
+            self.read_from.append(router.db_for_read(None))
+            return HttpResponse()
+
+        self.middleware = ReplicaStickinessMiddleware(view)
+
+    def get(self, cookies=None):
+        """GET-запрос с куками; возвращает базу, с которой он читал."""
+        request = self.factory.get('/api/recipes/')
+        request.COOKIES.update(cookies or {})
+        self.middleware(request)
+        return self.read_from[-1]
+
+    def test_get_after_post_reads_primary(self):
+        """GET сразу после записи читает основную базу."""
+        response = self.middleware(self.factory.post('/api/recipes/'))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(
+            self.get({STICKY_COOKIE: response.cookies[STICKY_COOKIE].value}),
+            PRIMARY_DB
+        )
+
+    def test_get_without_write_reads_replica(self):
+        """Без отметки о записи чтение идёт на реплику и куки нет."""
+        request = self.factory.get('/api/recipes/')
+        response = self.middleware(request)
+        self.assertEqual(self.read_from[-1], REPLICA)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_forged_cookie_is_ignored(self):
+        """Неподписанная отметка не закрепляет клиента."""
+        self.assertEqual(self.get({STICKY_COOKIE: '1'}), REPLICA)
+
+    def test_expired_cookie_is_ignored(self):
+        """Отметка старше REPLICA_STICKY_SECONDS не действует."""
+        response = self.middleware(self.factory.post('/api/recipes/'))
+        cookie = response.cookies[STICKY_COOKIE].value
+        with override_settings(REPLICA_STICKY_SECONDS=-1):
+            self.assertEqual(self.get({STICKY_COOKIE: cookie}), REPLICA)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=15)
+class BatchRoutingTests(SimpleTestCase):
+    """Вложенные запросы пакета выбирают базу по своему методу."""
+
+    def setUp(self):
+        """Пакет: POST, вложенные запросы которого записывают базы чтения."""
+        self.factory = RequestFactory()
+        self.items = []
+        self.read_from = []
+
+        def view(request):
+            for method, writes in self.items:
+                with sub_request_routing(method):
+                    if writes:
+                        router.db_for_write(None)
+                    self.read_from.append(router.db_for_read(None))
+            return HttpResponse()
+
+        self.middleware = ReplicaStickinessMiddleware(view)
+
+    def batch(self, *items, cookies=None):
+        """Выполняет пакет; возвращает ответ."""
+        self.items = items
+        request = self.factory.post('/api/batch/')
+        request.COOKIES.update(cookies or {})
+        return self.middleware(request)
+
+    def test_safe_sub_requests_read_replica(self):
+        """GET внутри POST-пакета читает реплику и не закрепляет клиента."""
+        response = self.batch(('GET', False), ('GET', False))
+        self.assertEqual(self.read_from, [REPLICA, REPLICA])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_write_pins_following_sub_requests(self):
+        """После записи вложенного запроса пакет и клиент читают primary."""
+        response = self.batch(
+            ('GET', False), ('POST', True), ('GET', False)
+        )
+        self.assertEqual(self.read_from, [REPLICA, PRIMARY_DB, PRIMARY_DB])
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+    def test_unsafe_sub_request_without_write_does_not_pin(self):
+        """Отклонённый POST читает primary, но не закрепляет клиента."""
+        response = self.batch(('POST', False), ('GET', False))
+        self.assertEqual(self.read_from, [PRIMARY_DB, REPLICA])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_pinned_client_reads_primary(self):
+        """Закреплённый клиент читает primary и в пакете."""
+        cookie = self.batch(('POST', True)).cookies[STICKY_COOKIE].value
+        self.read_from.clear()
+        self.batch(('GET', False), cookies={STICKY_COOKIE: cookie})
+        self.assertEqual(self.read_from, [PRIMARY_DB])
+
+
+class SharedStoreTests(SimpleTestCase):
+    """Вёдра в общем файле: коллизии, вытеснение и общий доступ."""
+
+    capacity = 3
+    per_second = 1.0
+
+    def setUp(self):
+        """Хранилище из одного набора на две ячейки и ручные часы."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = SharedStore(
+            os.path.join(directory.name, 'ratelimit'), sets=1, ways=2
+        )
+        self.now = 1000.0
+        self.store.clock = lambda: self.now
+
+    def consume(self, key, cost=1):
+        """Забирает токены ведра key."""
+        return self.store.consume(key, cost, self.capacity, self.per_second)
+
+    def drain(self, key):
+        """Опустошает ведро key."""
+        for _ in range(self.capacity):
+            self.assertEqual(self.consume(key), 0)
+
+    def test_bucket_limits_and_refills(self):
+        """Пустое ведро даёт время ожидания и пополняется со временем."""
+        self.drain('a')
+        self.assertAlmostEqual(self.consume('a'), 1.0)
+        self.now += 1
+        self.assertEqual(self.consume('a'), 0)
+
+    def test_keys_of_one_set_do_not_refill_each_other(self):
+        """Два ключа в одном наборе ограничиваются независимо."""
+        self.drain('a')
+        self.drain('b')
+        self.assertGreater(self.consume('a'), 0)
+        self.assertGreater(self.consume('b'), 0)
+
+    def test_evicting_live_bucket_inherits_its_level(self):
+        """Вытеснивший живое ведро ключ не получает полное ведро."""
+        self.drain('a')
+        self.drain('b')
+        self.assertGreater(self.consume('c'), 0)
+
+    def test_full_bucket_is_replaced_with_full_capacity(self):
+        """Пополнившееся ведро уступает ячейку новому полному ведру."""
+        self.drain('a')
+        self.drain('b')
+        self.now += self.capacity / self.per_second
+        self.drain('c')
+
+    def test_buckets_are_shared_between_processes(self):
+        """Токены, забранные в другом процессе, видны в этом."""
+        self.consume('a')
+        context = multiprocessing.get_context('fork')
+        process = context.Process(target=self.drain_rest, args=('a',))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        self.assertGreater(self.consume('a'), 0)
+
+    def drain_rest(self, key):
+        """Забирает оставшиеся токены ведра в дочернем процессе."""
+        for _ in range(self.capacity - 1):
+            if self.consume(key):
+                os._exit(1)
+        os._exit(0)
+
+
+class MetricsTests(SimpleTestCase):
+    """Сброс метрик процесса и их сбор со всех воркеров."""
+
+    def setUp(self):
+        """Пустой каталог метрик на время теста."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(
+            METRICS_DIR=self.directory, METRICS_TOKEN='secret'
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def worker_file(self, pid, requests):
+        """Файл метрик воркера с requests ответами 200 маршрута test."""
+        registry = Registry()
+        with mock.patch.object(registry, 'start_flusher'):
+            for _ in range(requests):
+                registry.record('test', 200, 0.02, RequestMetrics())
+        with open(os.path.join(self.directory, f'{pid}.json'), 'w') as file:
+            json.dump(registry.snapshot(), file)
+
+    def dead_pid(self):
+        """PID процесса, который уже завершился."""
+        process = multiprocessing.get_context('fork').Process(
+            target=os._exit, args=(0,)
+        )
+        process.start()
+        process.join()
+        return process.pid
+
+    def scrape(self, token='secret'):
+        """Ответ /metrics/ с токеном."""
+        request = RequestFactory().get(
+            '/metrics/', HTTP_AUTHORIZATION=f'Bearer {token}'
+        )
+        return metrics_view(request)
+
+    def test_record_does_not_write_file(self):
+        """Запрос только запускает поток сброса, файл пишет он."""
+        registry = Registry()
+        with mock.patch('foodgram_backend.metrics.threading.Thread') as thread:
+            for _ in range(3):
+                registry.record('test', 200, 0.02, RequestMetrics())
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once_with()
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertTrue(registry.dirty)
+        registry.flush()
+        self.assertFalse(registry.dirty)
+        self.assertEqual(
+            os.listdir(self.directory), [f'{os.getpid()}.json']
+        )
+
+    def test_endpoint_sums_live_and_finished_workers(self):
+        """Живые воркеры читаются, завершившиеся переносятся в итог."""
+        dead = self.dead_pid()
+        self.worker_file(dead, 2)
+        self.worker_file(os.getppid(), 3)
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'foodgram_requests_total{route="test",status="200"} 5',
+            response.content.decode().splitlines()
+        )
+        self.assertIn(
+            'foodgram_request_duration_seconds_bucket'
+            '{route="test",le="0.025"} 5',
+            response.content.decode()
+        )
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted(['.lock', AGGREGATE_FILE, f'{os.getppid()}.json'])
+        )
+        self.assertEqual(self.scrape(token='wrong').status_code, 403)
+
+    def test_fold_adds_to_aggregate(self):
+        """Итог растёт с каждым завершившимся воркером."""
+        for pid in (self.dead_pid(), self.dead_pid()):
+            self.worker_file(pid, 2)
+            fold_worker(pid, self.directory)
+        with open(os.path.join(self.directory, AGGREGATE_FILE)) as file:
+            aggregate = json.load(file)
+        self.assertEqual(aggregate['test']['statuses'], {'200': 4})
+        self.assertEqual(aggregate['test']['latency']['count'], 4)
+
+
+class SharedMemoryCacheTests(SimpleTestCase):
+    """Кэш в общем файле: доступ из процессов, вытеснение, версии."""
+
+    def setUp(self):
+        """Каталог для файлов кэша."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache')
+
+    def cache(self, fingerprint='new', **options):
+        """Кэш на 1 МБ в одной полосе из одного набора."""
+        cache = SharedMemoryCache(self.location, {'OPTIONS': {
+            'SIZE': 1024 * 1024, 'STRIPES': 1, 'MAX_ENTRIES': 8,
+            'FINGERPRINT': fingerprint, **options
+        }})
+        self.addCleanup(self.detach, cache)
+        return cache
+
+    def detach(self, cache):
+        """Закрывает файл кэша, как при завершении процесса.
+
+        mmap держит свою копию дескриптора, поэтому закрывается и он.
+        """
+        if cache.pid is None:
+            return
+        cache.view.release()
+        cache.map.close()
+        os.close(cache.fd)
+        cache.pid = None
+
+    def files(self):
+        """Версии, у которых есть файл кэша."""
+        return sorted(
+            name.rsplit('-', 1)[1]
+            for name in os.listdir(os.path.dirname(self.location))
+        )
+
+    def test_values_are_shared_between_processes(self):
+        """Запись одного процесса читается другим, и обратно."""
+        cache = self.cache()
+        cache.set('parent', {'value': 1})
+        process = multiprocessing.get_context('fork').Process(
+            target=self.child, args=(cache,)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(cache.get('child'), b'raw')
+        self.assertEqual(cache.incr('counter'), 2)
+
+    def child(self, cache):
+        """Читает запись родителя и пишет свои."""
+        if cache.get('parent') != {'value': 1}:
+            os._exit(1)
+        cache.set('child', b'raw')
+        cache.set('counter', 1)
+        os._exit(0)
+
+    def test_least_recently_read_entry_is_evicted(self):
+        """Новая запись в полном наборе вытесняет давно не читавшуюся."""
+        cache = self.cache()
+        clock = itertools.count(1000)
+        with mock.patch(
+            'foodgram_backend.shared_cache.time.time',
+            side_effect=lambda: next(clock)
+        ):
+            for number in range(8):
+                cache.set(f'key{number}', number)
+            cache.get('key0')
+            cache.set('key8', 8)
+            self.assertEqual(cache.get('key0'), 0)
+            self.assertIsNone(cache.get('key1'))
+            self.assertEqual(cache.get('key8'), 8)
+
+    def test_files_in_use_survive_other_versions(self):
+        """Файл работающей версии не удаляется, брошенный — удаляется."""
+        old = self.cache('old')
+        old.set('key', 'old')
+        with open(f'{self.location}-abandoned', 'w'):
+            pass
+        new = self.cache('new')
+        new.set('key', 'new')
+        self.assertEqual(self.files(), ['new', 'old'])
+        self.assertEqual(old.get('key'), 'old')
+        self.detach(old)
+        self.cache('new').get('key')
+        self.assertEqual(self.files(), ['new'])
@@ -18,12 +18,20 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from api.async_views import short_link_redirect
 from api.views import short_url_redirect
+from foodgram_backend.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    path('s/<int:recipe_pk>/', short_url_redirect, name='short_url_redirect')
+    path('metrics/', metrics_view, name='metrics'),
+    path(
+        's/<int:recipe_pk>/',
+        short_link_redirect if settings.ASYNC_READ_VIEWS
+        else short_url_redirect,
+        name='short_url_redirect'
+    )
 ]
 
 if settings.DEBUG:
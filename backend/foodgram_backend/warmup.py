@@ -0,0 +1,51 @@
+"""Прогрев приложения перед приёмом запросов."""
+import logging
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_process():
+    """Заполняет общие для всех воркеров кеши.
+
+    Вызывается в мастер-процессе gunicorn после загрузки приложения, до
+    fork: всё построенное здесь достаётся воркерам через copy-on-write.
+    Если задан WARM_CACHE_URL, здесь же заполняется кэш ответов. Соединения
+    с базой в конце закрываются, их нельзя делить между процессами.
+    """
+    from api.serializers import (
+        IngredientSerializer, RecipeCreateUpdateSerializer, RecipeSerializer,
+        SubscriptionListSerializer, UserSerializer
+    )
+    from recipes.ingredient_index import ingredient_index
+
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for serializer_class in (
+        RecipeSerializer, RecipeCreateUpdateSerializer, UserSerializer,
+        SubscriptionListSerializer, IngredientSerializer
+    ):
+        serializer_class().fields
+    try:
+        ingredient_index.rebuild()
+    except Exception:
+        logger.exception('Не удалось построить индекс ингредиентов.')
+    try:
+        if settings.WARM_CACHE_URL:
+            call_command('warm_cache', verbosity=0)
+    except Exception:
+        logger.exception('Не удалось прогреть кэш ответов.')
+    finally:
+        connections.close_all()
+
+
+def warm_up_worker():
+    """Открывает соединение с базой в только что созданном воркере."""
+    try:
+        connections['default'].ensure_connection()
+    except Exception:
+        logger.exception('Не удалось подключиться к базе данных.')
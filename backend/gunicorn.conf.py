@@ -0,0 +1,116 @@
+"""Конфигурация gunicorn для продакшена (WSGI).
+
+gunicorn подхватывает этот файл автоматически из рабочей директории.
+Приложение загружается в мастер-процессе (preload) и прогревается там,
+поэтому код и справочные данные делятся между воркерами через
+copy-on-write. Воркеры перезапускаются после max_requests запросов, чтобы
+ограничить рост памяти.
+
+Число потоков на воркер выводится из числа CPU и памяти:
+
+    threads = ceil(4 * CPU / workers)
+    threads <= (память / workers - GUNICORN_WORKER_MEMORY_MB)
+               / GUNICORN_THREAD_MEMORY_MB
+
+Запрос к API большую часть времени ждёт базу, поэтому на ядро приходится
+около четырёх одновременных запросов; каждый поток добавляет воркеру своё
+соединение с базой и буферы запроса. GUNICORN_THREADS задаёт число
+потоков явно.
+"""
+import math
+import multiprocessing
+import os
+
+
+def memory_limit_mb():
+    """Лимит памяти контейнера (cgroup) или объём памяти хоста в МБ."""
+    for path in ('/sys/fs/cgroup/memory.max',
+                 '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as limit_file:
+                value = limit_file.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_workers():
+    """2 * CPU + 1 воркеров, но не больше, чем помещается в память."""
+    workers = multiprocessing.cpu_count() * 2 + 1
+    memory = memory_limit_mb()
+    per_worker = int(os.getenv('GUNICORN_WORKER_MEMORY_MB', 150))
+    if memory:
+        workers = min(workers, max(memory // per_worker, 1))
+    return workers
+
+
+def default_threads(workers):
+    """Потоки воркера: 4 запроса на CPU, в пределах памяти контейнера."""
+    threads = math.ceil(multiprocessing.cpu_count() * 4 / workers)
+    memory = memory_limit_mb()
+    if memory:
+        per_worker = int(os.getenv('GUNICORN_WORKER_MEMORY_MB', 150))
+        per_thread = int(os.getenv('GUNICORN_THREAD_MEMORY_MB', 20))
+        threads = min(
+            threads, (memory // workers - per_worker) // per_thread
+        )
+    return max(threads, 1)
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', default_workers()))
+threads = int(os.getenv('GUNICORN_THREADS', default_threads(workers)))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = True
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+
+def metrics_dir():
+    """Каталог метрик процессов, как METRICS_DIR в настройках."""
+    import tempfile
+
+    return os.getenv(
+        'DJANGO_METRICS_DIR',
+        os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+    )
+
+
+def on_starting(server):
+    """Удаляет метрики процессов от прошлого запуска."""
+    import shutil
+
+    shutil.rmtree(metrics_dir(), ignore_errors=True)
+
+
+def child_exit(server, worker):
+    """Переносит метрики завершившегося воркера в общий итог."""
+    from foodgram_backend.metrics import fold_worker
+
+    fold_worker(worker.pid, metrics_dir())
+
+
+def when_ready(server):
+    """Прогревает приложение в мастере до создания воркеров."""
+    from foodgram_backend.warmup import warm_up_process
+
+    warm_up_process()
+
+
+def post_fork(server, worker):
+    """Открывает соединение с базой в новом воркере."""
+    from foodgram_backend.warmup import warm_up_worker
+
+    warm_up_worker()
@@ -0,0 +1,42 @@
+"""Конфигурация gunicorn для запуска через ASGI.
+
+Запуск: gunicorn -c gunicorn_asgi.conf.py foodgram_backend.asgi:application
+
+Каждый процесс обслуживает соединения в цикле событий uvicorn, поэтому
+медленные клиенты и загрузка изображений не занимают процесс целиком.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count()
+))
+keepalive = 5
+graceful_timeout = 30
+timeout = 60
+
+
+def metrics_dir():
+    """Каталог метрик процессов, как METRICS_DIR в настройках."""
+    import tempfile
+
+    return os.getenv(
+        'DJANGO_METRICS_DIR',
+        os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+    )
+
+
+def on_starting(server):
+    """Удаляет метрики процессов от прошлого запуска."""
+    import shutil
+
+    shutil.rmtree(metrics_dir(), ignore_errors=True)
+
+
+def child_exit(server, worker):
+    """Переносит метрики завершившегося воркера в общий итог."""
+    from foodgram_backend.metrics import fold_worker
+
+    fold_worker(worker.pid, metrics_dir())
@@ -1,5 +1,8 @@
 """Приложение админки для рецептов."""
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
 from .models import (
     Ingredient,
     Recipe,
@@ -9,25 +12,72 @@ from .models import (
 )
 
 
+class CookingTimeFilter(admin.SimpleListFilter):
+    """Фильтр по времени приготовления с фиксированными интервалами."""
+
+    title = 'Время приготовления'
+    parameter_name = 'cooking_time'
+    ranges = {
+        'fast': ('До 15 минут', 0, 15),
+        'medium': ('15–60 минут', 16, 60),
+        'long': ('Больше часа', 61, None),
+    }
+
+    def lookups(self, request, model_admin):
+        """Интервалы не зависят от данных."""
+        return [(key, label) for key, (label, _, _) in self.ranges.items()]
+
+    def queryset(self, request, queryset):
+        """Рецепты из выбранного интервала."""
+        if self.value() not in self.ranges:
+            return queryset
+        _, low, high = self.ranges[self.value()]
+        queryset = queryset.filter(cooking_time__gte=low)
+        if high is not None:
+            queryset = queryset.filter(cooking_time__lte=high)
+        return queryset
+
+
 class RecipeIngredientInline(admin.TabularInline):
     """Inline для рецептов."""
 
     model = RecipeIngredient
     extra = 1
     min_num = 1
+    autocomplete_fields = ('ingredient',)
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    """Админка для рецептов."""
+    """Админка для рецептов.
+
+    Страница списка не зависит от размера таблиц: автор подтягивается
+    JOIN, число добавлений в избранное считается подзапросом только для
+    строк страницы, фильтры не перечисляют значения из базы, а общее число
+    рецептов при поиске не пересчитывается.
+    """
 
     list_display = ('name', 'author', 'get_favorite_count')
-    list_filter = ('author', 'name')
+    list_select_related = ('author',)
+    list_filter = (CookingTimeFilter,)
     search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
     inlines = [RecipeIngredientInline]
 
+    def get_queryset(self, request):
+        """Рецепты с числом добавлений в избранное."""
+        favorites = Favorite.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            total=Count('pk')
+        ).values('total')
+        return super().get_queryset(request).annotate(
+            favorite_count=Coalesce(Subquery(favorites), 0)
+        )
+
     def get_favorite_count(self, obj):
         """Количество добавлений в избранное."""
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorite_count
     get_favorite_count.short_description = 'Добавлено в избранное (раз)'
 
 
@@ -35,11 +85,23 @@ class IngredientAdmin(admin.ModelAdmin):
     """Админка для ингредиентов."""
 
     list_display = ('name', 'measurement_unit')
-    search_fields = ('name',)
-    list_filter = ('name',)
+    search_fields = ('^name',)
+    list_filter = ('measurement_unit',)
+    ordering = ('name',)
+    show_full_result_count = False
+
+
+class UserRecipeAdmin(admin.ModelAdmin):
+    """Админка для связей пользователя с рецептом."""
+
+    list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
-admin.site.register(Favorite)
-admin.site.register(ShoppingCart)
+admin.site.register(Favorite, UserRecipeAdmin)
+admin.site.register(ShoppingCart, UserRecipeAdmin)
@@ -0,0 +1,128 @@
+"""Журнал изменений для инкрементальной синхронизации клиентов.
+
+Каждое создание, изменение и удаление рецепта, ингредиента в рецепте,
+избранного, списка покупок и подписки добавляет запись в Change в той же
+транзакции, что и само изменение. Клиент запоминает курсор — номер
+последней полученной записи — и запрашивает только то, что появилось
+после него.
+
+Номера выдаются после фиксации транзакции (sequence_changes) под
+блокировкой счётчика, поэтому идут в порядке фиксации, а не в порядке id:
+транзакция, взявшая id раньше, но зафиксированная позже, получит номер
+больше уже выданных и не окажется позади курсора клиента. Записи без
+номера (процесс упал между фиксацией и нумерацией) нумерует следующая
+транзакция с изменениями или compact_changes.
+
+Команда compact_changes уплотняет журнал: в записях старше
+CHANGES_COMPACT_AFTER_DAYS для каждого объекта остаётся только последняя.
+Создание и изменение клиент применяет одинаково, поэтому после уплотнения
+курсор любой давности остаётся верным, а журнал растёт с числом объектов,
+а не изменений.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, Max, Min, OuterRef
+from django.utils import timezone
+
+from foodgram_backend.constants import CHANGES_COMPACT_AFTER_DAYS
+from users.models import Subscription
+
+from .models import (
+    Change, ChangeSequence, Favorite, Recipe, RecipeIngredient, ShoppingCart
+)
+
+# Модель -> (имя в журнале, получатель, связанные объекты).
+TRACKED = {
+    Recipe: (
+        'recipe', lambda obj: None,
+        lambda obj: {'author': obj.author_id}
+    ),
+    RecipeIngredient: (
+        'recipe_ingredient', lambda obj: None,
+        lambda obj: {
+            'recipe': obj.recipe_id,
+            'ingredient': obj.ingredient_id,
+            'amount': obj.amount,
+        }
+    ),
+    Favorite: (
+        'favorite', lambda obj: obj.user_id,
+        lambda obj: {'recipe': obj.recipe_id}
+    ),
+    ShoppingCart: (
+        'shopping_cart', lambda obj: obj.user_id,
+        lambda obj: {'recipe': obj.recipe_id}
+    ),
+    Subscription: (
+        'subscription', lambda obj: obj.user_id,
+        lambda obj: {'author': obj.author_id}
+    ),
+}
+
+
+def pending_range():
+    """Наименьший и наибольший id видимых записей без номера."""
+    return Change.objects.filter(sequence__isnull=True).aggregate(
+        low=Min('pk'), high=Max('pk')
+    )
+
+
+def sequence_changes():
+    """Нумерует зафиксированные записи журнала без номера.
+
+    Номер — id плюс сдвиг, при котором все новые номера больше уже
+    выданных; пока транзакции фиксируются по порядку id, номер совпадает с
+    id. Незафиксированные записи не видны и получат номер позже.
+    """
+    if pending_range()['low'] is None:
+        return
+    with transaction.atomic():
+        counter, _ = ChangeSequence.objects.select_for_update(
+        ).get_or_create(pk=1)
+        pending = pending_range()
+        if pending['low'] is None:
+            return
+        offset = max(counter.last + 1 - pending['low'], 0)
+        # Записи, зафиксированные после подсчёта, но вне диапазона, могут
+        # иметь id меньше low: их пронумерует следующий вызов.
+        Change.objects.filter(
+            sequence__isnull=True,
+            pk__range=(pending['low'], pending['high'])
+        ).update(sequence=F('pk') + offset)
+        counter.last = pending['high'] + offset
+        counter.save(update_fields=['last'])
+
+
+def record_changes(instances, action):
+    """Записывает изменения объектов одним запросом.
+
+    Номера записи получат после фиксации транзакции.
+    """
+    entries = []
+    for instance in instances:
+        name, recipient, related = TRACKED[type(instance)]
+        entries.append(Change(
+            model=name, action=action, object_id=instance.pk,
+            user_id=recipient(instance), data=related(instance)
+        ))
+    Change.objects.bulk_create(entries)
+    transaction.on_commit(sequence_changes)
+
+
+def compact(days=CHANGES_COMPACT_AFTER_DAYS):
+    """Удаляет старые записи, у объекта которых есть более новая.
+
+    Сначала нумерует записи, оставшиеся без номера. Возвращает число
+    удалённых записей.
+    """
+    sequence_changes()
+    newer = Change.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'),
+        sequence__gt=OuterRef('sequence')
+    )
+    deleted, _ = Change.objects.filter(
+        sequence__isnull=False,
+        created_at__lt=timezone.now() - timedelta(days=days)
+    ).filter(Exists(newer)).delete()
+    return deleted
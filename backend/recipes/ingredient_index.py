@@ -0,0 +1,220 @@
+"""Инвертированный индекс ингредиентов для подбора рецептов.
+
+Индекс живёт в памяти процесса. Свои изменения процесс вносит в него
+сразу после коммита и увеличивает поколение индекса в общем кэше. Другие
+процессы, заметив новое поколение (или истёкший INGREDIENT_INDEX_TTL),
+перестраивают индекс в фоновом потоке и до конца перестройки отвечают по
+прежнему. Синхронно индекс строится только в первый раз.
+
+С локальным кэшем (LocMem) поколение у каждого процесса своё, и чужие
+изменения подхватываются не позже чем через INGREDIENT_INDEX_TTL секунд.
+"""
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connections
+
+from foodgram_backend.constants import INGREDIENT_INDEX_TTL
+
+GENERATION_KEY = 'ingredient_index:generation'
+
+logger = logging.getLogger(__name__)
+
+
+def current_generation():
+    """Поколение индекса в общем кэше."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """Сообщает остальным процессам, что индекс изменился."""
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        return None
+
+
+class IngredientIndex:
+    """Индекс «ингредиент -> отсортированный массив id рецептов».
+
+    Массивы не меняются на месте: изменение рецепта заменяет их новыми.
+    Поэтому rank() забирает ссылки на них под блокировкой, а считает уже
+    без неё.
+    """
+
+    def __init__(self, ttl=INGREDIENT_INDEX_TTL, background=True):
+        """Инициализация пустого индекса."""
+        self.ttl = ttl
+        self.background = background
+        self._postings = {}
+        self._recipe_ingredients = {}
+        self._built_at = None
+        self._generation = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def _ensure_built(self):
+        """Строит индекс при первом обращении, устаревший — обновляет."""
+        if self._built_at is None:
+            self.rebuild()
+            return
+        if (
+            time.monotonic() - self._built_at < self.ttl
+            and current_generation() == self._generation
+        ):
+            return
+        if not self.background:
+            self.rebuild()
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(
+            target=self._rebuild_in_background, daemon=True
+        ).start()
+
+    def _rebuild_in_background(self):
+        """Перестройка в фоновом потоке со своим соединением с базой."""
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс ингредиентов.')
+        finally:
+            with self._lock:
+                self._rebuilding = False
+            connections.close_all()
+
+    def rebuild(self):
+        """Полностью перестраивает индекс по таблице RecipeIngredient."""
+        from recipes.models import RecipeIngredient
+
+        # Поколение читается до данных: изменение, закоммиченное во время
+        # чтения, оставит индекс устаревшим, и его перестроят ещё раз.
+        generation = current_generation()
+        postings = defaultdict(list)
+        recipe_ingredients = defaultdict(list)
+        rows = RecipeIngredient.objects.order_by().values_list(
+            'ingredient_id', 'recipe_id'
+        )
+        for ingredient_id, recipe_id in rows.iterator():
+            postings[ingredient_id].append(recipe_id)
+            recipe_ingredients[recipe_id].append(ingredient_id)
+        postings = {
+            ingredient_id: array('q', sorted(recipe_ids))
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        recipe_ingredients = {
+            recipe_id: array('q', sorted(ingredient_ids))
+            for recipe_id, ingredient_ids in recipe_ingredients.items()
+        }
+        with self._lock:
+            self._postings = postings
+            self._recipe_ingredients = recipe_ingredients
+            self._generation = generation
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        """Сбрасывает индекс во всех процессах."""
+        with self._lock:
+            self._built_at = None
+        bump_generation()
+
+    def _publish(self):
+        """Увеличивает поколение после своего изменения.
+
+        Если до него индекс был актуален, он остаётся актуальным и для
+        нового поколения, и этот процесс его не перестраивает.
+        """
+        generation = bump_generation()
+        with self._lock:
+            if generation is not None and generation == (
+                (self._generation or 0) + 1
+            ):
+                self._generation = generation
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        """Заменяет набор ингредиентов рецепта в индексе."""
+        if self._built_at is not None:
+            with self._lock:
+                self._discard(recipe_id)
+                ingredient_ids = sorted(set(ingredient_ids))
+                for ingredient_id in ingredient_ids:
+                    posting = self._postings.get(ingredient_id, array('q'))
+                    position = bisect_left(posting, recipe_id)
+                    if (
+                        position == len(posting)
+                        or posting[position] != recipe_id
+                    ):
+                        self._postings[ingredient_id] = (
+                            posting[:position] + array('q', [recipe_id])
+                            + posting[position:]
+                        )
+                self._recipe_ingredients[recipe_id] = array(
+                    'q', ingredient_ids
+                )
+        self._publish()
+
+    def remove_recipe(self, recipe_id):
+        """Удаляет рецепт из индекса."""
+        if self._built_at is not None:
+            with self._lock:
+                self._discard(recipe_id)
+        self._publish()
+
+    def _discard(self, recipe_id):
+        """Удаляет рецепт из списков; вызывается под блокировкой."""
+        for ingredient_id in self._recipe_ingredients.pop(recipe_id, ()):
+            posting = self._postings.get(ingredient_id)
+            if posting is None:
+                continue
+            position = bisect_left(posting, recipe_id)
+            if position < len(posting) and posting[position] == recipe_id:
+                posting = posting[:position] + posting[position + 1:]
+            if posting:
+                self._postings[ingredient_id] = posting
+            else:
+                del self._postings[ingredient_id]
+
+    def rank(self, ingredient_ids):
+        """Ранжирует рецепты по доле ингредиентов, которые есть у пользователя.
+
+        Возвращает список кортежей (recipe_id, matched, missing):
+        сколько ингредиентов рецепта есть и сколько не хватает. Порядок —
+        по убыванию покрытия, затем по числу совпадений и новизне рецепта.
+        """
+        self._ensure_built()
+        with self._lock:
+            postings = [
+                self._postings[ingredient_id]
+                for ingredient_id in set(ingredient_ids)
+                if ingredient_id in self._postings
+            ]
+            recipe_ingredients = self._recipe_ingredients
+        matched = defaultdict(int)
+        for posting in postings:
+            for recipe_id in posting:
+                matched[recipe_id] += 1
+        ranked = []
+        for recipe_id, hits in matched.items():
+            # Рецепт могли удалить, пока считались совпадения.
+            total = len(recipe_ingredients.get(recipe_id, ()))
+            if total:
+                ranked.append((recipe_id, hits, max(total - hits, 0)))
+        ranked.sort(key=lambda item: (
+            -item[1] / (item[1] + item[2]), -item[1], -item[0]
+        ))
+        return ranked
+
+
+ingredient_index = IngredientIndex()
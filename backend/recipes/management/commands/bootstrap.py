@@ -0,0 +1,250 @@
+"""Подготавливает контейнер к запуску, пропуская уже выполненные шаги."""
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.migrations.executor import MigrationExecutor
+
+from recipes.models import BootstrapStep
+
+MIGRATED_APPS = ('users', 'recipes')
+
+
+def hash_files(paths):
+    """SHA-256 от содержимого файлов в заданном порядке."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(str(path).encode())
+        with open(path, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def migration_paths(label):
+    """Файлы миграций приложения на диске, кроме __init__.py."""
+    migrations_path = os.path.join(
+        apps.get_app_config(label).path, 'migrations'
+    )
+    return [
+        os.path.join(migrations_path, name)
+        for name in sorted(os.listdir(migrations_path))
+        if name.endswith('.py') and name != '__init__.py'
+    ]
+
+
+def models_fingerprint():
+    """Отпечаток моделей и миграций, которые сейчас лежат на диске."""
+    paths = []
+    for label in MIGRATED_APPS:
+        paths.append(os.path.join(
+            apps.get_app_config(label).path, 'models.py'
+        ))
+        paths.extend(migration_paths(label))
+    return hash_files(paths)
+
+
+def ingredients_fingerprint():
+    """Отпечаток файла с ингредиентами."""
+    return hash_files([settings.BASE_DIR / 'data' / 'ingredients.json'])
+
+
+def initial_data_fingerprint():
+    """Отпечаток кода, создающего начальные данные."""
+    from recipes.management.commands import load_initial_data
+
+    return hash_files([load_initial_data.__file__])
+
+
+def static_fingerprint():
+    """Отпечаток списка исходных статических файлов."""
+    digest = hashlib.sha256()
+    entries = []
+    for finder in get_finders():
+        for path, storage in finder.list([]):
+            stat = os.stat(storage.path(path))
+            entries.append(f'{path}:{stat.st_size}:{stat.st_mtime_ns}')
+    for entry in sorted(entries):
+        digest.update(entry.encode())
+    digest.update(str(settings.STATIC_ROOT).encode())
+    return digest.hexdigest()
+
+
+def migrations_present():
+    """Есть ли на диске миграции всех приложений.
+
+    Сгенерированных миграций нет в образе: в новом контейнере их нужно
+    создать заново, даже если модели не менялись.
+    """
+    return all(migration_paths(label) for label in MIGRATED_APPS)
+
+
+def static_collected():
+    """Есть ли собранная статика: STATIC_ROOT тоже не входит в образ."""
+    return (
+        os.path.isdir(settings.STATIC_ROOT)
+        and bool(os.listdir(settings.STATIC_ROOT))
+    )
+
+
+def migrations_pending():
+    """Есть ли непримененные миграции."""
+    connection = connections[DEFAULT_DB_ALIAS]
+    executor = MigrationExecutor(connection)
+    targets = executor.loader.graph.leaf_nodes()
+    return bool(executor.migration_plan(targets))
+
+
+class Command(BaseCommand):
+    """Выполняет шаги запуска контейнера.
+
+    Каждый шаг сравнивает отпечаток своих входных данных с сохранённым в
+    BootstrapStep и пропускается, если ничего не изменилось, а результат
+    прошлого запуска есть в контейнере. Сбор статики выполняется
+    параллельно с остальными шагами.
+    """
+
+    help = ('Создаёт и применяет миграции, загружает ингредиенты и '
+            'начальные данные, собирает статику. Выполненные шаги '
+            'пропускаются.')
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Выполнить все шаги независимо от отпечатков.'
+        )
+        parser.add_argument(
+            '--skip-initial-data', action='store_true',
+            help='Не загружать тестовых пользователей и рецепты.'
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        self.force = options['force']
+        self.timings = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            static = executor.submit(self.run_in_thread, self.collect_static)
+            database = executor.submit(
+                self.run_in_thread, self.prepare_database,
+                not options['skip_initial_data']
+            )
+            database.result()
+            static.result()
+        for name, status, duration in self.timings:
+            self.stdout.write(f'{name:<20} {status:<10} {duration:8.3f} с')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.3f} с.'
+        ))
+
+    def run_in_thread(self, function, *args):
+        """Выполняет шаги в потоке и закрывает его соединения с базой."""
+        try:
+            function(*args)
+        finally:
+            connections.close_all()
+
+    def prepare_database(self, load_initial_data):
+        """Шаги, работающие с базой, выполняются последовательно."""
+        fingerprints = self.timed('makemigrations', self.make_migrations)
+        self.timed('migrate', self.migrate)
+        if fingerprints:
+            # Сохраняется после migrate: если он упадёт, шаг повторится.
+            self.store_fingerprint('makemigrations', *fingerprints)
+        self.step(
+            'load_ingredients', ingredients_fingerprint,
+            lambda: call_command('load_ingredients', stdout=StringIO())
+        )
+        if load_initial_data:
+            self.step(
+                'load_initial_data', initial_data_fingerprint,
+                lambda: call_command('load_initial_data', stdout=StringIO())
+            )
+
+    def make_migrations(self):
+        """Создаёт миграции, если изменились модели или миграций нет.
+
+        Сохраняются два отпечатка: до генерации (модели и миграции из
+        образа) и после неё. Совпадение с любым из них значит, что модели
+        не менялись: первый увидит новый контейнер, второй — перезапуск
+        того же. Возвращает оба или None, если шаг пропущен.
+        """
+        before = models_fingerprint()
+        if (
+            not self.force and migrations_present()
+            and before in self.stored_fingerprints('makemigrations')
+        ):
+            return None
+        call_command('makemigrations', *MIGRATED_APPS, verbosity=0)
+        return before, models_fingerprint()
+
+    def migrate(self):
+        """Применяет миграции, если есть непримененные."""
+        if not self.force and not migrations_pending():
+            return None
+        call_command('migrate', verbosity=0, interactive=False)
+        return True
+
+    def collect_static(self):
+        """Собирает статику, если изменились исходные файлы."""
+        self.step(
+            'collectstatic', static_fingerprint,
+            lambda: call_command(
+                'collectstatic', interactive=False, verbosity=0
+            ),
+            ready=static_collected
+        )
+
+    def timed(self, name, action):
+        """Выполняет действие и запоминает время; None — шаг пропущен."""
+        started = time.perf_counter()
+        result = action()
+        status = 'skipped' if result is None else 'done'
+        self.timings.append((name, status, time.perf_counter() - started))
+        return result
+
+    def step(self, name, get_fingerprint, action, ready=None):
+        """Выполняет шаг, если его отпечаток изменился.
+
+        ready проверяет, что результат шага есть в контейнере. Возвращает
+        True, если шаг был выполнен.
+        """
+        def run():
+            fingerprint = get_fingerprint()
+            if (
+                not self.force
+                and self.stored_fingerprints(name)[:1] == (fingerprint,)
+                and (ready is None or ready())
+            ):
+                return None
+            action()
+            self.store_fingerprint(name, fingerprint)
+            return True
+        return self.timed(name, run)
+
+    def stored_fingerprints(self, name):
+        """Отпечатки входа и результата шага; пустой кортеж, если их нет."""
+        try:
+            return BootstrapStep.objects.filter(name=name).values_list(
+                'fingerprint', 'output_fingerprint'
+            ).first() or ()
+        except DatabaseError:
+            return ()
+
+    def store_fingerprint(self, name, fingerprint, output_fingerprint=''):
+        """Сохраняет отпечатки выполненного шага."""
+        try:
+            BootstrapStep.objects.update_or_create(name=name, defaults={
+                'fingerprint': fingerprint,
+                'output_fingerprint': output_fingerprint,
+            })
+        except DatabaseError:
+            pass
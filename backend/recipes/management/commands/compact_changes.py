@@ -0,0 +1,27 @@
+"""Уплотняет журнал изменений."""
+from django.core.management.base import BaseCommand
+
+from foodgram_backend.constants import CHANGES_COMPACT_AFTER_DAYS
+from recipes.changes import compact
+
+
+class Command(BaseCommand):
+    """Оставляет в старой части журнала по одной записи на объект."""
+
+    help = ('Удаляет из журнала изменений старые записи, у объекта которых '
+            'есть более новая. Запускайте периодически, например раз в '
+            'сутки.')
+
+    def add_arguments(self, parser):
+        """Параметры уплотнения."""
+        parser.add_argument(
+            '--days', type=int, default=CHANGES_COMPACT_AFTER_DAYS,
+            help='Уплотнять записи старше этого числа дней.'
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        deleted = compact(options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено записей журнала: {deleted}.'
+        ))
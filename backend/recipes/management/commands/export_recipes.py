@@ -0,0 +1,111 @@
+"""Выгружает рецепты в NDJSON: по одному рецепту на строку."""
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram_backend.constants import RECIPES_BATCH_SIZE
+from recipes.models import Recipe, RecipeIngredient
+
+RECIPE_FIELDS = (
+    'id', 'name', 'text', 'cooking_time', 'pub_date', 'image',
+    'author__email', 'author__username', 'author__first_name',
+    'author__last_name',
+)
+
+
+def recipe_batches(batch_size):
+    """Рецепты пачками по возрастанию id, без загрузки всей таблицы."""
+    last_id = 0
+    while True:
+        rows = list(
+            Recipe.objects.filter(pk__gt=last_id)
+            .order_by('pk').values(*RECIPE_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return
+        ingredients = {}
+        for item in RecipeIngredient.objects.filter(
+            recipe_id__in=[row['id'] for row in rows]
+        ).order_by('recipe_id', 'ingredient__name').values(
+            'recipe_id', 'ingredient__name', 'ingredient__measurement_unit',
+            'amount'
+        ):
+            ingredients.setdefault(item['recipe_id'], []).append({
+                'name': item['ingredient__name'],
+                'measurement_unit': item['ingredient__measurement_unit'],
+                'amount': item['amount'],
+            })
+        yield rows, ingredients
+        last_id = rows[-1]['id']
+
+
+def recipe_record(row, ingredients):
+    """Строка NDJSON для рецепта."""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'text': row['text'],
+        'cooking_time': row['cooking_time'],
+        'pub_date': row['pub_date'].isoformat(),
+        'image': row['image'],
+        'author': {
+            'email': row['author__email'],
+            'username': row['author__username'],
+            'first_name': row['author__first_name'],
+            'last_name': row['author__last_name'],
+        },
+        'ingredients': ingredients.get(row['id'], []),
+    }
+
+
+class Command(BaseCommand):
+    """Выгружает рецепты с авторами и ингредиентами в NDJSON."""
+
+    help = (
+        'Выгружает рецепты в NDJSON. Картинки указываются путём в MEDIA_ROOT, '
+        'сами файлы нужно переносить отдельно.'
+    )
+
+    def add_arguments(self, parser):
+        """Параметры выгрузки."""
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл для выгрузки; "-" — stdout.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=RECIPES_BATCH_SIZE,
+            help='Сколько рецептов читать из базы за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        """Выгружает рецепты и пишет прогресс в stderr."""
+        if options['output'] == '-':
+            self.write_records(
+                lambda text: self.stdout.write(text, ending=''),
+                options['batch_size']
+            )
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as target:
+                self.write_records(target.write, options['batch_size'])
+
+    def write_records(self, write, batch_size):
+        """Пишет рецепты построчно, по пачке за раз."""
+        total = Recipe.objects.count()
+        exported = 0
+        started = time.monotonic()
+        for rows, ingredients in recipe_batches(batch_size):
+            write(''.join(
+                json.dumps(recipe_record(row, ingredients),
+                           ensure_ascii=False) + '\n'
+                for row in rows
+            ))
+            exported += len(rows)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stderr.write(
+                f'Выгружено {exported} из {total} рецептов '
+                f'({exported / elapsed:.0f}/с)'
+            )
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгрузка завершена: {exported} рецептов.'
+        ))
@@ -20,16 +20,19 @@ class Command(BaseCommand):
             return
         with open(file_path, encoding='utf-8') as f:
             data = json.load(f)
-        count = 0
-        for item in data:
-            name = item.get('name')
-            measurement_unit = item.get('measurement_unit')
-            if name and measurement_unit:
-                obj, created = Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
+        existing = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(
+                    name=item['name'],
+                    measurement_unit=item['measurement_unit']
                 )
-                if created:
-                    count += 1
+                for item in data
+                if item.get('name') and item.get('measurement_unit')
+            ],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+        count = Ingredient.objects.count() - existing
         self.stdout.write(self.style.
                           SUCCESS(f'Загружено {count} новых ингредиентов.'))
@@ -0,0 +1,536 @@
+"""Нагрузочный тест: сценарии пользователей против запущенного бэкенда.
+
+Виртуальные пользователи на asyncio регистрируются, получают токен и
+повторяют сценарии из коллекции Postman: листают рецепты, открывают
+рецепт, ищут ингредиенты, добавляют в избранное и корзину, скачивают
+список покупок и подписываются на авторов. Результат — пропускная
+способность и перцентили задержки по каждому эндпоинту в JSON.
+
+Тест создаёт пользователей и рецепты, поэтому запускать его нужно на
+тестовом стенде, а не на продакшене.
+"""
+import asyncio
+import json
+import random
+import ssl
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJ'
+    'AAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+PAGE_SIZE = 6
+PERCENTILES = (50, 95, 99)
+AUTOCOMPLETE_PREFIXES = ('а', 'б', 'к', 'м', 'п', 'с', 'т')
+
+
+class HTTPError(Exception):
+    """Ошибка соединения или разбора ответа."""
+
+
+class Connection:
+    """HTTP/1.1 keep-alive соединение одного виртуального пользователя."""
+
+    def __init__(self, base_url, timeout):
+        """Запоминает адрес сервера; соединение открывается по требованию."""
+        parts = urlsplit(base_url)
+        self.secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.host_header = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def open(self):
+        """Открывает соединение с сервером."""
+        context = ssl.create_default_context() if self.secure else None
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=context
+        )
+
+    def close(self):
+        """Закрывает соединение."""
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, token=None, data=None):
+        """Выполняет запрос и возвращает статус и тело ответа."""
+        body = b'' if data is None else json.dumps(data).encode()
+        headers = [
+            f'{method} {self.prefix}{path} HTTP/1.1',
+            f'Host: {self.host_header}',
+            'Accept: application/json',
+            f'Content-Length: {len(body)}',
+        ]
+        if data is not None:
+            headers.append('Content-Type: application/json')
+        if token:
+            headers.append(f'Authorization: Token {token}')
+        payload = ('\r\n'.join(headers) + '\r\n\r\n').encode() + body
+        for attempt in range(2):
+            if self.writer is None:
+                await self.open()
+            try:
+                self.writer.write(payload)
+                await self.writer.drain()
+                return await asyncio.wait_for(
+                    self.read_response(), self.timeout
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Сервер мог закрыть простаивающее keep-alive соединение.
+                self.close()
+                if attempt:
+                    raise HTTPError('соединение закрыто сервером')
+            except asyncio.TimeoutError:
+                self.close()
+                raise HTTPError('таймаут ответа')
+
+    async def read_response(self):
+        """Читает статус, заголовки и тело ответа."""
+        status_line = await self.reader.readuntil(b'\r\n')
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise HTTPError(f'некорректный ответ: {status_line!r}')
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            body = await self.reader.readexactly(
+                int(headers['content-length'])
+            )
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self.read_chunked()
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body
+
+    async def read_chunked(self):
+        """Читает тело с Transfer-Encoding: chunked."""
+        chunks = []
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            size = int(line.split(b';')[0], 16)
+            if not size:
+                await self.reader.readuntil(b'\r\n')
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+
+class Stats:
+    """Задержки и статусы ответов по эндпоинтам."""
+
+    def __init__(self):
+        """Инициализация пустой статистики."""
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, endpoint, latency, status):
+        """Учитывает ответ; status None означает сетевую ошибку."""
+        self.latencies.setdefault(endpoint, []).append(latency)
+        statuses = self.statuses.setdefault(endpoint, {})
+        key = str(status) if status is not None else 'error'
+        statuses[key] = statuses.get(key, 0) + 1
+        if status is None or status >= 500:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        """Сводка по эндпоинтам в виде словаря для JSON."""
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            summary = {
+                'requests': len(latencies),
+                'errors': self.errors.get(endpoint, 0),
+                'rps': round(len(latencies) / elapsed, 2),
+                'mean_ms': round(
+                    sum(latencies) / len(latencies) * 1000, 2
+                ),
+                'max_ms': round(latencies[-1] * 1000, 2),
+                'statuses': self.statuses[endpoint],
+            }
+            for percent in PERCENTILES:
+                summary[f'p{percent}_ms'] = round(
+                    percentile(latencies, percent) * 1000, 2
+                )
+            endpoints[endpoint] = summary
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'rps': round(total / elapsed, 2),
+            'endpoints': endpoints,
+        }
+
+
+def percentile(ordered, percent):
+    """Перцентиль отсортированного списка методом ближайшего ранга."""
+    rank = max(int(-(-len(ordered) * percent // 100)), 1)
+    return ordered[rank - 1]
+
+
+class VirtualUser:
+    """Пользователь, выполняющий сценарии в своём соединении."""
+
+    def __init__(self, number, run_id, options, stats, catalog):
+        """Инициализация пользователя с собственным генератором."""
+        self.number = number
+        self.email = f'loadtest-{run_id}-{number}@example.com'
+        self.username = f'loadtest_{run_id}_{number}'
+        self.password = f'Pw!{uuid.uuid4().hex}'
+        self.connection = Connection(options['base_url'], options['timeout'])
+        self.random = random.Random(f'{options["seed"]}-{number}')
+        self.stats = stats
+        self.catalog = catalog
+        self.recording = False
+        self.token = None
+        self.user_id = None
+        self.recipe_id = None
+
+    async def call(self, endpoint, method, path, data=None, query=None):
+        """Запрос с учётом задержки под именем эндпоинта."""
+        if query:
+            path = f'{path}?{urlencode(query)}'
+        started = time.perf_counter()
+        try:
+            status, body = await self.connection.request(
+                method, path, self.token, data
+            )
+        except (HTTPError, OSError):
+            status, body = None, b''
+        if self.recording:
+            self.stats.record(
+                f'{method} {endpoint}', time.perf_counter() - started, status
+            )
+        return status, body
+
+    async def setup(self, create_recipe):
+        """Регистрация, получение токена и, при необходимости, рецепт."""
+        status, body = await self.call(
+            '/api/users/', 'POST', '/api/users/', {
+                'email': self.email,
+                'username': self.username,
+                'first_name': 'Нагрузочный',
+                'last_name': f'Тест {self.number}',
+                'password': self.password,
+            }
+        )
+        if status != 201:
+            raise CommandError(
+                f'Не удалось создать пользователя: {status} {body[:200]!r}'
+            )
+        self.user_id = json.loads(body)['id']
+        status, body = await self.call(
+            '/api/auth/token/login/', 'POST', '/api/auth/token/login/',
+            {'email': self.email, 'password': self.password}
+        )
+        if status != 200:
+            raise CommandError(f'Не удалось получить токен: {status}')
+        self.token = json.loads(body)['auth_token']
+        if create_recipe:
+            ingredients = self.random.sample(
+                self.catalog['ingredients'],
+                min(3, len(self.catalog['ingredients']))
+            )
+            status, body = await self.call(
+                '/api/recipes/', 'POST', '/api/recipes/', {
+                    'name': f'Нагрузочный тест {self.number}',
+                    'text': 'Рецепт создан нагрузочным тестом.',
+                    'cooking_time': self.random.randint(5, 120),
+                    'image': IMAGE,
+                    'ingredients': [
+                        {'id': pk, 'amount': self.random.randint(1, 500)}
+                        for pk in ingredients
+                    ],
+                }
+            )
+            if status != 201:
+                raise CommandError(
+                    f'Не удалось создать рецепт: {status} {body[:200]!r}'
+                )
+            self.recipe_id = json.loads(body)['id']
+
+    async def teardown(self):
+        """Удаляет созданный рецепт и закрывает соединение."""
+        self.recording = False
+        if self.recipe_id is not None:
+            await self.call(
+                '/api/recipes/{id}/', 'DELETE',
+                f'/api/recipes/{self.recipe_id}/'
+            )
+        await self.call(
+            '/api/auth/token/logout/', 'POST', '/api/auth/token/logout/'
+        )
+        self.connection.close()
+
+    def pick_recipe(self):
+        """Случайный рецепт из каталога."""
+        return self.random.choice(self.catalog['recipes'])
+
+    async def browse(self):
+        """Листает страницы рецептов и открывает один из них."""
+        status, body = await self.call(
+            '/api/recipes/', 'GET', '/api/recipes/',
+            query={'page': self.random.randint(1, self.catalog['pages']),
+                   'limit': PAGE_SIZE}
+        )
+        results = json.loads(body)['results'] if status == 200 else []
+        recipe = (
+            self.random.choice(results)['id'] if results
+            else self.pick_recipe()
+        )
+        await self.call(
+            '/api/recipes/{id}/', 'GET', f'/api/recipes/{recipe}/'
+        )
+        if self.random.random() < 0.2:
+            await self.call(
+                '/api/recipes/{id}/get-link/', 'GET',
+                f'/api/recipes/{recipe}/get-link/'
+            )
+
+    async def autocomplete(self):
+        """Набирает название ингредиента по буквам."""
+        prefix = self.random.choice(AUTOCOMPLETE_PREFIXES)
+        for _ in range(self.random.randint(1, 3)):
+            await self.call(
+                '/api/ingredients/', 'GET', '/api/ingredients/',
+                query={'name': prefix}
+            )
+            prefix += self.random.choice('аеиоу')
+
+    async def favorite(self):
+        """Добавляет рецепт в избранное, смотрит избранное и убирает."""
+        recipe = self.pick_recipe()
+        await self.call(
+            '/api/recipes/{id}/favorite/', 'POST',
+            f'/api/recipes/{recipe}/favorite/'
+        )
+        await self.call(
+            '/api/recipes/?is_favorited=1', 'GET', '/api/recipes/',
+            query={'is_favorited': 1}
+        )
+        await self.call(
+            '/api/recipes/{id}/favorite/', 'DELETE',
+            f'/api/recipes/{recipe}/favorite/'
+        )
+
+    async def shopping(self):
+        """Собирает корзину, скачивает список покупок и очищает её."""
+        recipes = self.random.sample(
+            self.catalog['recipes'], min(3, len(self.catalog['recipes']))
+        )
+        for recipe in recipes:
+            await self.call(
+                '/api/recipes/{id}/shopping_cart/', 'POST',
+                f'/api/recipes/{recipe}/shopping_cart/'
+            )
+        await self.call(
+            '/api/recipes/download_shopping_cart/', 'GET',
+            '/api/recipes/download_shopping_cart/'
+        )
+        for recipe in recipes:
+            await self.call(
+                '/api/recipes/{id}/shopping_cart/', 'DELETE',
+                f'/api/recipes/{recipe}/shopping_cart/'
+            )
+
+    async def subscribe(self):
+        """Подписывается на автора, смотрит подписки и отписывается."""
+        authors = [
+            author for author in self.catalog['authors']
+            if author != self.user_id
+        ]
+        if not authors:
+            return
+        author = self.random.choice(authors)
+        await self.call(
+            '/api/users/{id}/subscribe/', 'POST',
+            f'/api/users/{author}/subscribe/', query={'recipes_limit': 3}
+        )
+        await self.call(
+            '/api/users/subscriptions/', 'GET', '/api/users/subscriptions/'
+        )
+        await self.call(
+            '/api/users/{id}/subscribe/', 'DELETE',
+            f'/api/users/{author}/subscribe/'
+        )
+
+    async def run(self, deadline, think_time):
+        """Выполняет случайные сценарии до истечения времени."""
+        journeys = (
+            (self.browse, 6),
+            (self.autocomplete, 3),
+            (self.favorite, 2),
+            (self.shopping, 1),
+            (self.subscribe, 1),
+        )
+        functions = [journey for journey, _ in journeys]
+        weights = [weight for _, weight in journeys]
+        self.recording = True
+        while time.monotonic() < deadline:
+            await self.random.choices(functions, weights)[0]()
+            if think_time:
+                await asyncio.sleep(self.random.uniform(0, think_time))
+
+
+class Command(BaseCommand):
+    """Нагрузочный тест запущенного бэкенда."""
+
+    help = (
+        'Запускает виртуальных пользователей против работающего бэкенда '
+        'и выводит RPS и перцентили задержки по эндпоинтам в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        """Параметры теста."""
+        parser.add_argument(
+            '--base-url', default='http://localhost:8000',
+            help='Адрес бэкенда.'
+        )
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help='Число виртуальных пользователей.'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность теста в секундах.'
+        )
+        parser.add_argument(
+            '--ramp-up', type=float, default=5,
+            help='За сколько секунд запускаются все пользователи.'
+        )
+        parser.add_argument(
+            '--think-time', type=float, default=0.5,
+            help='Максимальная пауза между сценариями в секундах.'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Таймаут одного запроса в секундах.'
+        )
+        parser.add_argument(
+            '--seed', default='foodgram',
+            help='Зерно генератора для воспроизводимых сценариев.'
+        )
+        parser.add_argument(
+            '--output', help='Файл для результата; по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Результат прошлого запуска для сравнения p95 и RPS.'
+        )
+
+    def handle(self, *args, **options):
+        """Запускает тест и сохраняет результат."""
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        result = asyncio.run(self.run(options))
+        result['config'] = {
+            key: options[key] for key in (
+                'base_url', 'users', 'duration', 'ramp_up', 'think_time',
+                'seed',
+            )
+        }
+        text = json.dumps(result, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as target:
+                target.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if options['baseline']:
+            self.compare(result, options['baseline'])
+
+    async def load_catalog(self, options):
+        """Идентификаторы ингредиентов, рецептов и авторов на сервере."""
+        client = VirtualUser(0, 'catalog', options, Stats(), {})
+        status, body = await client.call(
+            '/api/ingredients/', 'GET', '/api/ingredients/'
+        )
+        if status != 200:
+            raise CommandError(
+                f'Бэкенд недоступен по адресу {options["base_url"]}.'
+            )
+        ingredients = [item['id'] for item in json.loads(body)]
+        status, body = await client.call(
+            '/api/recipes/', 'GET', '/api/recipes/', query={'limit': 100}
+        )
+        client.connection.close()
+        page = json.loads(body)
+        return {
+            'ingredients': ingredients,
+            'recipes': [recipe['id'] for recipe in page['results']],
+            'authors': list({
+                recipe['author']['id'] for recipe in page['results']
+            }),
+            'count': page['count'],
+        }
+
+    async def run(self, options):
+        """Подготовка, основной прогон и уборка."""
+        catalog = await self.load_catalog(options)
+        if not catalog['ingredients']:
+            raise CommandError('На сервере нет ингредиентов.')
+        stats = Stats()
+        run_id = uuid.uuid4().hex[:8]
+        users = [
+            VirtualUser(number, run_id, options, stats, catalog)
+            for number in range(options['users'])
+        ]
+        await asyncio.gather(*(
+            user.setup(create_recipe=not number % 5)
+            for number, user in enumerate(users)
+        ))
+        catalog['recipes'].extend(
+            user.recipe_id for user in users if user.recipe_id
+        )
+        catalog['authors'].extend(
+            user.user_id for user in users if user.recipe_id
+        )
+        catalog['count'] += sum(1 for user in users if user.recipe_id)
+        catalog['pages'] = max(-(-catalog['count'] // PAGE_SIZE), 1)
+
+        started = time.monotonic()
+        deadline = started + options['duration']
+        delay = options['ramp_up'] / len(users)
+
+        async def start(number, user):
+            await asyncio.sleep(number * delay)
+            await user.run(deadline, options['think_time'])
+
+        await asyncio.gather(*(
+            start(number, user) for number, user in enumerate(users)
+        ))
+        elapsed = time.monotonic() - started
+        await asyncio.gather(*(user.teardown() for user in users))
+        return stats.report(elapsed)
+
+    def compare(self, result, path):
+        """Печатает изменение RPS и p95 относительно прошлого запуска."""
+        with open(path, encoding='utf-8') as source:
+            baseline = json.load(source)
+        lines = [f'{"эндпоинт":<45} {"RPS":>16} {"p95, мс":>20}']
+        for endpoint, current in result['endpoints'].items():
+            previous = baseline['endpoints'].get(endpoint)
+            if previous is None:
+                continue
+            lines.append(
+                f'{endpoint:<45} '
+                f'{previous["rps"]:>7} → {current["rps"]:<7} '
+                f'{previous["p95_ms"]:>9} → {current["p95_ms"]:<9}'
+            )
+        self.stderr.write('\n'.join(lines))
@@ -0,0 +1,18 @@
+"""Пересчитывает оценки популярности рецептов."""
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import renormalize
+
+
+class Command(BaseCommand):
+    """Переносит эпоху популярности и уменьшает сохранённые оценки."""
+
+    help = ('Переносит начало эпохи популярности на текущий момент. '
+            'Запускайте периодически, например раз в сутки.')
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        factor = renormalize()
+        self.stdout.write(self.style.SUCCESS(
+            f'Оценки популярности умножены на {factor:.6g}.'
+        ))
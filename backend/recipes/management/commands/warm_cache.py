@@ -0,0 +1,172 @@
+"""Прогревает кэш ответов перед приёмом трафика.
+
+Команда запрашивает через тестовый клиент Django то, что чаще всего
+открывают анонимные посетители: каталог ингредиентов, первые страницы
+списка рецептов, самые избранные рецепты, карточки и рецепты авторов с
+наибольшим числом подписчиков. Запросы проходят весь стек middleware,
+поэтому вместе с данными ответов заполняется и кэш сжатых тел.
+
+Адреса обходятся пулом потоков в порядке важности. Когда бюджет времени
+исчерпан, оставшиеся адреса пропускаются.
+"""
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import local
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+
+from foodgram_backend.compression import brotli
+from foodgram_backend.constants import (
+    WARM_CACHE_BUDGET, WARM_CACHE_LIMITS, WARM_CACHE_PAGES,
+    WARM_CACHE_TOP_AUTHORS, WARM_CACHE_TOP_RECIPES, WARM_CACHE_WORKERS
+)
+from recipes.models import Favorite, Recipe
+from users.models import Subscription
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def positive_ints(value):
+    """'6,12' -> (6, 12)."""
+    try:
+        numbers = tuple(int(part) for part in value.split(',') if part)
+    except ValueError:
+        numbers = ()
+    if not numbers or min(numbers) < 1:
+        raise CommandError(f'Ожидались положительные числа: {value!r}')
+    return numbers
+
+
+def warm_urls(pages, limits, top_recipes, top_authors):
+    """Адреса для прогрева в порядке важности."""
+    urls = ['/api/ingredients/']
+    count = Recipe.objects.count()
+    for limit in limits:
+        urls.extend(
+            f'/api/recipes/?page={page}&limit={limit}'
+            for page in range(1, min(pages, math.ceil(count / limit)) + 1)
+        )
+    urls.extend(
+        f'/api/recipes/{row["recipe_id"]}/' for row in
+        Favorite.objects.values('recipe_id').annotate(
+            total=Count('id')
+        ).order_by('-total', 'recipe_id')[:top_recipes]
+    )
+    for row in Subscription.objects.values('author_id').annotate(
+        total=Count('id')
+    ).order_by('-total', 'author_id')[:top_authors]:
+        urls.append(f'/api/users/{row["author_id"]}/')
+        urls.extend(
+            f'/api/recipes/?page=1&limit={limit}&author={row["author_id"]}'
+            for limit in limits
+        )
+    return urls
+
+
+class Command(BaseCommand):
+    """Заполняет кэш ответов самыми востребованными данными."""
+
+    help = (
+        'Заполняет кэш ответов для анонимных клиентов: каталог '
+        'ингредиентов, первые страницы рецептов, популярные рецепты и '
+        'авторов. Ограничена по времени.'
+    )
+
+    def add_arguments(self, parser):
+        """Параметры прогрева."""
+        parser.add_argument(
+            '--base-url',
+            default=settings.WARM_CACHE_URL or 'http://localhost',
+            help='Адрес сайта: схема и хост входят в ссылки ответов.'
+        )
+        parser.add_argument(
+            '--pages', type=int, default=WARM_CACHE_PAGES,
+            help='Сколько первых страниц списка рецептов прогреть.'
+        )
+        parser.add_argument(
+            '--limits', type=positive_ints,
+            default=WARM_CACHE_LIMITS,
+            help='Значения limit через запятую, например 6,12.'
+        )
+        parser.add_argument(
+            '--top-recipes', type=int, default=WARM_CACHE_TOP_RECIPES,
+            help='Сколько самых избранных рецептов прогреть.'
+        )
+        parser.add_argument(
+            '--top-authors', type=int, default=WARM_CACHE_TOP_AUTHORS,
+            help='Скольких авторов с наибольшим числом подписчиков прогреть.'
+        )
+        parser.add_argument(
+            '--budget', type=float, default=WARM_CACHE_BUDGET,
+            help='Бюджет времени в секундах.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=WARM_CACHE_WORKERS,
+            help='Число потоков.'
+        )
+
+    def handle(self, *args, **options):
+        """Обходит адреса пулом потоков, пока не кончится бюджет."""
+        parts = urlsplit(options['base_url'])
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise CommandError('--base-url должен быть вида https://host.')
+        self.host = parts.netloc
+        self.secure = parts.scheme == 'https'
+        self.verbosity = options['verbosity']
+        self.clients = local()
+        started = time.monotonic()
+        deadline = started + options['budget']
+        urls = warm_urls(
+            options['pages'], options['limits'], options['top_recipes'],
+            options['top_authors']
+        )
+        connections.close_all()
+        executor = ThreadPoolExecutor(max_workers=max(options['workers'], 1))
+        try:
+            futures = [
+                executor.submit(self.warm, url, deadline) for url in urls
+            ]
+            wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        finally:
+            executor.shutdown(cancel_futures=True)
+        results = [
+            future.result() for future in futures if not future.cancelled()
+        ]
+        warmed = sum(status == 200 for status in results)
+        failed = sum(status not in (None, 200) for status in results)
+        skipped = len(urls) - warmed - failed
+        if self.verbosity < 1:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Прогрето {warmed} из {len(urls)} адресов за '
+            f'{time.monotonic() - started:.2f} с; ошибок {failed}, '
+            f'пропущено {skipped}.'
+        ))
+
+    def warm(self, url, deadline):
+        """Запрашивает адрес во всех кодировках; код ответа или None."""
+        if time.monotonic() >= deadline:
+            return None
+        client = getattr(self.clients, 'client', None)
+        if client is None:
+            client = self.clients.client = Client(
+                raise_request_exception=False, HTTP_HOST=self.host
+            )
+        try:
+            for encoding in ENCODINGS:
+                response = client.get(
+                    url, secure=self.secure, HTTP_ACCEPT_ENCODING=encoding
+                )
+                if response.status_code != 200:
+                    break
+        finally:
+            connections.close_all()
+        if self.verbosity > 1:
+            self.stdout.write(f'{response.status_code} {url}')
+        return response.status_code
@@ -2,6 +2,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 # Импортируем константы
 from foodgram_backend.constants import (
@@ -49,7 +50,8 @@ class Recipe(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
-        verbose_name='Автор рецепта'
+        verbose_name='Автор рецепта',
+        db_index=False
     )
     name = models.CharField(
         max_length=200,
@@ -82,9 +84,19 @@ class Recipe(models.Model):
         ]
     )
     pub_date = models.DateTimeField(
-        auto_now_add=True,
+        default=timezone.now,
+        editable=False,
         verbose_name='Дата публикации'
     )
+    popularity = models.FloatField(
+        default=0,
+        verbose_name='Популярность'
+    )
+    version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        verbose_name='Версия'
+    )
 
     class Meta:
         """Мета-класс для рецептов."""
@@ -92,11 +104,53 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        # Индекс по автору не нужен: его заменяет recipe_author_idx.
+        indexes = [
+            models.Index(
+                fields=['-popularity', '-pub_date'],
+                name='recipe_popularity_idx'
+            ),
+            models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date'], name='recipe_author_idx'
+            ),
+        ]
 
     def __str__(self):
         """Строковое представление рецепта."""
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Сохраняет рецепт; каждое изменение увеличивает его версию."""
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        self.version = models.F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        # Новое значение посчитала база. Поле становится отложенным и
+        # перечитывается, только если к нему обратятся: лишнего SELECT на
+        # каждую запись нет.
+        del self.version
+
+
+class PopularityEpoch(models.Model):
+    """Точка отсчёта для затухающих оценок популярности рецептов."""
+
+    started_at = models.DateTimeField(
+        verbose_name='Начало эпохи'
+    )
+
+    class Meta:
+        """Мета-класс для эпохи популярности."""
+
+        verbose_name = 'Эпоха популярности'
+        verbose_name_plural = 'Эпохи популярности'
+
+    def __str__(self):
+        """Строковое представление эпохи."""
+        return f'Эпоха с {self.started_at:%Y-%m-%d %H:%M}'
+
 
 class RecipeIngredient(models.Model):
     """Модель для ингредиентов в рецептах."""
@@ -105,13 +159,15 @@ class RecipeIngredient(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='recipeingredients',
-        verbose_name='Рецепт'
+        verbose_name='Рецепт',
+        db_index=False
     )
     ingredient = models.ForeignKey(
         Ingredient,
         on_delete=models.CASCADE,
         related_name='recipeingredients',
-        verbose_name='Ингредиент'
+        verbose_name='Ингредиент',
+        db_index=False
     )
     amount = models.PositiveSmallIntegerField(
         verbose_name='Количество',
@@ -133,12 +189,20 @@ class RecipeIngredient(models.Model):
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
         ordering = ['recipe', 'ingredient']
+        # Ограничение уникальности служит индексом (recipe, ingredient),
+        # обратный индекс — для фильтров по ингредиентам.
         constraints = [
             models.UniqueConstraint(
                 fields=['recipe', 'ingredient'],
                 name='unique_recipe_ingredient'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='recipe_ingredient_idx'
+            )
+        ]
 
     def __str__(self):
         """Строковое представление ингредиента в рецепте."""
@@ -156,13 +220,19 @@ class Favorite(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='favorites',
-        verbose_name='Пользователь'
+        verbose_name='Пользователь',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         related_name='favorites',
-        verbose_name='Рецепт'
+        verbose_name='Рецепт',
+        db_index=False
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Добавлен'
     )
 
     class Meta:
@@ -171,12 +241,19 @@ class Favorite(models.Model):
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
         ordering = ['user', 'recipe']
+        # Ограничение уникальности служит индексом (user, recipe),
+        # обратный индекс — для подсчётов и выборок по рецепту.
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'],
                 name='unique_user_favorite_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='favorite_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         """Строковое представление избранного рецепта."""
@@ -190,13 +267,19 @@ class ShoppingCart(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='shopping_cart',
-        verbose_name='Пользователь'
+        verbose_name='Пользователь',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         related_name='shopping_carts',
-        verbose_name='Рецепт'
+        verbose_name='Рецепт',
+        db_index=False
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Добавлен'
     )
 
     class Meta:
@@ -205,13 +288,151 @@ class ShoppingCart(models.Model):
         verbose_name = 'Рецепт в списке покупок'
         verbose_name_plural = 'Рецепты в списке покупок'
         ordering = ['user', 'recipe']
+        # Ограничение уникальности служит индексом (user, recipe),
+        # обратный индекс — для подсчётов и выборок по рецепту.
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'],
                 name='unique_user_shopping_cart_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='shoppingcart_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         """Строковое представление списка покупок."""
         return f'{self.user.username} добавил в покупки "{self.recipe.name}"'
+
+
+class Change(models.Model):
+    """Запись журнала изменений для синхронизации клиентов.
+
+    Курсором служит sequence — номер в порядке фиксации транзакций (см.
+    recipes.changes.sequence_changes); пока номера нет, клиенту запись не
+    видна. Изменения рецептов и их ингредиентов видны
+    всем (user пуст), избранное, список покупок и подписки — только своему
+    пользователю. В data лежат id связанных объектов, чтобы клиент мог
+    применить и удаление.
+    """
+
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = (
+        (CREATE, 'Создание'),
+        (UPDATE, 'Изменение'),
+        (DELETE, 'Удаление'),
+    )
+
+    model = models.CharField(
+        max_length=32,
+        verbose_name='Модель'
+    )
+    action = models.CharField(
+        max_length=6,
+        choices=ACTIONS,
+        verbose_name='Действие'
+    )
+    object_id = models.PositiveBigIntegerField(
+        verbose_name='id объекта'
+    )
+    # Без ограничения внешнего ключа: записи об удалении создаются, пока
+    # удаляется и сам пользователь.
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Получатель'
+    )
+    data = models.JSONField(
+        default=dict,
+        verbose_name='Связанные объекты'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Время изменения'
+    )
+    sequence = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        unique=True,
+        verbose_name='Номер в журнале'
+    )
+
+    class Meta:
+        """Мета-класс для журнала изменений."""
+
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Журнал изменений'
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['model', 'object_id', 'sequence'],
+                name='change_object_idx'
+            )
+        ]
+
+    def __str__(self):
+        """Строковое представление изменения."""
+        return f'#{self.pk} {self.action} {self.model} {self.object_id}'
+
+
+class ChangeSequence(models.Model):
+    """Последний выданный номер журнала изменений; одна строка."""
+
+    last = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Последний номер'
+    )
+
+    class Meta:
+        """Мета-класс для счётчика журнала."""
+
+        verbose_name = 'Счётчик журнала изменений'
+        verbose_name_plural = 'Счётчики журнала изменений'
+
+    def __str__(self):
+        """Строковое представление счётчика."""
+        return f'Журнал до #{self.last}'
+
+
+class BootstrapStep(models.Model):
+    """Отпечаток выполненного шага запуска контейнера."""
+
+    name = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Шаг'
+    )
+    fingerprint = models.CharField(
+        max_length=64,
+        verbose_name='Отпечаток'
+    )
+    output_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name='Отпечаток результата'
+    )
+    applied_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Выполнен'
+    )
+
+    class Meta:
+        """Мета-класс для шагов запуска."""
+
+        verbose_name = 'Шаг запуска'
+        verbose_name_plural = 'Шаги запуска'
+        ordering = ['name']
+
+    def __str__(self):
+        """Строковое представление шага запуска."""
+        return f'{self.name}: {self.fingerprint[:12]}'
@@ -0,0 +1,101 @@
+"""Затухающие оценки популярности рецептов.
+
+Каждое событие (добавление в избранное или в список покупок) добавляет к
+оценке рецепта вес, умноженный на 2 ** (t / T), где t — время от начала
+текущей эпохи, а T — период полураспада. Все оценки растут с одинаковым
+множителем, поэтому порядок по сохранённому значению совпадает с порядком
+по затухающей оценке, и сортировка идёт по индексу. Команда
+renormalize_popularity периодически переносит начало эпохи и уменьшает
+сохранённые значения, чтобы они не переполнялись. Удаление из избранного
+или списка покупок снимает вклад события по времени его добавления.
+"""
+from django.db import connections, router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from foodgram_backend.constants import POPULARITY_HALF_LIFE_HOURS
+
+from .models import PopularityEpoch, Recipe
+
+HALF_LIFE_SECONDS = POPULARITY_HALF_LIFE_HOURS * 3600
+EPOCH_PK = 1
+# Базы, где есть разделяемая блокировка строки SELECT ... FOR SHARE.
+SHARE_LOCK_VENDORS = ('postgresql', 'mysql')
+
+
+def locked_epoch():
+    """Эпоха под исключительной блокировкой строки до конца транзакции.
+
+    Создаёт эпоху при первом обращении.
+    """
+    epoch, _ = PopularityEpoch.objects.select_for_update().get_or_create(
+        pk=EPOCH_PK, defaults={'started_at': timezone.now()}
+    )
+    return epoch
+
+
+def shared_epoch():
+    """Эпоха под разделяемой блокировкой строки до конца транзакции.
+
+    Разделяемые блокировки не мешают друг другу, поэтому приращения
+    популярности не выстраиваются в очередь за одной строкой; ждёт их
+    только renormalize. select_for_update такую блокировку не выражает,
+    поэтому запрос написан вручную. SQLite блокирует базу целиком, и там
+    эпоха читается без блокировки.
+    """
+    using = router.db_for_write(PopularityEpoch)
+    connection = connections[using]
+    if connection.vendor in SHARE_LOCK_VENDORS:
+        table = connection.ops.quote_name(PopularityEpoch._meta.db_table)
+        epoch = next(iter(PopularityEpoch.objects.raw(
+            f'SELECT id, started_at FROM {table} WHERE id = %s FOR SHARE',
+            [EPOCH_PK], using=using
+        )), None)
+    else:
+        epoch = PopularityEpoch.objects.using(using).filter(
+            pk=EPOCH_PK
+        ).first()
+    if epoch is None:
+        epoch, _ = PopularityEpoch.objects.using(using).get_or_create(
+            pk=EPOCH_PK, defaults={'started_at': timezone.now()}
+        )
+    return epoch
+
+
+def decay_factor(since, until):
+    """Множитель роста оценок за промежуток времени."""
+    return 2 ** ((until - since).total_seconds() / HALF_LIFE_SECONDS)
+
+
+def bump_popularity(recipe_id, weight, at):
+    """Добавляет к оценке рецепта вклад события в момент at.
+
+    Отрицательный вес снимает вклад события, случившегося в at: вклад
+    пересчитывается в масштаб текущей эпохи так же, как его пересчитал бы
+    renormalize, и оценка не уходит ниже нуля из-за округления. Эпоха
+    читается под разделяемой блокировкой: renormalize ждёт начатые
+    приращения, а приращения во время пересчёта ждут его окончания.
+    """
+    with transaction.atomic():
+        increment = weight * decay_factor(shared_epoch().started_at, at)
+        Recipe.objects.filter(pk=recipe_id).update(
+            popularity=Greatest(F('popularity') + increment, Value(0.0))
+        )
+
+
+def renormalize():
+    """Переносит начало эпохи на текущий момент и пересчитывает оценки.
+
+    Возвращает множитель, на который были умножены сохранённые оценки.
+    """
+    with transaction.atomic():
+        epoch = locked_epoch()
+        now = timezone.now()
+        factor = 1 / decay_factor(epoch.started_at, now)
+        Recipe.objects.exclude(popularity=0).update(
+            popularity=F('popularity') * factor
+        )
+        epoch.started_at = now
+        epoch.save(update_fields=['started_at'])
+    return factor
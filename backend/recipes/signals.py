@@ -0,0 +1,111 @@
+"""Сигналы приложения recipes."""
+from django.db import transaction
+from django.db.models import Model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram_backend.constants import (
+    POPULARITY_FAVORITE_WEIGHT, POPULARITY_SHOPPING_CART_WEIGHT
+)
+from foodgram_backend.response_cache import bump_generation
+from users.models import PROFILE_FIELDS, Subscription, User
+
+from .changes import TRACKED, record_changes
+from .ingredient_index import ingredient_index
+from .models import (
+    Change, Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart
+)
+from .popularity import bump_popularity
+
+PENDING_CHANGES = '_pending_changes'
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_index(sender, instance, **kwargs):
+    """Убирает удалённый рецепт из индекса ингредиентов."""
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: ingredient_index.remove_recipe(recipe_id))
+
+
+POPULARITY_WEIGHTS = {
+    Favorite: POPULARITY_FAVORITE_WEIGHT,
+    ShoppingCart: POPULARITY_SHOPPING_CART_WEIGHT,
+}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def bump_popularity_on_add(sender, instance, created, raw=False, **kwargs):
+    """Учитывает добавление рецепта в избранное или список покупок."""
+    if created and not raw:
+        bump_popularity(
+            instance.recipe_id, POPULARITY_WEIGHTS[sender],
+            instance.created_at
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def drop_popularity_on_remove(sender, instance, origin=None, **kwargs):
+    """Снимает вклад события, когда рецепт убирают из избранного.
+
+    При удалении самого рецепта пересчитывать нечего.
+    """
+    if isinstance(origin, Recipe):
+        return
+    bump_popularity(
+        instance.recipe_id, -POPULARITY_WEIGHTS[sender], instance.created_at
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=User)
+def expire_cached_responses(sender, **kwargs):
+    """Сбрасывает кэш анонимных ответов после коммита изменений."""
+    transaction.on_commit(bump_generation)
+
+
+@receiver(post_save, sender=User)
+def expire_cached_responses_on_profile(sender, update_fields=None, **kwargs):
+    """Сбрасывает кэш ответов при изменении профиля, но не last_login."""
+    if update_fields is None or set(update_fields) & PROFILE_FIELDS:
+        transaction.on_commit(bump_generation)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+def record_saved(sender, instance, created, raw=False, **kwargs):
+    """Записывает создание или изменение объекта в журнал изменений."""
+    if not raw:
+        record_changes(
+            [instance], Change.CREATE if created else Change.UPDATE
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=User)
+def record_deleted(sender, instance, origin=None, **kwargs):
+    """Записывает удаление объекта в журнал изменений.
+
+    Каскадные удаления копятся на исходном объекте и записываются одним
+    запросом вместе с ним: Django удаляет исходный объект последним.
+    """
+    if isinstance(origin, Model) and origin is not instance:
+        origin.__dict__.setdefault(PENDING_CHANGES, []).append(instance)
+        return
+    deleted = instance.__dict__.pop(PENDING_CHANGES, [])
+    if sender in TRACKED:
+        deleted.append(instance)
+    if deleted:
+        record_changes(deleted, Change.DELETE)
@@ -0,0 +1,287 @@
+"""Тесты логики рецептов вне API."""
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from foodgram_backend.constants import (
+    POPULARITY_FAVORITE_WEIGHT, POPULARITY_SHOPPING_CART_WEIGHT
+)
+from users.models import User
+
+from .ingredient_index import IngredientIndex
+from .models import (
+    Favorite, Ingredient, PopularityEpoch, Recipe, RecipeIngredient,
+    ShoppingCart
+)
+from .popularity import (
+    EPOCH_PK, HALF_LIFE_SECONDS, bump_popularity, renormalize
+)
+
+
+class PopularityTests(TestCase):
+    """Затухающие оценки популярности."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Автор, читатель и два рецепта."""
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A', password='pass12345'
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='R', last_name='R', password='pass12345'
+        )
+        cls.old, cls.new = (
+            Recipe.objects.create(
+                author=cls.author, name=name, text='t',
+                image='recipes/images/x.png', cooking_time=1
+            )
+            for name in ('Старый', 'Новый')
+        )
+
+    def setUp(self):
+        """Эпоха начинается в момент начала теста."""
+        self.started_at = timezone.now()
+        PopularityEpoch.objects.update_or_create(
+            pk=EPOCH_PK, defaults={'started_at': self.started_at}
+        )
+
+    def popularity(self, recipe):
+        """Сохранённая оценка рецепта."""
+        return Recipe.objects.get(pk=recipe.pk).popularity
+
+    def test_later_events_weigh_more(self):
+        """Событие через период полураспада весит вдвое больше."""
+        bump_popularity(self.old.pk, 1.0, self.started_at)
+        bump_popularity(
+            self.new.pk, 1.0,
+            self.started_at + timedelta(seconds=HALF_LIFE_SECONDS)
+        )
+        self.assertAlmostEqual(self.popularity(self.old), 1.0)
+        self.assertAlmostEqual(self.popularity(self.new), 2.0)
+
+    def test_removal_takes_the_event_back(self):
+        """Удаление из избранного и списка покупок снимает их вклад."""
+        favorite = Favorite.objects.create(user=self.reader, recipe=self.old)
+        ShoppingCart.objects.create(user=self.reader, recipe=self.old)
+        self.assertAlmostEqual(
+            self.popularity(self.old),
+            POPULARITY_FAVORITE_WEIGHT + POPULARITY_SHOPPING_CART_WEIGHT,
+            places=3
+        )
+        favorite.delete()
+        self.assertAlmostEqual(
+            self.popularity(self.old), POPULARITY_SHOPPING_CART_WEIGHT,
+            places=3
+        )
+        ShoppingCart.objects.filter(user=self.reader).delete()
+        self.assertAlmostEqual(self.popularity(self.old), 0.0, places=6)
+
+    def test_renormalize_keeps_order_and_removal(self):
+        """Пересчёт уменьшает оценки, не меняя порядка и вклада событий."""
+        PopularityEpoch.objects.filter(pk=EPOCH_PK).update(
+            started_at=self.started_at - timedelta(
+                seconds=3 * HALF_LIFE_SECONDS
+            )
+        )
+        Favorite.objects.create(
+            user=self.reader, recipe=self.old, created_at=self.started_at
+        )
+        Favorite.objects.create(
+            user=self.reader, recipe=self.new,
+            created_at=self.started_at + timedelta(seconds=HALF_LIFE_SECONDS)
+        )
+        before = (self.popularity(self.old), self.popularity(self.new))
+        factor = renormalize()
+        self.assertLess(factor, 1)
+        after = (self.popularity(self.old), self.popularity(self.new))
+        self.assertAlmostEqual(after[0], before[0] * factor)
+        self.assertAlmostEqual(after[1], before[1] * factor)
+        self.assertLess(after[0], after[1])
+        Favorite.objects.filter(recipe=self.new).delete()
+        self.assertAlmostEqual(self.popularity(self.new), 0.0, places=6)
+
+    def test_deleting_recipe_skips_recount(self):
+        """Каскад из удалённого рецепта не пересчитывает оценки."""
+        Favorite.objects.create(user=self.reader, recipe=self.old)
+        with CaptureQueriesContext(connection) as queries:
+            self.old.delete()
+        self.assertFalse(any(
+            'popularity' in query['sql'] for query in queries
+        ))
+
+
+class IngredientIndexTests(TestCase):
+    """Индекс ингредиентов для подбора рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Рецепты с одним, двумя и тремя ингредиентами."""
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A', password='pass12345'
+        )
+        cls.salt, cls.flour, cls.apple = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'мука', 'яблоко')
+        )
+        cls.bread, cls.pie, cls.compote = (
+            Recipe.objects.create(
+                author=author, name=name, text='t',
+                image='recipes/images/x.png', cooking_time=1
+            )
+            for name in ('Хлеб', 'Пирог', 'Компот')
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe, ingredients in (
+                (cls.bread, (cls.salt, cls.flour)),
+                (cls.pie, (cls.salt, cls.flour, cls.apple)),
+                (cls.compote, (cls.apple,)),
+            )
+            for ingredient in ingredients
+        )
+
+    def setUp(self):
+        """Поколение индекса начинается заново в каждом тесте."""
+        cache.clear()
+
+    def test_rank_by_coverage(self):
+        """Сначала полностью покрытые рецепты, с числом недостающих."""
+        index = IngredientIndex(background=False)
+        self.assertEqual(index.rank([self.salt.pk, self.flour.pk]), [
+            (self.bread.pk, 2, 0), (self.pie.pk, 2, 1),
+        ])
+        self.assertEqual(index.rank([self.apple.pk]), [
+            (self.compote.pk, 1, 0), (self.pie.pk, 1, 2),
+        ])
+        self.assertEqual(index.rank([0]), [])
+
+    def test_own_change_needs_no_rebuild(self):
+        """Своё изменение применяется сразу, без чтения базы."""
+        index = IngredientIndex(background=False)
+        index.rank([self.apple.pk])
+        index.set_recipe(self.bread.pk, [self.apple.pk])
+        with self.assertNumQueries(0):
+            ranked = index.rank([self.apple.pk])
+        self.assertIn((self.bread.pk, 1, 0), ranked)
+        index.remove_recipe(self.compote.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [item[0] for item in index.rank([self.apple.pk])],
+                [self.bread.pk, self.pie.pk]
+            )
+
+    def test_other_process_change_is_picked_up(self):
+        """Изменение в другом процессе перестраивает индекс."""
+        writer = IngredientIndex(background=False)
+        reader = IngredientIndex(background=False)
+        writer.rank([self.apple.pk])
+        reader.rank([self.apple.pk])
+        RecipeIngredient.objects.create(
+            recipe=self.bread, ingredient=self.apple, amount=1
+        )
+        writer.set_recipe(
+            self.bread.pk, [self.salt.pk, self.flour.pk, self.apple.pk]
+        )
+        self.assertIn((self.bread.pk, 1, 2), reader.rank([self.apple.pk]))
+
+    def test_rebuild_runs_in_background(self):
+        """Устаревший индекс отвечает по-старому, пока строится новый."""
+        index = IngredientIndex()
+        index.rank([self.apple.pk])
+        IngredientIndex(background=False).remove_recipe(self.compote.pk)
+        with mock.patch(
+            'recipes.ingredient_index.threading.Thread'
+        ) as thread:
+            for _ in range(2):
+                self.assertIn(
+                    (self.compote.pk, 1, 0), index.rank([self.apple.pk])
+                )
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once_with()
+
+
+class ImportExportTests(TestCase):
+    """Выгрузка рецептов в NDJSON и загрузка обратно."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Рецепт со старой датой публикации и двумя ингредиентами."""
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Анна', last_name='Автор', password='pass12345'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Пирог', text='Испечь',
+            image='recipes/images/пирог.png', cooking_time=40,
+            pub_date=timezone.now() - timedelta(days=400)
+        )
+        for name, amount in (('мука', 200), ('соль', 1)):
+            RecipeIngredient.objects.create(
+                recipe=cls.recipe, amount=amount,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit='г'
+                )
+            )
+
+    def export(self):
+        """Строки NDJSON из export_recipes."""
+        output = StringIO()
+        call_command('export_recipes', stdout=output, stderr=StringIO())
+        return output.getvalue().splitlines()
+
+    def load(self, lines):
+        """Загружает строки через import_recipes; возвращает stderr."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'recipes.ndjson')
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write('\n'.join(lines) + '\n')
+        errors = StringIO()
+        call_command('import_recipes', path, stderr=errors)
+        return errors.getvalue()
+
+    def test_round_trip(self):
+        """Загруженная выгрузка совпадает с исходными рецептами."""
+        lines = self.export()
+        Recipe.objects.all().delete()
+        User.objects.all().delete()
+        self.load(lines)
+        self.assertEqual(
+            [json.loads(line) | {'id': None} for line in self.export()],
+            [json.loads(line) | {'id': None} for line in lines]
+        )
+        self.assertEqual(
+            Recipe.objects.get().pub_date, self.recipe.pub_date
+        )
+
+    def test_invalid_records_are_skipped(self):
+        """Слишком длинные строки пропускаются с сообщением."""
+        record = json.loads(self.export()[0])
+        long_name = dict(record, name='П' * 201)
+        long_unit = dict(record, ingredients=[
+            {'name': 'соль', 'measurement_unit': 'г' * 201, 'amount': 1}
+        ])
+        long_email = dict(record, author=dict(
+            record['author'], email=f'{"a" * 250}@example.com'
+        ))
+        errors = self.load([
+            json.dumps(item, ensure_ascii=False)
+            for item in (long_name, long_unit, long_email, record)
+        ])
+        for number in (1, 2, 3):
+            self.assertIn(f'Строка {number} пропущена', errors)
+        self.assertIn('пропущено 3', errors)
+        self.assertEqual(Recipe.objects.count(), 2)
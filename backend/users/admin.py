@@ -12,5 +12,15 @@ class UserAdmin(BaseUserAdmin):
     list_filter = ('is_staff', 'is_superuser', 'is_active')
 
 
+class SubscriptionAdmin(admin.ModelAdmin):
+    """Админка для подписок."""
+
+    list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
+
+
 admin.site.register(User, UserAdmin)
-admin.site.register(Subscription)
+admin.site.register(Subscription, SubscriptionAdmin)
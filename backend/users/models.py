@@ -2,6 +2,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+PROFILE_FIELDS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+
 
 class User(AbstractUser):
     """Модель пользователя."""
@@ -27,6 +29,11 @@ class User(AbstractUser):
         null=True,
         verbose_name='Аватар'
     )
+    version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        verbose_name='Версия'
+    )
 
     class Meta:
         """Мета-класс для пользователя."""
@@ -39,6 +46,23 @@ class User(AbstractUser):
         """Строковое представление пользователя."""
         return self.username
 
+    def save(self, *args, **kwargs):
+        """Сохраняет пользователя; изменение профиля увеличивает версию."""
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or (
+            update_fields is not None
+            and not set(update_fields) & PROFILE_FIELDS
+        ):
+            return super().save(*args, **kwargs)
+        self.version = models.F('version') + 1
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+        # Новое значение посчитала база. Поле становится отложенным и
+        # перечитывается, только если к нему обратятся: лишнего SELECT на
+        # каждую запись нет.
+        del self.version
+
 
 class Subscription(models.Model):
     """Модель подписки."""